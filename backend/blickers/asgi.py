@@ -9,19 +9,21 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import blickers_app.routing  # Remplacez 'app' par le nom de votre application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blickers.settings')
 
-application = get_asgi_application()
+# Initialize Django before importing consumers, which import the models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.auth import AuthMiddlewareStack
+import blickers_app.routing  # Remplacez 'app' par le nom de votre application
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             blickers_app.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -44,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blickers_app.db_routers.ReplicaRoutingMiddleware',
 ]
 
 
@@ -125,18 +128,171 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'blickers.asgi.application'
 
+# Channel layer
+# Set CHANNEL_LAYER_REDIS_URL (e.g. redis://localhost:6379/0) so that chat and
+# notification groups are shared by every ASGI worker. Without it an in-memory
+# layer is used, which only fans out within a single process.
+CHANNEL_LAYER_REDIS_URL = os.environ.get('CHANNEL_LAYER_REDIS_URL')
+
+if CHANNEL_LAYER_REDIS_URL:
+    if os.environ.get('CHANNEL_LAYER_PUBSUB', '').lower() in ('1', 'true', 'yes'):
+        # Redis Pub/Sub: lower latency, but messages are dropped for disconnected consumers
+        CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+                'CONFIG': {
+                    'hosts': [CHANNEL_LAYER_REDIS_URL],
+                },
+            },
+        }
+    else:
+        CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {
+                    'hosts': [CHANNEL_LAYER_REDIS_URL],
+                    'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1500)),
+                    'expiry': int(os.environ.get('CHANNEL_LAYER_EXPIRY', 10)),
+                },
+            },
+        }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1500)),
+            },
+        },
+    }
+
 WSGI_APPLICATION = 'blickers.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql switches to PostgreSQL, configured by the POSTGRES_* variables;
+# otherwise the local SQLite file is used. docker-compose.test.yml starts a server matching
+# the defaults below, for running the tests on PostgreSQL as the CI does.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    # A psycopg pool per worker process hands connections to requests and consumers
+    # (connections are thread-bound, so under ASGI persistent connections would pile up
+    # per thread). DB_POOL=0 falls back to persistent connections (DB_CONN_MAX_AGE seconds).
+    DB_POOL = os.environ.get('DB_POOL', '1').lower() in ('1', 'true', 'yes')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'blickers'),
+            'USER': os.environ.get('POSTGRES_USER', 'blickers'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Django refuses persistent connections on top of a pool
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            # Check a reused connection before handing it out, so a server restart costs a reconnect, not a 500
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    # Seconds a request waits for a free connection
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            # sqlite3 with WAL and tuning pragmas on every connection (see blickers_app/sqlite_backend)
+            'ENGINE': 'blickers_app.sqlite_backend',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock at BEGIN: a transaction that reads then writes would
+                # otherwise fail at once with "database is locked" instead of waiting
+                'transaction_mode': 'IMMEDIATE',
+                # Set SQLITE_WRITE_QUEUE=1 to also serialize the writers of each process in Python
+                'write_queue': os.environ.get('SQLITE_WRITE_QUEUE', '').lower() in ('1', 'true', 'yes'),
+            },
+        }
+    }
+
+# Chat database
+# Rooms, messages, read receipts and room unread counts (see ChatRouter in
+# blickers_app/db_routers.py) stay in the primary database unless CHAT_DB_PATH
+# names a SQLite file of their own, so that chat write bursts never wait for,
+# nor delay, the writer of db.sqlite3. PostgreSQL locks rows, not the database,
+# so the chat always stays in the primary there.
+#
+# UPGRADING an existing install to a separate chat database, with the server stopped:
+#   1. set CHAT_DB_PATH for every process (web, ASGI, management commands);
+#   2. python manage.py migrate                    (the primary)
+#   3. python manage.py migrate --database=chat    (creates the chat tables and copies
+#      the rooms, participants, messages and read receipts of the primary into them)
+# The primary keeps its copy of the chat tables as they were at step 3; unset
+# CHAT_DB_PATH to go back to it (messages sent in between stay in the chat file).
+CHAT_DB_PATH = os.environ.get('CHAT_DB_PATH')
+
+if CHAT_DB_PATH and DATABASES['default']['ENGINE'] != 'django.db.backends.postgresql':
+    CHAT_DATABASE = 'chat'
+    DATABASES['chat'] = {**DATABASES['default'], 'NAME': CHAT_DB_PATH}
+else:
+    CHAT_DATABASE = 'default'
+
+# Read replicas
+# DB_REPLICAS lists replica hosts (PostgreSQL) or database files (SQLite, e.g. a copy
+# of db.sqlite3 to try the routing locally), comma-separated. GET requests to views
+# with use_read_replica = True read from them; see blickers_app/db_routers.py. Needs
+# CACHE_REDIS_URL: the primary pins of the clients that wrote are kept in the cache.
+READ_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    READ_REPLICAS.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST' if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' else 'NAME': replica.strip(),
+        # Tests read the test database through the replica aliases
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['blickers_app.db_routers.ChatRouter', 'blickers_app.db_routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after one of its requests wrote
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+# A replica further behind than this, or unreachable, is skipped for REPLICA_RETRY_SECONDS
+REPLICA_MAX_LAG_SECONDS = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+REPLICA_RETRY_SECONDS = 30
+
+
+# Cache
+# Set CACHE_REDIS_URL to share cached data (e.g. chat room membership) between
+# workers; otherwise each process keeps its own local-memory cache.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+if READ_REPLICAS and not CACHE_REDIS_URL:
+    # A client pinned to the primary after a write must stay pinned whichever worker it reaches next
+    raise ImproperlyConfigured('DB_REPLICAS needs a cache shared by every worker: set CACHE_REDIS_URL')
+
+# Seconds a chat room membership check stays cached. A membership change only clears
+# the entries of the cache it can reach: with the per-process cache, other workers may
+# keep answering from theirs until the entry expires, so it stays short there.
+CHAT_MEMBERSHIP_CACHE_TIMEOUT = 300 if CACHE_REDIS_URL else 5
 
 
 # Password validation
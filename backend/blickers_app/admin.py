@@ -190,11 +190,13 @@ class ForumReplyAdmin(admin.ModelAdmin):
 class ChatRoomAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'is_group_chat', 'created_at', 'participants_list', 'messages_count')
     list_filter = ('is_group_chat', 'created_at')
-    search_fields = ('name', 'participants__username')
-    filter_horizontal = ('participants',)
+    # Rooms live in the chat database: no lookups through the users
+    search_fields = ('name',)
+    readonly_fields = ('participants_list',)
     
     def participants_list(self, obj):
-        return ", ".join([user.username for user in obj.participants.all()[:3]]) + ("..." if obj.participants.count() > 3 else "")
+        usernames = [user.username for user in obj.get_participants()]
+        return ", ".join(usernames[:3]) + ("..." if len(usernames) > 3 else "")
     participants_list.short_description = "Participants"
     
     def messages_count(self, obj):
@@ -206,8 +208,10 @@ class ChatRoomAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('truncated_content', 'sender', 'room_info', 'timestamp', 'is_read')
     list_filter = ('is_read', 'timestamp')
-    search_fields = ('content', 'sender__username')
+    search_fields = ('content',)
     date_hierarchy = 'timestamp'
+    # Not sender: users are in the primary database, fetched one by one
+    list_select_related = ('room',)
     
     def truncated_content(self, obj):
         return (obj.content[:50] + '...') if len(obj.content) > 50 else obj.content
@@ -217,8 +221,8 @@ class MessageAdmin(admin.ModelAdmin):
         if obj.room.name:
             return obj.room.name
         else:
-            participants = ", ".join([user.username for user in obj.room.participants.all()[:3]])
-            return f"Chat: {participants}{'...' if obj.room.participants.count() > 3 else ''}"
+            usernames = [user.username for user in obj.room.get_participants()]
+            return f"Chat: {', '.join(usernames[:3])}{'...' if len(usernames) > 3 else ''}"
     room_info.short_description = "Conversation"
 
 
@@ -300,7 +304,7 @@ class NotificationAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     
     def mark_as_read(self, request, queryset):
-        queryset.update(is_read=True)
+        mark_notifications_read(queryset)
     mark_as_read.short_description = "Marquer comme lues"
 
 
@@ -1,16 +1,56 @@
+import base64
+import binascii
+import json
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db.models import Q
 from django.core.paginator import Paginator
-from .models import Post, PostComment, Reaction
+from .images import PICTURE_PRESETS, derivative_url, derivative_urls, generate_derivatives
+from .models import Post, PostComment, Reaction, User
+from .notifications import notify_users
+from .search import render_highlight, search_announcements
+
+
+def encode_announcement_cursor(announcement):
+    """Build an opaque cursor from the (is_pinned, created_at, id) key of an announcement"""
+    key = [announcement.is_pinned, announcement.created_at.isoformat(), announcement.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_announcement_cursor(cursor):
+    """Decode a cursor built by encode_announcement_cursor, raising ValueError if it is invalid"""
+    try:
+        is_pinned, created_at, announcement_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+    if not isinstance(is_pinned, bool) or created_at is None or not isinstance(announcement_id, int):
+        raise ValueError('Invalid cursor')
+    return is_pinned, created_at, announcement_id
+
+
+def filter_after_announcement_cursor(announcements, cursor, ascending=False):
+    """Keep the announcements that come after the cursor in (-is_pinned, created_at, id) order"""
+    is_pinned, created_at, announcement_id = cursor
+    if ascending:
+        after = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=announcement_id)
+    else:
+        after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=announcement_id)
+    condition = Q(is_pinned=is_pinned) & after
+    if is_pinned:
+        # Pinned announcements always come first, so every unpinned one is after a pinned cursor
+        condition |= Q(is_pinned=False)
+    return announcements.filter(condition)
 
 
 class AnnouncementListView(APIView):
     """API endpoint to retrieve announcements with filtering and pagination"""
     permission_classes = [IsAuthenticated]
+    use_read_replica = True
 
     def get(self, request):
         try:
@@ -19,7 +59,10 @@ class AnnouncementListView(APIView):
             per_page = int(request.query_params.get('per_page', 6))
             search = request.query_params.get('search', '')
             type_filter = request.query_params.get('type', 'all')
-            sort_by = request.query_params.get('sort', 'newest')
+            cursor = request.query_params.get('cursor')
+            use_cursor = cursor is not None or request.query_params.get('pagination') == 'cursor'
+            # Searches are ranked by relevance unless another sort is asked for
+            sort_by = request.query_params.get('sort', 'relevance' if search and not use_cursor else 'newest')
             
             print(f"AnnouncementListView: Received parameters:")
             print(f"  page: {page}")
@@ -27,26 +70,18 @@ class AnnouncementListView(APIView):
             print(f"  search: {search}")
             print(f"  type_filter: {type_filter}")
             print(f"  sort_by: {sort_by}")
+            print(f"  cursor: {cursor}")
             
             # Base queryset
-            announcements = Post.objects.filter(is_announcement=True)
-            print(f"AnnouncementListView: Base queryset count: {announcements.count()}")
+            announcements = Post.objects.filter(is_announcement=True).select_related('created_by')
             
-            # Apply search filter
+            # Apply search filter through the full-text index
             if search:
-                announcements = announcements.filter(
-                    Q(title__icontains=search) |
-                    Q(content__icontains=search) |
-                    Q(created_by__username__icontains=search) |
-                    Q(created_by__first_name__icontains=search) |
-                    Q(created_by__last_name__icontains=search)
-                )
-                print(f"AnnouncementListView: After search filter count: {announcements.count()}")
+                announcements = search_announcements(announcements, search)
             
             # Apply type filter
             if type_filter != 'all':
                 announcements = announcements.filter(announcement_type=type_filter)
-                print(f"AnnouncementListView: After type filter count: {announcements.count()}")
             
             # Apply sorting
             if sort_by == 'newest':
@@ -57,25 +92,54 @@ class AnnouncementListView(APIView):
                 announcements = announcements.order_by('-is_pinned', '-views_count')
             elif sort_by == 'views':
                 announcements = announcements.order_by('-is_pinned', '-views_count')
+            elif sort_by == 'relevance' and search:
+                announcements = announcements.order_by('-search_score', '-created_at')
             else:
                 announcements = announcements.order_by('-is_pinned', '-created_at')
             
-            # Calculate pagination
-            total_count = announcements.count()
-            total_pages = (total_count + per_page - 1) // per_page
-            has_next = page < total_pages
-            has_previous = page > 1
-            
-            print(f"AnnouncementListView: Pagination info:")
-            print(f"  total_count: {total_count}")
-            print(f"  total_pages: {total_pages}")
-            print(f"  has_next: {has_next}")
-            print(f"  has_previous: {has_previous}")
-            
-            # Get paginated announcements
-            start_index = (page - 1) * per_page
-            end_index = start_index + per_page
-            paginated_announcements = announcements[start_index:end_index]
+            if use_cursor:
+                # Keyset pagination on (is_pinned, created_at, id): no COUNT and no OFFSET
+                if sort_by not in ('newest', 'oldest'):
+                    return Response(
+                        {'error': 'Cursor pagination only supports the newest and oldest sorts'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                ascending = sort_by == 'oldest'
+                announcements = announcements.order_by(
+                    '-is_pinned',
+                    'created_at' if ascending else '-created_at',
+                    'id' if ascending else '-id'
+                )
+                if cursor:
+                    try:
+                        announcements = filter_after_announcement_cursor(
+                            announcements, decode_announcement_cursor(cursor), ascending
+                        )
+                    except ValueError:
+                        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                # Fetch one extra row to know whether there is a next page
+                paginated_announcements = list(announcements[:per_page + 1])
+                has_next = len(paginated_announcements) > per_page
+                paginated_announcements = paginated_announcements[:per_page]
+                has_previous = bool(cursor)
+            else:
+                # Calculate pagination
+                total_count = announcements.count()
+                total_pages = (total_count + per_page - 1) // per_page
+                has_next = page < total_pages
+                has_previous = page > 1
+                
+                print(f"AnnouncementListView: Pagination info:")
+                print(f"  total_count: {total_count}")
+                print(f"  total_pages: {total_pages}")
+                print(f"  has_next: {has_next}")
+                print(f"  has_previous: {has_previous}")
+                
+                # Get paginated announcements
+                start_index = (page - 1) * per_page
+                end_index = start_index + per_page
+                paginated_announcements = announcements[start_index:end_index]
             
             print(f"AnnouncementListView: Paginated announcements count: {len(paginated_announcements)}")
             
@@ -103,7 +167,8 @@ class AnnouncementListView(APIView):
                     'title': announcement.title,
                     'content': announcement.content,
                     'author': author_name,
-                    'author_avatar': announcement.created_by.profile_picture.url if announcement.created_by.profile_picture else None,
+                    # Resized copies: the list shows small avatars and image cards
+                    'author_avatar': derivative_url(announcement.created_by.profile_picture, 'avatar64'),
                     'created_at': announcement.created_at.isoformat(),
                     'updated_at': announcement.updated_at.isoformat(),
                     'comments_count': announcement.comments_count,
@@ -115,14 +180,27 @@ class AnnouncementListView(APIView):
                     'engagement_rate': announcement.engagement_rate,
                     'has_image': bool(announcement.image),
                     'has_file': bool(announcement.file),
-                    'image': announcement.image.url if announcement.image else None,
+                    'image': derivative_url(announcement.image, 'card'),
+                    'image_variants': derivative_urls(announcement.image, PICTURE_PRESETS),
                     'file': announcement.file.url if announcement.file else None,
                     'scheduled_at': announcement.scheduled_at.isoformat() if announcement.scheduled_at else None
                 }
+                if search:
+                    formatted_announcement['title_highlight'] = render_highlight(announcement.search_title) if announcement.search_title is not None else None
+                    formatted_announcement['snippet'] = render_highlight(announcement.search_snippet) if announcement.search_snippet is not None else None
+                    formatted_announcement['search_score'] = announcement.search_score
                 formatted_announcements.append(formatted_announcement)
             
             print(f"AnnouncementListView: Formatted {len(formatted_announcements)} announcements")
             
+            if use_cursor:
+                return Response({
+                    'results': formatted_announcements,
+                    'next': encode_announcement_cursor(paginated_announcements[-1]) if has_next else None,
+                    'has_next': has_next,
+                    'has_previous': has_previous,
+                })
+            
             return Response({
                 'results': formatted_announcements,
                 'count': total_count,
@@ -214,6 +292,17 @@ class AnnouncementCreateView(APIView):
                 file=file
             )
             print(f"Announcement created successfully: {announcement.id}")
+            generate_derivatives(announcement.image, PICTURE_PRESETS)
+            
+            # Notify every active user in the background (scheduled announcements are not live yet)
+            if not scheduled_at:
+                notify_users(
+                    User.objects.filter(is_active=True).exclude(id=request.user.id).values_list('id', flat=True),
+                    title=f"New announcement: {announcement.title}",
+                    message=announcement.content[:200],
+                    notification_type='announcement',
+                    related_object=announcement
+                )
             
             # Format response
             formatted_announcement = {
@@ -353,6 +442,8 @@ class AnnouncementDetailView(APIView):
                 announcement.file = request.FILES['file']
             
             announcement.save()
+            if 'image' in request.FILES:
+                generate_derivatives(announcement.image, PICTURE_PRESETS)
             
             # Format response
             formatted_announcement = {
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BlickersAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blickers_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
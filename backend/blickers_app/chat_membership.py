@@ -0,0 +1,55 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .db_routers import chat_database
+from .models import ChatRoom
+
+
+def _cache_key(room_id, user_id):
+    return f'chat_member:{room_id}:{user_id}'
+
+
+def _normalize_room_id(room_id):
+    try:
+        return str(uuid.UUID(str(room_id)))
+    except ValueError:
+        return None
+
+
+def is_room_member(room_id, user_id):
+    """Return whether the user participates in the chat room, using the cache when possible
+
+    Entries are invalidated by the ChatRoom.participants m2m_changed receivers in
+    signals.py, in the cache this process uses. A per-process cache (the default)
+    cannot be reached from other workers, which may answer from theirs for up to
+    ``CHAT_MEMBERSHIP_CACHE_TIMEOUT`` seconds after a change; see settings.py.
+    """
+    room_id = _normalize_room_id(room_id)
+    if room_id is None or user_id is None:
+        return False
+
+    key = _cache_key(room_id, user_id)
+    is_member = cache.get(key)
+    if is_member is None:
+        is_member = ChatRoom.participants.through.objects.filter(chatroom_id=room_id, user_id=user_id).exists()
+        timeout = getattr(settings, 'CHAT_MEMBERSHIP_CACHE_TIMEOUT', 5)
+        if timeout:
+            cache.set(key, is_member, timeout)
+    return is_member
+
+
+def invalidate_room_membership(room_ids, user_ids):
+    """Forget the cached membership of every (room, user) pair, now and once the change is committed"""
+    keys = [
+        _cache_key(room_id, user_id)
+        for room_id in filter(None, map(_normalize_room_id, room_ids))
+        for user_id in user_ids
+    ]
+    if keys:
+        # Now for the rest of this transaction, and again after the commit: another
+        # request may have cached the old answer while the change was not visible yet
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys), using=chat_database())
@@ -0,0 +1,139 @@
+import asyncio
+import weakref
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .db_routers import chat_database
+from .models import ChatRoom, DashboardSnapshot, Message
+from .unread import record_new_messages
+
+
+class MessageBatcher:
+    """Coalesce chat messages sent within a few milliseconds into one write.
+
+    Every message queued during ``CHAT_MESSAGE_BATCH_DELAY`` seconds (or until
+    ``CHAT_MESSAGE_BATCH_SIZE`` messages are waiting) is stored with a single
+    ``bulk_create`` and a single ``UPDATE ... SET updated_at`` for the rooms
+    involved. Each caller still gets back the id and timestamp of its own
+    message.
+
+    Nothing is written to the primary database while messages are stored: the
+    dashboard message counts of the batches are added up and written there at
+    most once every ``CHAT_DASHBOARD_FLUSH_DELAY`` seconds.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._flush_handle = None
+        self._dashboard_days = Counter()
+        self._dashboard_handle = None
+
+    @property
+    def delay(self):
+        return getattr(settings, 'CHAT_MESSAGE_BATCH_DELAY', 0.005)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'CHAT_MESSAGE_BATCH_SIZE', 100)
+
+    @property
+    def dashboard_delay(self):
+        return getattr(settings, 'CHAT_DASHBOARD_FLUSH_DELAY', 5)
+
+    async def save(self, room_id, sender_id, content):
+        """Queue a message and wait until it is stored; returns the saved Message or None"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((Message(room_id=room_id, sender_id=sender_id, content=content, is_read=False), future))
+
+        if len(self._pending) >= self.max_size:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self.delay)
+        return await future
+
+    def _schedule_flush(self, delay):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            saved, batched = await database_sync_to_async(self._write)([message for message, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if batched:
+            # bulk_create skips post_save, so the dashboard is kept in step here
+            self._dashboard_days.update(timezone.localdate(message.timestamp) for message in saved)
+            if self._dashboard_handle is None:
+                loop = asyncio.get_running_loop()
+                self._dashboard_handle = loop.call_later(self.dashboard_delay, lambda: asyncio.ensure_future(self.flush_dashboard()))
+        for (_, future), message in zip(batch, saved):
+            if not future.done():
+                future.set_result(message)
+
+    async def flush_dashboard(self):
+        """Write the message counts gathered since the last call to DashboardSnapshot"""
+        if self._dashboard_handle is not None:
+            self._dashboard_handle.cancel()
+            self._dashboard_handle = None
+        days, self._dashboard_days = self._dashboard_days, Counter()
+        if days:
+            await database_sync_to_async(self._write_dashboard)(days)
+
+    @staticmethod
+    def _write(messages):
+        """Store the batch in the chat database; returns the saved messages and whether bulk_create stored them"""
+        try:
+            # Only the chat database is locked while the batch is stored
+            with transaction.atomic(using=chat_database()):
+                Message.objects.bulk_create(messages)
+                record_new_messages(messages)
+        except Exception:
+            # A bad row (e.g. a room deleted meanwhile) must not drop the rest of the batch
+            saved = []
+            for message in messages:
+                message.pk = None
+                try:
+                    with transaction.atomic(using=chat_database()):
+                        message.save()
+                    saved.append(message)
+                except Exception:
+                    saved.append(None)
+            batched = False
+        else:
+            saved, batched = messages, True
+
+        room_ids = {message.room_id for message in saved if message is not None}
+        if room_ids:
+            ChatRoom.objects.filter(id__in=room_ids).update(updated_at=timezone.now())
+        return saved, batched
+
+    @staticmethod
+    def _write_dashboard(days):
+        with transaction.atomic():
+            for day, count in days.items():
+                DashboardSnapshot.increment('messages', day, count)
+
+
+_batchers = weakref.WeakKeyDictionary()
+
+
+def get_message_batcher():
+    """Return the MessageBatcher bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = MessageBatcher()
+    return batcher
@@ -0,0 +1,156 @@
+import base64
+import binascii
+import json
+import uuid
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from django.db.models import DateTimeField, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+from .chat_membership import is_room_member
+from .models import ChatParticipant, ChatRoom, ChatRoomUnread, Message, User
+from .serializers import ChatRoomSerializer, MessageSerializer
+
+
+def encode_inbox_cursor(room):
+    """Build an opaque cursor from the (last_activity, id) key of an inbox room"""
+    key = [room.last_activity.isoformat(), str(room.id)]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_inbox_cursor(cursor):
+    """Decode a cursor built by encode_inbox_cursor, raising ValueError if it is invalid"""
+    try:
+        last_activity, room_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        room_id = uuid.UUID(room_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError, AttributeError):
+        raise ValueError('Invalid cursor')
+    last_activity = parse_datetime(last_activity) if isinstance(last_activity, str) else None
+    if last_activity is None:
+        raise ValueError('Invalid cursor')
+    return last_activity, room_id
+
+
+def encode_message_cursor(message):
+    """Build an opaque cursor from the (timestamp, id) key of a message"""
+    key = [message.timestamp.isoformat(), message.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_message_cursor(cursor):
+    """Decode a cursor built by encode_message_cursor, raising ValueError if it is invalid"""
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if timestamp is None or not isinstance(message_id, int):
+        raise ValueError('Invalid cursor')
+    return timestamp, message_id
+
+
+def inbox_queryset(user):
+    """The rooms of ``user`` annotated with their last message id, last activity and unread count"""
+    latest = Message.objects.filter(room_id=OuterRef('pk')).order_by('-timestamp', '-id')
+    unread = ChatRoomUnread.objects.filter(room_id=OuterRef('pk'), user_id=user.id).values('count')[:1]
+    return ChatRoom.objects.filter(participants=user).annotate(
+        last_message_id=Subquery(latest.values('id')[:1], output_field=IntegerField()),
+        last_activity=Coalesce(Subquery(latest.values('timestamp')[:1]), 'created_at', output_field=DateTimeField()),
+        unread=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+    ).order_by('-last_activity', '-id')
+
+
+class ChatInboxView(APIView):
+    """API endpoint to list the user's chat rooms, most recent activity first
+
+    At most four queries per page whatever the number of rooms: the annotated
+    rooms, their participant ids and last messages (chat database), then every
+    participant and sender at once (primary database).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            per_page = min(100, max(1, int(request.query_params.get('per_page', 20))))
+        except ValueError:
+            return Response({'error': 'per_page must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.query_params.get('cursor')
+
+        rooms = inbox_queryset(request.user)
+        if cursor:
+            try:
+                last_activity, room_id = decode_inbox_cursor(cursor)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            rooms = rooms.filter(
+                Q(last_activity__lt=last_activity) | Q(last_activity=last_activity, id__lt=room_id)
+            )
+
+        # Fetch one extra row to know whether there is a next page
+        rooms = list(rooms[:per_page + 1])
+        has_next = len(rooms) > per_page
+        rooms = rooms[:per_page]
+
+        # Users are in the primary database: collect every participant and sender, then fetch them at once
+        participant_ids = {}
+        for room_id, user_id in ChatParticipant.objects.filter(chatroom__in=rooms).values_list('chatroom_id', 'user_id'):
+            participant_ids.setdefault(room_id, []).append(user_id)
+        last_messages = Message.objects.in_bulk([room.last_message_id for room in rooms if room.last_message_id])
+        user_ids = {user_id for ids in participant_ids.values() for user_id in ids}
+        user_ids.update(message.sender_id for message in last_messages.values())
+        users = User.objects.only('id', 'username', 'first_name', 'last_name', 'profile_picture', 'is_online').in_bulk(user_ids)
+
+        for room in rooms:
+            room.prefetched_participants = [users[user_id] for user_id in sorted(participant_ids.get(room.id, [])) if user_id in users]
+            message = room.prefetched_last_message = last_messages.get(room.last_message_id)
+            if message is not None and message.sender_id in users:
+                message.sender = users[message.sender_id]
+
+        serializer = ChatRoomSerializer(rooms, many=True, context={'request': request})
+        return Response({
+            'results': serializer.data,
+            'next': encode_inbox_cursor(rooms[-1]) if has_next else None,
+            'has_next': has_next,
+            'has_previous': bool(cursor),
+        })
+
+
+class ChatMessageHistoryView(APIView):
+    """API endpoint to page backwards through the messages of a chat room
+
+    ``before`` is the cursor returned by the previous page. Each page is one
+    range scan of the (room, timestamp, id) index, however long the history.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, room_id):
+        if not is_room_member(room_id, request.user.id):
+            return Response({'error': 'Chat room not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = min(100, max(1, int(request.query_params.get('limit', 50))))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = Message.objects.filter(room_id=room_id)
+        before = request.query_params.get('before')
+        if before:
+            try:
+                timestamp, message_id = decode_message_cursor(before)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            # Spelled with a plain upper bound on timestamp so SQLite turns it into an index range
+            messages = messages.filter(timestamp__lte=timestamp).filter(Q(timestamp__lt=timestamp) | Q(id__lt=message_id))
+
+        # Newest first to walk the index backwards, with one extra row to detect older pages
+        # Senders come from the primary database in a second query
+        page = list(messages.prefetch_related('sender').order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        return Response({
+            'results': MessageSerializer(reversed(page), many=True).data,  # oldest first, as displayed
+            'before': encode_message_cursor(page[-1]) if has_more else None,
+            'has_more': has_more,
+        })
@@ -1,8 +1,13 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
-from .models import ChatRoom, Message, User
+from django.db import transaction
+from .db_routers import chat_database
+from .models import Message, MessageRead
+from .chat_persistence import get_message_batcher
+from .chat_membership import is_room_member
+from .presence import get_presence_tracker
+from .unread import get_unread_counts, record_messages_read, unread_counts_event
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -20,9 +25,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        self.joined = True
 
         # Mettre à jour le statut "en ligne" de l'utilisateur
-        await self.set_user_online(True)
+        await get_presence_tracker().connect(self.user.id)
         
         await self.accept()
         
@@ -37,6 +43,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
     async def disconnect(self, close_code):
+        # La connexion a été refusée dans connect() : rien à nettoyer
+        if not getattr(self, "joined", False):
+            return
+        
         # Quitter le groupe de chat
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -44,7 +54,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         
         # Mettre à jour le statut "hors ligne" de l'utilisateur
-        await self.set_user_online(False)
+        # (seulement à la fermeture de sa dernière connexion)
+        if not await get_presence_tracker().disconnect(self.user.id):
+            return
         
         # Informer les autres utilisateurs que cet utilisateur est hors ligne
         await self.channel_layer.group_send(
@@ -65,6 +77,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
             # Enregistrer le message dans la base de données
             message_obj = await self.save_message(message)
+            if message_obj is None:
+                return
             
             # Envoyer le message à tous les membres du groupe
             await self.channel_layer.group_send(
@@ -93,6 +107,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
         
+        elif message_type == "read_receipt" and "up_to_message_id" in text_data_json:
+            # Accusé de lecture groupé : tous les messages jusqu'à up_to_message_id
+            try:
+                up_to_message_id = int(text_data_json["up_to_message_id"])
+            except (TypeError, ValueError):
+                return
+            
+            read_count = await self.mark_messages_read_up_to(up_to_message_id)
+            if not read_count:
+                return
+            
+            # Un seul événement agrégé pour tout le groupe
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    "type": "read_receipt_bulk",
+                    "up_to_message_id": up_to_message_id,
+                    "count": read_count,
+                    "user_id": self.user.id
+                }
+            )
+        
         elif message_type == "read_receipt":
             message_id = text_data_json["message_id"]
             
@@ -147,67 +183,82 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def user_in_room(self):
-        """Vérifier que l'utilisateur est bien participant à cette salle de chat"""
-        try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            return room.participants.filter(id=self.user.id).exists()
-        except ChatRoom.DoesNotExist:
-            return False
+        """Vérifier que l'utilisateur est bien participant à cette salle de chat (avec cache)"""
+        return is_room_member(self.room_id, self.user.id)
+
+    async def save_message(self, content):
+        """Enregistrer un nouveau message dans la base de données
+
+        Les messages reçus à quelques millisecondes d'intervalle sont regroupés
+        en une seule écriture par le MessageBatcher.
+        """
+        # L'utilisateur a pu être retiré de la salle depuis la connexion
+        if not await self.user_in_room():
+            return None
+        message = await get_message_batcher().save(self.room_id, self.user.id, content)
+        if message is None:
+            return None
+        return {
+            "id": str(message.id),
+            "timestamp": message.timestamp.strftime("%H:%M %d/%m/%Y")
+        }
+
+    async def read_receipt_bulk(self, event):
+        # Envoyer l'accusé de lecture groupé au client WebSocket
+        await self.send(text_data=json.dumps({
+            "type": "read_receipt_bulk",
+            "up_to_message_id": event["up_to_message_id"],
+            "count": event["count"],
+            "user_id": event["user_id"]
+        }))
 
     @database_sync_to_async
-    def save_message(self, content):
-        """Enregistrer un nouveau message dans la base de données"""
-        try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            message = Message.objects.create(
-                room=room,
-                sender=self.user,
-                content=content,
-                is_read=False
+    def mark_messages_read_up_to(self, message_id):
+        """Marquer comme lus tous les messages de la salle jusqu'à message_id inclus
+
+        Une requête pour trouver les messages non lus, une insertion groupée dans
+        read_by et un seul UPDATE, quel que soit le nombre de messages.
+        """
+        messages = Message.objects.filter(room_id=self.room_id, id__lte=message_id).exclude(sender_id=self.user.id)
+        unread_ids = list(messages.exclude(read_by=self.user.id).values_list("id", flat=True))
+        if not unread_ids:
+            return 0
+        
+        with transaction.atomic(using=chat_database()):
+            MessageRead.objects.bulk_create(
+                [MessageRead(message_id=unread_id, user_id=self.user.id) for unread_id in unread_ids],
+                ignore_conflicts=True
             )
-            # Mettre à jour le timestamp de la salle
-            room.updated_at = timezone.now()
-            room.save()
-            
-            return {
-                "id": str(message.id),
-                "timestamp": message.timestamp.strftime("%H:%M %d/%m/%Y")
-            }
-        except ChatRoom.DoesNotExist:
-            return None
+            messages.filter(is_read=False).update(is_read=True)
+            record_messages_read(self.room_id, self.user.id, len(unread_ids))
+        return len(unread_ids)
 
     @database_sync_to_async
     def mark_message_read(self, message_id):
         """Marquer un message comme lu"""
         try:
             message = Message.objects.get(id=message_id)
-            if message.sender != self.user:  # Ne pas marquer ses propres messages
-                message.is_read = True
-                message.read_by.add(self.user)
-                message.save()
+            if message.sender_id != self.user.id:  # Ne pas marquer ses propres messages
+                with transaction.atomic(using=chat_database()):
+                    first_read = not MessageRead.objects.filter(message=message, user_id=self.user.id).exists()
+                    message.is_read = True
+                    message.read_by.add(self.user.id)
+                    message.save()
+                    if first_read:
+                        record_messages_read(message.room_id, self.user.id, 1)
             return True
         except Message.DoesNotExist:
             return False
 
-    @database_sync_to_async
-    def set_user_online(self, is_online):
-        """Mettre à jour le statut en ligne de l'utilisateur"""
-        try:
-            user = User.objects.get(id=self.user.id)
-            user.is_online = is_online
-            if not is_online:
-                user.last_online = timezone.now()
-            user.save()
-            return True
-        except User.DoesNotExist:
-            return False
-
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     """Consumer pour les notifications en temps réel"""
     
     async def connect(self):
         self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
         self.notification_group_name = f"notifications_{self.user.id}"
         
         # Joindre le groupe de notifications personnelles
@@ -217,8 +268,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        
+        # Envoyer les compteurs actuels : le client n'a plus besoin de les demander
+        counts = await self.load_unread_counts()
+        await self.unread_counts(unread_counts_event(counts))
     
     async def disconnect(self, close_code):
+        if not hasattr(self, "notification_group_name"):
+            return
         # Quitter le groupe de notifications
         await self.channel_layer.group_discard(
             self.notification_group_name,
@@ -235,4 +292,17 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             "notification_type": event["notification_type"],
             "created_at": event["created_at"],
             "link": event.get("link", "")
-        }))
\ No newline at end of file
+        }))
+    
+    async def unread_counts(self, event):
+        """Envoyer les compteurs de non-lus (messages, notifications, salles) au client WebSocket"""
+        await self.send(text_data=json.dumps({
+            "type": "unread_counts",
+            "messages": event["messages"],
+            "notifications": event["notifications"],
+            "rooms": event["rooms"]
+        }))
+    
+    @database_sync_to_async
+    def load_unread_counts(self):
+        return get_unread_counts([self.user.id])[self.user.id]
@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, router
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Models of blickers_app stored in CHAT_DATABASE
+CHAT_MODELS = {'chatroom', 'chatparticipant', 'message', 'messageread', 'chatroomunread'}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def chat_database():
+    """Alias of the database holding the chat tables (the primary unless ``CHAT_DATABASE`` says otherwise)"""
+    return _setting('CHAT_DATABASE', 'default')
+
+
+def is_chat_model(model):
+    return model._meta.app_label == 'blickers_app' and model._meta.model_name in CHAT_MODELS
+
+
+@dataclass
+class RoutingState:
+    """What the current request may read from; shared by the middleware and the router"""
+    replica_allowed: bool = False
+    # Set once the client wrote recently or the request itself wrote: read your own writes
+    pinned: bool = False
+    wrote: bool = False
+
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+def _user_id(request):
+    """Id of the authenticated user, if any, without waiting for the view to authenticate"""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    from rest_framework_simplejwt.settings import api_settings
+
+    # DRF authenticates JWT clients in the view, after this middleware: read the token here
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is not None:
+        try:
+            return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+        except InvalidToken:
+            return None
+    if request.COOKIES.get(settings.SESSION_COOKIE_NAME) and request.user.is_authenticated:
+        return request.user.pk
+    return None
+
+
+def _pin_key(request):
+    """Cache key of the client: its user, else its session; None for anonymous clients without one"""
+    user_id = _user_id(request)
+    if user_id is not None:
+        # The same across token refreshes and devices
+        return f'replica_pin:user:{user_id}'
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return f'replica_pin:session:{hashlib.sha256(session_key.encode()).hexdigest()}'
+    # Anonymous clients behind one proxy share an address: only the request itself is pinned
+    return None
+
+
+def _replica_router():
+    return next((r for r in router.routers if isinstance(r, ReplicaRouter)), None)
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe requests to views with ``use_read_replica = True`` read from ``READ_REPLICAS``.
+
+    Any request that writes pins its client to the primary for
+    ``REPLICA_PIN_SECONDS``, so a page reloaded after a change never shows
+    the replica's older copy. The pins are kept in the cache, which must be
+    shared by every worker (settings.py refuses replicas otherwise).
+
+    A view whose query fails on a replica is run again on the primary, so it
+    must stay the last middleware with a ``process_view``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('READ_REPLICAS', []):
+            return self.get_response(request)
+
+        key = _pin_key(request)
+        state = RoutingState(pinned=key is not None and cache.get(key) is not None)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if key is not None and (request.method not in SAFE_METHODS or state.wrote):
+            cache.set(key, True, _setting('REPLICA_PIN_SECONDS', 5))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing.get()
+        view_class = getattr(view_func, 'view_class', view_func)
+        if state is None or request.method not in SAFE_METHODS or not getattr(view_class, 'use_read_replica', False):
+            return None
+        state.replica_allowed = True
+
+        failures = []
+
+        def watch(execute, sql, params, many, context):
+            try:
+                return execute(sql, params, many, context)
+            except DatabaseError as e:
+                failures.append((context['connection'].alias, e))
+                raise
+
+        with ExitStack() as stack:
+            for alias in _setting('READ_REPLICAS', []):
+                stack.enter_context(connections[alias].execute_wrapper(watch))
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+            except Exception:
+                # Whatever the view's error handling made of the replica's error
+                if not failures:
+                    raise
+        if not failures:
+            return response
+
+        # The view may have turned the error into a response of its own: read it all again from the primary
+        alias, error = failures[0]
+        replica_router = _replica_router()
+        if replica_router is not None:
+            replica_router.skip(alias, time.monotonic(), f'query failed ({error})')
+        state.replica_allowed = False
+        return view_func(request, *view_args, **view_kwargs)
+
+
+class ChatRouter:
+    """Keep rooms, participants, messages, read receipts and room unread counts in ``CHAT_DATABASE``.
+
+    A burst of chat writes then only holds the write lock of the chat database,
+    never the one that events, forum and auth writes wait for. Chat rows refer
+    to users by id: there are no foreign key constraints or joins between the
+    two databases.
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, hints)
+
+    def db_for_model(self, model, hints):
+        chat = chat_database()
+        if is_chat_model(model):
+            return chat
+        instance = hints.get('instance')
+        if chat != 'default' and instance is not None and instance._state.db == chat:
+            # e.g. message.sender: Django would otherwise look for the user next to the message
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        chat = chat_database()
+        if chat != 'default' and chat in (obj1._state.db, obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        chat = chat_database()
+        if chat == 'default':
+            return None
+        if app_label == 'blickers_app' and model_name in CHAT_MODELS:
+            # The primary keeps its copy too: the rows from before the split, which
+            # migration 0021 copies into the chat database, and a schema in step with
+            # the migration history (e.g. for the backfill of 0017)
+            return db in (chat, 'default')
+        if db == chat:
+            # Nothing else goes there, RunSQL and RunPython without a model_name hint included
+            return False
+        return None
+
+
+class ReplicaRouter:
+    """Send the reads allowed by ReplicaRoutingMiddleware to a healthy replica, everything else to the primary.
+
+    A replica that cannot be reached, or lags more than
+    ``REPLICA_MAX_LAG_SECONDS`` behind, is skipped for ``REPLICA_RETRY_SECONDS``.
+    """
+
+    def __init__(self):
+        self.skipped_until = {}
+        self.checked_at = {}
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.replica_allowed or state.pinned:
+            return None
+        return self.pick_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {'default', *_setting('READ_REPLICAS', [])}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in _setting('READ_REPLICAS', []):
+            return False
+        return None
+
+    def pick_replica(self):
+        now = time.monotonic()
+        replicas = [
+            alias for alias in _setting('READ_REPLICAS', [])
+            if self.skipped_until.get(alias, 0) <= now and not self.is_primary(alias)
+        ]
+        random.shuffle(replicas)
+        for alias in replicas:
+            if self.is_usable(alias, now):
+                return alias
+        return None
+
+    def is_primary(self, alias):
+        # True of the test mirrors, which are the test database itself: read it through 'default'
+        replica, primary = connections[alias].settings_dict, connections['default'].settings_dict
+        return all(replica[key] == primary[key] for key in ('ENGINE', 'NAME', 'HOST', 'PORT'))
+
+    def is_usable(self, alias, now):
+        # The lag is measured at most once per REPLICA_CHECK_SECONDS; connecting is free once connected
+        if now - self.checked_at.get(alias, float('-inf')) < _setting('REPLICA_CHECK_SECONDS', 5):
+            try:
+                connections[alias].ensure_connection()
+                return True
+            except DatabaseError as e:
+                return self.skip(alias, now, f'unreachable ({e})')
+        try:
+            lag = self.measure_lag(connections[alias])
+        except DatabaseError as e:
+            return self.skip(alias, now, f'unreachable ({e})')
+        if lag > _setting('REPLICA_MAX_LAG_SECONDS', 30):
+            return self.skip(alias, now, f'{lag:.1f}s behind')
+        self.checked_at[alias] = now
+        return True
+
+    def skip(self, alias, now, reason):
+        logger.warning('Reading from the primary instead of %s: %s', alias, reason)
+        self.skipped_until[alias] = now + _setting('REPLICA_RETRY_SECONDS', 30)
+        self.checked_at.pop(alias, None)
+        return False
+
+    def measure_lag(self, connection):
+        """Seconds the replica is behind the primary (0 when caught up or when the database cannot tell)"""
+        connection.ensure_connection()
+        if connection.vendor != 'postgresql':
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), '
+                'COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+            )
+            caught_up, since_last_replay = cursor.fetchone()
+        # The last replayed transaction gets older while the primary has nothing to write:
+        # it only measures the lag while there is WAL left to replay
+        return 0 if caught_up else float(since_last_replay)
@@ -0,0 +1,80 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Number of rows fetched per database round-trip by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Pseudo-buffer whose write() returns the value instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def row_encoder(fieldnames, export_format):
+    """Return the header and a function turning one row dict into a line"""
+    if export_format == 'csv':
+        writer = csv.DictWriter(Echo(), fieldnames=fieldnames)
+        return writer.writeheader(), writer.writerow
+    return '', lambda row: json.dumps(row, default=str) + '\n'
+
+
+def iter_chunks(queryset, format_row, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of at most ``chunk_size`` formatted rows, one database round-trip each"""
+    objects = queryset.iterator(chunk_size=chunk_size)
+    while chunk := [format_row(obj) for obj in islice(objects, chunk_size)]:
+        yield chunk
+
+
+async def aiter_chunks(queryset, format_row, chunk_size=EXPORT_CHUNK_SIZE):
+    """iter_chunks for the event loop: each chunk is fetched in the sync thread"""
+    chunks = iter_chunks(queryset, format_row, chunk_size)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # e.g. the client went away: release the cursor from the thread that opened it
+        await sync_to_async(chunks.close)()
+
+
+def stream_rows(chunks, header, encode):
+    if header:
+        yield header
+    for chunk in chunks:
+        yield ''.join(map(encode, chunk))
+
+
+async def astream_rows(chunks, header, encode):
+    if header:
+        yield header
+    async for chunk in chunks:
+        yield ''.join(map(encode, chunk))
+
+
+def streaming_export_response(request, queryset, format_row, fieldnames, export_format, filename):
+    """Build a StreamingHttpResponse that serializes ``queryset`` lazily as CSV or NDJSON
+
+    Under ASGI the content is an async iterator, which Django streams as it
+    comes; a sync one would be read in full before the first byte is sent.
+    """
+    content_type, extension = EXPORT_FORMATS[export_format]
+    header, encode = row_encoder(fieldnames, export_format)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = astream_rows(aiter_chunks(queryset, format_row, EXPORT_CHUNK_SIZE), header, encode)
+    else:
+        content = stream_rows(iter_chunks(queryset, format_row, EXPORT_CHUNK_SIZE), header, encode)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,155 @@
+"""Resized copies ("derivatives") of uploaded pictures.
+
+Each preset is rendered in WebP and JPEG under ``derivatives/`` in the media
+storage, in a folder named after the original: ``event_images/party.png`` gets
+``derivatives/event_images/party.png/card.webp`` and so on. Upload views
+render their presets right away. Older pictures are rendered the first time
+ImageDerivativeView is asked for them, and the result stays on disk.
+
+Only storages with local files (``default_storage.path()``, e.g. the default
+FileSystemStorage) are supported: the copies are written aside and renamed
+into place. With any other storage the original upload is linked instead.
+"""
+import logging
+import os
+import posixpath
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height, crop): avatars are cropped to a square, the others fit in the box
+PRESETS = {
+    'avatar64': (64, 64, True),
+    'avatar128': (128, 128, True),
+    'card': (480, 480, False),
+    'full': (1280, 1280, False),
+}
+AVATAR_PRESETS = ('avatar64', 'avatar128')
+PICTURE_PRESETS = ('card', 'full')
+
+# format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Upload folders whose pictures may be resized on demand
+SOURCE_DIRS = ('profile_pics/', 'event_images/', 'post_images/')
+
+DERIVATIVES_DIR = 'derivatives'
+
+
+def is_resizable(name):
+    """Whether ``name`` is a stored upload that ImageDerivativeView may read"""
+    return bool(name) and posixpath.normpath(name) == name and name.startswith(SOURCE_DIRS)
+
+
+def derivative_name(name, preset, image_format):
+    return f'{DERIVATIVES_DIR}/{name}/{preset}.{FORMATS[image_format][0]}'
+
+
+def stores_locally():
+    """Whether the media storage has local files that derivatives can be written next to"""
+    try:
+        default_storage.path(DERIVATIVES_DIR)
+    except NotImplementedError:
+        return False
+    return True
+
+
+def derivative_path(name, preset, image_format):
+    return default_storage.path(derivative_name(name, preset, image_format))
+
+
+def _prepare(image, image_format):
+    # Resampling filters need RGB(A); JPEG has no alpha, so transparent pixels become white
+    has_alpha = image.has_transparency_data
+    if image_format == 'jpeg' and has_alpha:
+        image = image.convert('RGBA')
+        flattened = Image.new('RGB', image.size, 'white')
+        flattened.paste(image, mask=image.getchannel('A'))
+        return flattened
+    mode = 'RGBA' if has_alpha and image_format == 'webp' else 'RGB'
+    return image if image.mode == mode else image.convert(mode)
+
+
+def render_derivative(name, preset, image_format):
+    """Render one derivative of the upload stored as ``name`` unless it is on disk already
+
+    Returns the path of the file, or None when the upload is missing or is not an
+    image, or when the storage has no local files.
+    """
+    if not stores_locally():
+        return None
+    path = derivative_path(name, preset, image_format)
+    if os.path.exists(path):
+        return path
+
+    width, height, crop = PRESETS[preset]
+    try:
+        with default_storage.open(name) as source, Image.open(source) as original:
+            # Phones store the orientation in EXIF; apply it, since saving drops the metadata
+            image = _prepare(ImageOps.exif_transpose(original), image_format)
+            if crop:
+                image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+            else:
+                image.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside then renamed, so a concurrent request never serves half a file
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    image.save(out, **FORMATS[image_format][1])
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning('Cannot render %s of %s as %s: %s', preset, name, image_format, e)
+        return None
+    return path
+
+
+def generate_derivatives(field_file, presets):
+    """Render every format of ``presets`` for a freshly uploaded picture"""
+    if not field_file or not is_resizable(field_file.name) or not stores_locally():
+        return
+    for preset in presets:
+        for image_format in FORMATS:
+            render_derivative(field_file.name, preset, image_format)
+
+
+def delete_derivatives(field_file):
+    """Forget the derivatives of a picture that is being replaced or deleted"""
+    if field_file and is_resizable(field_file.name) and stores_locally():
+        shutil.rmtree(default_storage.path(f'{DERIVATIVES_DIR}/{field_file.name}'), ignore_errors=True)
+
+
+def derivative_url(field_file, preset, image_format='webp', request=None):
+    """URL of a derivative: the file itself once rendered, ImageDerivativeView until then"""
+    if not field_file:
+        return None
+    name = field_file.name
+    if not is_resizable(name) or not stores_locally():
+        url = field_file.url
+    elif os.path.exists(derivative_path(name, preset, image_format)):
+        url = default_storage.url(derivative_name(name, preset, image_format))
+    else:
+        url = reverse('image-derivative', kwargs={'preset': preset, 'image_format': image_format, 'name': name})
+    return request.build_absolute_uri(url) if request else url
+
+
+def derivative_urls(field_file, presets, request=None):
+    """``{preset: {format: url}}`` for every preset, e.g. to build a srcset"""
+    if not field_file:
+        return None
+    return {
+        preset: {image_format: derivative_url(field_file, preset, image_format, request) for image_format in FORMATS}
+        for preset in presets
+    }
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+from blickers_app.models import ForumReply, ForumTopic
+
+
+def backfill_topic_counters(topic_model, reply_model, batch_size=500, using='default', progress=None):
+    """Recompute reply_count and last_activity_at of every topic, one transaction per batch
+
+    Takes the models as arguments so that migration 0025 can run it with its
+    historical models. ``progress(updated, total)`` is called after each batch.
+    Returns the number of topics updated.
+    """
+    topic_ids = list(topic_model.objects.using(using).order_by('id').values_list('id', flat=True))
+    updated = 0
+
+    for start in range(0, len(topic_ids), batch_size):
+        batch_ids = topic_ids[start:start + batch_size]
+        with transaction.atomic(using=using):
+            stats = {
+                row['topic_id']: row
+                for row in reply_model.objects.using(using).filter(topic_id__in=batch_ids)
+                .values('topic_id')
+                .annotate(total=Count('id'), latest=Max('created_at'))
+                .order_by()
+            }
+            topics = list(topic_model.objects.using(using).select_for_update().filter(id__in=batch_ids).only('id', 'created_at'))
+            for topic in topics:
+                row = stats.get(topic.id)
+                topic.reply_count = row['total'] if row else 0
+                topic.last_activity_at = max(row['latest'], topic.created_at) if row else topic.created_at
+            topic_model.objects.using(using).bulk_update(topics, ['reply_count', 'last_activity_at'])
+        updated += len(topics)
+        if progress:
+            progress(updated, len(topic_ids))
+    return updated
+
+
+class Command(BaseCommand):
+    help = 'Recompute ForumTopic.reply_count and last_activity_at from the existing replies, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of topics updated per transaction')
+
+    def handle(self, *args, **options):
+        updated = backfill_topic_counters(
+            ForumTopic, ForumReply, options['batch_size'],
+            progress=lambda done, total: self.stdout.write(f'Updated {done}/{total} topics')
+        )
+        self.stdout.write(self.style.SUCCESS(f'Backfilled forum counters for {updated} topics'))
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from blickers_app.chat_persistence import get_message_batcher
+from blickers_app.models import ChatRoom
+from blickers_app.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Connect N simulated websocket clients to ws/chat/<room_id>/ and report message '
+        'fan-out latency percentiles and throughput for the configured channel layer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20, help='Number of simulated websocket clients')
+        parser.add_argument('--messages', type=int, default=200, help='Total number of chat messages to send')
+        parser.add_argument('--rate', type=float, default=0, help='Messages per second to send (0 = as fast as possible)')
+        parser.add_argument('--room', type=str, default=None, help='Existing chat room id (its participants are used as clients)')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for all messages to be delivered')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['messages'] < 1:
+            raise CommandError('--clients and --messages must be positive')
+
+        created_users = []
+        room = None
+        try:
+            if options['room']:
+                try:
+                    room = ChatRoom.objects.get(id=options['room'])
+                except (ChatRoom.DoesNotExist, ValueError):
+                    raise CommandError(f"Chat room {options['room']} not found")
+                users = list(room.get_participants()[:options['clients']])
+                if not users:
+                    raise CommandError('The chat room has no participants')
+            else:
+                # Temporary users and room, removed once the benchmark is done. Saved one by one
+                # (no bulk_create): the dashboard counts them, so deleting them evens out
+                prefix = f'loadtest_{uuid.uuid4().hex[:8]}'
+                created_users = [
+                    User.objects.create_user(username=f'{prefix}_{i}', email=f'{prefix}_{i}@loadtest.invalid')
+                    for i in range(options['clients'])
+                ]
+                users = created_users
+                room = ChatRoom.objects.create(name=prefix, is_group_chat=True)
+                room.participants.add(*users)
+
+            backend = settings.CHANNEL_LAYERS['default']['BACKEND']
+            self.stdout.write(f'Channel layer: {backend}')
+            self.stdout.write(f"Clients: {len(users)}, messages: {options['messages']}, room: {room.id}")
+
+            results = async_to_sync(self.run_benchmark)(
+                str(room.id), users, options['messages'], options['rate'], options['timeout']
+            )
+            self.report(results)
+        finally:
+            if created_users:
+                if room is not None:
+                    room.delete()
+                User.objects.filter(username__in=[user.username for user in created_users]).delete()
+
+    async def run_benchmark(self, room_id, users, message_count, rate, timeout):
+        application = URLRouter(websocket_urlpatterns)
+        communicators = []
+        for user in users:
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{room_id}/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect(timeout=timeout)
+            if not connected:
+                raise CommandError(f'Client for {user.username} could not connect')
+            communicators.append(communicator)
+
+        run_id = uuid.uuid4().hex
+        latencies = []
+        delivered = [0]
+
+        async def receive_all(communicator):
+            received = 0
+            while received < message_count:
+                frame = json.loads(await communicator.receive_from(timeout=timeout))
+                if frame.get('type') != 'message':
+                    continue  # user_status / typing frames from other clients
+                try:
+                    payload = json.loads(frame['message'])
+                except (TypeError, ValueError):
+                    continue
+                if not isinstance(payload, dict) or payload.get('run') != run_id:
+                    continue
+                latencies.append(time.perf_counter() - payload['sent_at'])
+                received += 1
+                delivered[0] += 1
+
+        receivers = [asyncio.ensure_future(receive_all(communicator)) for communicator in communicators]
+        interval = 1 / rate if rate > 0 else 0
+
+        started = time.perf_counter()
+        sent_at = None
+        try:
+            for seq in range(message_count):
+                sender = communicators[seq % len(communicators)]
+                payload = {'run': run_id, 'seq': seq, 'sent_at': time.perf_counter()}
+                await sender.send_to(text_data=json.dumps({'type': 'message', 'message': json.dumps(payload)}))
+                if interval:
+                    await asyncio.sleep(interval)
+            sent_at = time.perf_counter()
+            await asyncio.wait_for(asyncio.gather(*receivers), timeout=timeout)
+        except asyncio.TimeoutError:
+            for receiver in receivers:
+                receiver.cancel()
+        finally:
+            finished = time.perf_counter()
+            for communicator in communicators:
+                await communicator.disconnect()
+            # The batcher counts its messages on the dashboard a few seconds later, on this
+            # loop: do it now, before the loop closes and the room's messages are deleted
+            batcher = get_message_batcher()
+            await batcher.flush()
+            await batcher.flush_dashboard()
+
+        return {
+            'clients': len(communicators),
+            'messages': message_count,
+            'expected_deliveries': message_count * len(communicators),
+            'deliveries': delivered[0],
+            'send_seconds': (sent_at or finished) - started,
+            'total_seconds': finished - started,
+            'latencies': latencies,
+        }
+
+    def report(self, results):
+        latencies = results['latencies']
+        total = results['total_seconds']
+        self.stdout.write(f"Delivered {results['deliveries']}/{results['expected_deliveries']} messages in {total:.2f}s")
+        self.stdout.write(f"Send throughput: {results['messages'] / results['send_seconds']:.1f} msg/s")
+        self.stdout.write(f"Fan-out throughput: {results['deliveries'] / total:.1f} deliveries/s")
+        if not latencies:
+            self.stdout.write(self.style.ERROR('No messages were delivered'))
+            return
+        self.stdout.write('Fan-out latency (ms):')
+        for label, value in (
+            ('min', min(latencies)),
+            ('p50', percentile(latencies, 50)),
+            ('p90', percentile(latencies, 90)),
+            ('p95', percentile(latencies, 95)),
+            ('p99', percentile(latencies, 99)),
+            ('max', max(latencies)),
+            ('mean', statistics.mean(latencies)),
+        ):
+            self.stdout.write(f'  {label:>4}: {value * 1000:8.2f}')
+        if results['deliveries'] < results['expected_deliveries']:
+            self.stdout.write(self.style.WARNING('Some deliveries timed out'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All messages delivered'))
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+# Database settings compared by the benchmark, each on a fresh database file
+PROFILES = {
+    'rollback-journal': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}},
+    'wal': {'ENGINE': 'blickers_app.sqlite_backend', 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}},
+    'wal+queue': {'ENGINE': 'blickers_app.sqlite_backend', 'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'write_queue': True}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent writer threads against a scratch SQLite database with each connection '
+        'profile and report committed writes per second and "database is locked" errors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent writer threads')
+        parser.add_argument('--writes', type=int, default=200, help='Transactions per thread')
+        parser.add_argument('--profile', action='append', choices=list(PROFILES), help='Profile to run (default: all)')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['writes'] < 1:
+            raise CommandError('--threads and --writes must be positive')
+
+        self.stdout.write(f"Threads: {options['threads']}, transactions per thread: {options['writes']}")
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['profile'] or PROFILES:
+                results = self.run_profile(name, os.path.join(directory, f'{name}.sqlite3'), options['threads'], options['writes'])
+                line = (
+                    f"{name}: journal_mode={results['journal_mode']}, "
+                    f"{results['committed']}/{results['expected']} committed in {results['seconds']:.2f}s "
+                    f"({results['committed'] / results['seconds']:.0f} writes/s), {results['errors']} lock errors"
+                )
+                self.stdout.write(self.style.SUCCESS(line) if not results['errors'] else self.style.WARNING(line))
+
+    def run_profile(self, name, path, thread_count, writes):
+        alias = f'benchmark_{name}'
+        connections.settings[alias] = {
+            **connections['default'].settings_dict,
+            **PROFILES[name],
+            'NAME': path,
+        }
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, writer INTEGER, seq INTEGER)')
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+
+            committed = [0] * thread_count
+            errors = [0] * thread_count
+            start = threading.Barrier(thread_count)
+
+            def writer(number):
+                try:
+                    start.wait()
+                    for seq in range(writes):
+                        try:
+                            # A read followed by a write, like a view that checks before saving
+                            with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                                cursor.execute('SELECT COUNT(*) FROM bench WHERE writer = %s', [number])
+                                cursor.execute('INSERT INTO bench (writer, seq) VALUES (%s, %s)', [number, seq])
+                            committed[number] += 1
+                        except OperationalError:
+                            errors[number] += 1
+                finally:
+                    connections[alias].close()
+
+            threads = [threading.Thread(target=writer, args=(number,)) for number in range(thread_count)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds = time.perf_counter() - started
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+        return {
+            'journal_mode': journal_mode,
+            'expected': thread_count * writes,
+            'committed': sum(committed),
+            'errors': sum(errors),
+            'seconds': seconds,
+        }
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from blickers_app.models import User
+from blickers_app.notifications import dispatch_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send a notification to every active user (or one role) and report the timing of each batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--title', required=True, help='Notification title')
+        parser.add_argument('--message', required=True, help='Notification message')
+        parser.add_argument('--type', default='announcement', help='Notification type name')
+        parser.add_argument('--role', choices=[role for role, _ in User.ROLE_CHOICES], help='Only notify users with this role')
+        parser.add_argument('--link', default=None, help='Link attached to the notification')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per bulk insert (default: NOTIFICATION_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        users = User.objects.filter(is_active=True)
+        if options['role']:
+            users = users.filter(role=options['role'])
+
+        reports = dispatch_notifications(
+            users.order_by('id').values_list('id', flat=True),
+            title=options['title'],
+            message=options['message'],
+            notification_type=options['type'],
+            link=options['link'],
+            batch_size=options['batch_size'],
+        )
+        for report in reports:
+            self.stdout.write(
+                f"Batch {report['batch']}: {report['size']} notifications, "
+                f"insert {report['insert_ms']:.1f} ms, push {report['push_ms']:.1f} ms"
+            )
+        total = sum(report['size'] for report in reports)
+        elapsed = sum(report['insert_ms'] + report['push_ms'] for report in reports)
+        self.stdout.write(self.style.SUCCESS(f'Sent {total} notifications in {len(reports)} batches ({elapsed:.1f} ms)'))
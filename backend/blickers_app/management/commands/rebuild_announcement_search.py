@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blickers_app.search import rebuild_announcement_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of announcements from the existing data'
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            self.stdout.write(self.style.WARNING('The database has no FTS5 support; announcement search uses icontains instead'))
+            return
+        try:
+            with transaction.atomic():
+                indexed = rebuild_announcement_index()
+            self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} announcements'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error rebuilding the announcement search index: {str(e)}'))
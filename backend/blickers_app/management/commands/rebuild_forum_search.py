@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blickers_app.search import rebuild_forum_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of forum topics and replies from the existing data'
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            self.stdout.write(self.style.WARNING('The database has no FTS5 support; forum search uses icontains instead'))
+            return
+        try:
+            with transaction.atomic():
+                indexed = rebuild_forum_index()
+            self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} forum topics and replies'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error rebuilding the forum search index: {str(e)}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blickers_app.search import rebuild_global_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the global search index (events, announcements, forum topics and users) from the existing data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows inserted per batch')
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            self.stdout.write(self.style.WARNING('The database has no FTS5 support; global search uses icontains instead'))
+            return
+        try:
+            with transaction.atomic():
+                indexed = rebuild_global_index(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} objects'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error rebuilding the global search index: {str(e)}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from blickers_app.unread import rebuild_unread_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the unread message and notification counters from the existing data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of counter rows inserted per query')
+
+    def handle(self, *args, **options):
+        try:
+            users = rebuild_unread_counters(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt unread counters for {users} users'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error rebuilding unread counters: {str(e)}'))
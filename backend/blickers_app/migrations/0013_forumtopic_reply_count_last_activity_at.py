@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 13:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0012_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='forumtopic',
+            name='is_locked',
+        ),
+        migrations.RemoveField(
+            model_name='forumtopic',
+            name='is_solved',
+        ),
+        migrations.RemoveField(
+            model_name='forumtopic',
+            name='likes_count',
+        ),
+        migrations.RemoveField(
+            model_name='forumtopic',
+            name='tags',
+        ),
+        migrations.AddField(
+            model_name='forumtopic',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='forumtopic',
+            name='reply_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,99 @@
+from django.db import migrations
+
+# FTS5 index over forum topics (title + content) and replies (content).
+# rowid = 2 * topic.id for topics and 2 * reply.id + 1 for replies, so the
+# triggers can find a row without scanning the UNINDEXED columns.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS blickers_app_forum_search USING fts5(
+        kind UNINDEXED,
+        object_id UNINDEXED,
+        topic_id UNINDEXED,
+        title,
+        content,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_topic_ai
+    AFTER INSERT ON blickers_app_forumtopic BEGIN
+        INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+        VALUES (new.id * 2, 'topic', new.id, new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_topic_au
+    AFTER UPDATE OF title, content ON blickers_app_forumtopic BEGIN
+        DELETE FROM blickers_app_forum_search WHERE rowid = old.id * 2;
+        INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+        VALUES (new.id * 2, 'topic', new.id, new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_topic_ad
+    AFTER DELETE ON blickers_app_forumtopic BEGIN
+        DELETE FROM blickers_app_forum_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_reply_ai
+    AFTER INSERT ON blickers_app_forumreply BEGIN
+        INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+        VALUES (new.id * 2 + 1, 'reply', new.id, new.topic_id, '', new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_reply_au
+    AFTER UPDATE OF content, topic_id ON blickers_app_forumreply BEGIN
+        DELETE FROM blickers_app_forum_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+        VALUES (new.id * 2 + 1, 'reply', new.id, new.topic_id, '', new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_forum_search_reply_ad
+    AFTER DELETE ON blickers_app_forumreply BEGIN
+        DELETE FROM blickers_app_forum_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    # Index the rows that already exist
+    """
+    INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+    SELECT id * 2, 'topic', id, id, title, content FROM blickers_app_forumtopic
+    """,
+    """
+    INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+    SELECT id * 2 + 1, 'reply', id, topic_id, '', content FROM blickers_app_forumreply
+    """,
+]
+
+REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_topic_ai',
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_topic_au',
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_topic_ad',
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_reply_ai',
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_reply_au',
+    'DROP TRIGGER IF EXISTS blickers_app_forum_search_reply_ad',
+    'DROP TABLE IF EXISTS blickers_app_forum_search',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains in search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0013_forumtopic_reply_count_last_activity_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations
+
+# FTS5 index over announcements (rowid = post id): title, content and the
+# author's display name, kept up to date when the author renames themselves.
+AUTHOR_SQL = (
+    "(SELECT trim(u.first_name || ' ' || u.last_name || ' ' || u.username) "
+    "FROM blickers_app_user u WHERE u.id = {post}.created_by_id)"
+)
+
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS blickers_app_announcement_search USING fts5(
+        title,
+        content,
+        author,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS blickers_app_announcement_search_ai
+    AFTER INSERT ON blickers_app_post WHEN new.is_announcement BEGIN
+        INSERT INTO blickers_app_announcement_search (rowid, title, content, author)
+        VALUES (new.id, new.title, new.content, {AUTHOR_SQL.format(post='new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS blickers_app_announcement_search_au
+    AFTER UPDATE OF title, content, is_announcement, created_by_id ON blickers_app_post BEGIN
+        DELETE FROM blickers_app_announcement_search WHERE rowid = old.id;
+        INSERT INTO blickers_app_announcement_search (rowid, title, content, author)
+        SELECT new.id, new.title, new.content, {AUTHOR_SQL.format(post='new')} WHERE new.is_announcement;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_announcement_search_ad
+    AFTER DELETE ON blickers_app_post BEGIN
+        DELETE FROM blickers_app_announcement_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS blickers_app_announcement_search_author_au
+    AFTER UPDATE OF username, first_name, last_name ON blickers_app_user BEGIN
+        UPDATE blickers_app_announcement_search
+        SET author = trim(new.first_name || ' ' || new.last_name || ' ' || new.username)
+        WHERE rowid IN (SELECT id FROM blickers_app_post WHERE created_by_id = new.id AND is_announcement);
+    END
+    """,
+    # Index the announcements that already exist
+    f"""
+    INSERT INTO blickers_app_announcement_search (rowid, title, content, author)
+    SELECT p.id, p.title, p.content, {AUTHOR_SQL.format(post='p')}
+    FROM blickers_app_post p WHERE p.is_announcement
+    """,
+]
+
+REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS blickers_app_announcement_search_ai',
+    'DROP TRIGGER IF EXISTS blickers_app_announcement_search_au',
+    'DROP TRIGGER IF EXISTS blickers_app_announcement_search_ad',
+    'DROP TRIGGER IF EXISTS blickers_app_announcement_search_author_au',
+    'DROP TABLE IF EXISTS blickers_app_announcement_search',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains in search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0014_forum_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
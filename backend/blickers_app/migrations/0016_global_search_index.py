@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# One FTS5 index for the site-wide search: published events, announcements,
+# forum topics and active users. rowid = object id * 4 + kind code (see
+# GLOBAL_SEARCH_KINDS in search.py); rows are kept in sync by signals.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS blickers_app_global_search USING fts5(
+        kind UNINDEXED,
+        object_id UNINDEXED,
+        title,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # Index the rows that already exist
+    """
+    INSERT INTO blickers_app_global_search (rowid, kind, object_id, title, body)
+    SELECT id * 4, 'event', id, title, description || ' ' || location
+    FROM blickers_app_event WHERE is_published
+    """,
+    """
+    INSERT INTO blickers_app_global_search (rowid, kind, object_id, title, body)
+    SELECT id * 4 + 1, 'announcement', id, title, content
+    FROM blickers_app_post WHERE is_announcement
+    """,
+    """
+    INSERT INTO blickers_app_global_search (rowid, kind, object_id, title, body)
+    SELECT id * 4 + 2, 'topic', id, title, content
+    FROM blickers_app_forumtopic
+    """,
+    """
+    INSERT INTO blickers_app_global_search (rowid, kind, object_id, title, body)
+    SELECT id * 4 + 3, 'user', id, trim(first_name || ' ' || last_name || ' ' || username), coalesce(major, '')
+    FROM blickers_app_user WHERE is_active
+    """,
+]
+
+REVERSE_SQL = [
+    'DROP TABLE IF EXISTS blickers_app_global_search',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains in search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0015_announcement_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
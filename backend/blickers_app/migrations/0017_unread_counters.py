@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Start the counters from the existing messages, read receipts and notifications
+BACKFILL_SQL = [
+    """
+    INSERT INTO blickers_app_chatroomunread (room_id, user_id, count)
+    SELECT p.chatroom_id, p.user_id, COUNT(m.id)
+    FROM blickers_app_chatroom_participants p
+    JOIN blickers_app_message m ON m.room_id = p.chatroom_id AND m.sender_id <> p.user_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM blickers_app_message_read_by r WHERE r.message_id = m.id AND r.user_id = p.user_id
+    )
+    GROUP BY p.chatroom_id, p.user_id
+    """,
+    """
+    INSERT INTO blickers_app_unreadcounter (user_id, messages, notifications)
+    SELECT u.id,
+           COALESCE((SELECT SUM(c.count) FROM blickers_app_chatroomunread c WHERE c.user_id = u.id), 0),
+           (SELECT COUNT(*) FROM blickers_app_notification n WHERE n.user_id = u.id AND n.is_read = FALSE)
+    FROM blickers_app_user u
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0016_global_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('notifications', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChatRoomUnread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counts', to='blickers_app.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_unread_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'room')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
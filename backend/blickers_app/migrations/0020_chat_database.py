@@ -0,0 +1,81 @@
+# Generated by Django 5.2 on 2026-10-17 13:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Prepare the chat tables for their own database (see ChatRouter)
+
+    The participants and read_by tables become explicit models, under their
+    existing table names, and every foreign key from a chat table to the users
+    loses its constraint and its cascade: users stay in the primary database.
+    """
+
+    dependencies = [
+        ('blickers_app', '0019_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ChatParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('chatroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blickers_app.chatroom')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'blickers_app_chatroom_participants',
+                        'unique_together': {('chatroom', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='chatroom',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='chat_rooms', through='blickers_app.ChatParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.CreateModel(
+                    name='MessageRead',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blickers_app.message')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'blickers_app_message_read_by',
+                        'unique_together': {('message', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='read_by',
+                    field=models.ManyToManyField(blank=True, related_name='read_messages', through='blickers_app.MessageRead', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            # The tables already exist under these names
+            database_operations=[],
+        ),
+        migrations.AlterField(
+            model_name='chatparticipant',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='messageread',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='sender',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='sent_messages', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='chatroomunread',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='chat_unread_counts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-17 14:11
+
+from django.conf import settings
+from django.db import connections, migrations
+
+# Copied in this order; the room unread counts are computed again afterwards
+CHAT_TABLES = ['chatroom', 'chatparticipant', 'message', 'messageread']
+
+ROOM_BACKFILL_SQL = """
+    INSERT INTO blickers_app_chatroomunread (room_id, user_id, count)
+    SELECT p.chatroom_id, p.user_id, COUNT(m.id)
+    FROM blickers_app_chatroom_participants p
+    JOIN blickers_app_message m ON m.room_id = p.chatroom_id AND m.sender_id <> p.user_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM blickers_app_message_read_by r WHERE r.message_id = m.id AND r.user_id = p.user_id
+    )
+    GROUP BY p.chatroom_id, p.user_id
+"""
+
+
+def move_chat_rows(apps, schema_editor, batch_size=1000):
+    """Fill a new chat database (CHAT_DB_PATH) with the chat rows of the primary.
+
+    Runs in every database that holds the chat tables; only the separate chat
+    database has anything to do. The primary has to be migrated first.
+    """
+    target = schema_editor.connection
+    if target.alias == 'default' or target.alias != getattr(settings, 'CHAT_DATABASE', 'default'):
+        return
+    if apps.get_model('blickers_app', 'ChatRoom').objects.using(target.alias).exists():
+        return
+
+    source = connections['default']
+    tables = source.introspection.table_names()
+    quote = target.ops.quote_name
+    with source.cursor() as reader, target.cursor() as writer:
+        for model_name in CHAT_TABLES:
+            model = apps.get_model('blickers_app', model_name)
+            if model._meta.db_table not in tables:
+                continue
+            # Raw rows, so that auto_now_add timestamps are kept as they are
+            fields = model._meta.concrete_fields
+            columns = ', '.join(quote(field.column) for field in fields)
+            placeholders = ', '.join(['%s'] * len(fields))
+            reader.execute(f'SELECT {columns} FROM {quote(model._meta.db_table)}')
+            while rows := reader.fetchmany(batch_size):
+                writer.executemany(f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows)
+        # The backfill of 0017 only ever ran in the primary
+        writer.execute(ROOM_BACKFILL_SQL)
+
+
+class Migration(migrations.Migration):
+    """Move the chat into its own database when CHAT_DB_PATH is set (see settings.py)
+
+    The unread message totals are now the sum of the room counters, kept with
+    the chat, so UnreadCounter only counts notifications.
+    """
+
+    dependencies = [
+        ('blickers_app', '0020_chat_database'),
+    ]
+
+    operations = [
+        # The model_name hint sends this to the databases holding the chat tables (see ChatRouter.allow_migrate)
+        migrations.RunPython(move_chat_rows, migrations.RunPython.noop, hints={'model_name': 'chatroom'}),
+        migrations.RemoveField(
+            model_name='unreadcounter',
+            name='messages',
+        ),
+    ]
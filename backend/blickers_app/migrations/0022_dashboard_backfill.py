@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-17 14:25
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+# DashboardSnapshot counter -> (model, date field), as DASHBOARD_COUNTERS in signals.py
+COUNTERS = {
+    'new_users': ('User', 'date_joined'),
+    'posts': ('Post', 'created_at'),
+    'comments': ('PostComment', 'created_at'),
+    'topics': ('ForumTopic', 'created_at'),
+    'replies': ('ForumReply', 'created_at'),
+    'reactions': ('Reaction', 'created_at'),
+    'messages': ('Message', 'timestamp'),
+    # Login history is not stored, so the last login of each user is the best available data
+    'logins': ('User', 'last_login'),
+}
+
+
+def backfill_snapshots(apps, schema_editor):
+    """Rebuild the daily counters from the existing rows, as rebuild_dashboard_snapshot does
+
+    0012 created the table empty: until now the days before it were missing,
+    e.g. total_users only counted the users who joined since.
+    """
+    alias = schema_editor.connection.alias
+    days = defaultdict(dict)
+    for field, (model_name, date_field) in COUNTERS.items():
+        # Messages too: the primary is migrated before the chat moves out of it (see settings.py)
+        rows = (
+            apps.get_model('blickers_app', model_name).objects.using(alias)
+            .filter(**{f'{date_field}__isnull': False})
+            .annotate(day=TruncDate(date_field))
+            .values('day')
+            .annotate(total=Count('pk'))
+            .order_by()
+        )
+        for row in rows:
+            days[row['day']][field] = row['total']
+
+    DashboardSnapshot = apps.get_model('blickers_app', 'DashboardSnapshot')
+    DashboardSnapshot.objects.using(alias).all().delete()
+    DashboardSnapshot.objects.using(alias).bulk_create(
+        [DashboardSnapshot(date=day, **counters) for day, counters in days.items()],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0021_chat_database_backfill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop, hints={'model_name': 'dashboardsnapshot'}),
+    ]
@@ -0,0 +1,48 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# The triggers of 0015 did not survive Django's SQLite table rebuilds: those on
+# blickers_app_post were dropped with the old table, and the one on
+# blickers_app_user made any rebuild of the post table fail. The index is now
+# kept in sync by the Post and User signals in signals.py.
+TRIGGERS = [
+    'blickers_app_announcement_search_ai',
+    'blickers_app_announcement_search_au',
+    'blickers_app_announcement_search_ad',
+    'blickers_app_announcement_search_author_au',
+]
+
+FORWARD_SQL = [f'DROP TRIGGER IF EXISTS {trigger}' for trigger in TRIGGERS] + [
+    # Catch up with the changes a dropped trigger may have missed
+    'DELETE FROM blickers_app_announcement_search',
+    """
+    INSERT INTO blickers_app_announcement_search (rowid, title, content, author)
+    SELECT p.id, p.title, p.content, trim(u.first_name || ' ' || u.last_name || ' ' || u.username)
+    FROM blickers_app_post p JOIN blickers_app_user u ON u.id = p.created_by_id WHERE p.is_announcement
+    """,
+]
+
+# The CREATE TRIGGER statements of 0015
+REVERSE_SQL = import_module('blickers_app.migrations.0015_announcement_search_index').FORWARD_SQL[1:5]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains in search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0022_dashboard_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
@@ -0,0 +1,53 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# SQLite drops the triggers of 0014 whenever Django rebuilds the topic or reply
+# table (e.g. for an AlterField), after which new posts were never indexed.
+# The index is now kept in sync by the ForumTopic and ForumReply signals in
+# signals.py.
+TRIGGERS = [
+    'blickers_app_forum_search_topic_ai',
+    'blickers_app_forum_search_topic_au',
+    'blickers_app_forum_search_topic_ad',
+    'blickers_app_forum_search_reply_ai',
+    'blickers_app_forum_search_reply_au',
+    'blickers_app_forum_search_reply_ad',
+]
+
+FORWARD_SQL = [f'DROP TRIGGER IF EXISTS {trigger}' for trigger in TRIGGERS] + [
+    # Catch up with the posts a dropped trigger may have missed
+    'DELETE FROM blickers_app_forum_search',
+    """
+    INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+    SELECT id * 2, 'topic', id, id, title, content FROM blickers_app_forumtopic
+    """,
+    """
+    INSERT INTO blickers_app_forum_search (rowid, kind, object_id, topic_id, title, content)
+    SELECT id * 2 + 1, 'reply', id, topic_id, '', content FROM blickers_app_forumreply
+    """,
+]
+
+# The CREATE TRIGGER statements of 0014
+REVERSE_SQL = import_module('blickers_app.migrations.0014_forum_search_index').FORWARD_SQL[1:7]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains in search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0023_drop_announcement_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(REVERSE_SQL)),
+    ]
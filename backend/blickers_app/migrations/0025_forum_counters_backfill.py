@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from blickers_app.management.commands.backfill_forum_counters import backfill_topic_counters
+
+
+def backfill_forum_counters(apps, schema_editor):
+    """Compute the counters that 0013 added with defaults (no replies, active at migration time)
+
+    Until now they stayed wrong, in the forum listings and the category
+    totals, until backfill_forum_counters was run by hand.
+    """
+    backfill_topic_counters(
+        apps.get_model('blickers_app', 'ForumTopic'), apps.get_model('blickers_app', 'ForumReply'),
+        using=schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blickers_app', '0024_drop_forum_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_forum_counters, migrations.RunPython.noop, hints={'model_name': 'forumtopic'}),
+    ]
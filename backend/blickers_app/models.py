@@ -1,10 +1,12 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.conf import settings
+from django.db.models.functions import Coalesce, Greatest
+import datetime
 import uuid
 
 
@@ -31,17 +33,22 @@ class User(AbstractUser):
     education = models.CharField(max_length=200, blank=True, null=True)
     languages = models.JSONField(default=list, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # EmailBackend recherche l'utilisateur par email à chaque connexion
+            models.Index(fields=['email'], name='user_email_idx'),
+        ]
     
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
     
     def get_unread_messages_count(self):
-        """Retourne le nombre de messages non lus"""
-        return Message.objects.filter(receiver=self, is_read=False).count()
+        """Retourne le nombre de messages non lus (somme des compteurs par salle)"""
+        return ChatRoomUnread.objects.filter(user_id=self.pk).aggregate(total=models.Sum('count'))['total'] or 0
     
     def get_notifications_count(self):
-        """Retourne le nombre de notifications non lues"""
-        return Notification.objects.filter(user=self, is_read=False).count()
+        """Retourne le nombre de notifications non lues (compteur maintenu)"""
+        return UnreadCounter.objects.filter(user=self).values_list('notifications', flat=True).first() or 0
 
 
 class EventType(models.Model):
@@ -54,6 +61,16 @@ class EventType(models.Model):
         return self.name
 
 
+class EventQuerySet(models.QuerySet):
+    def with_registration_counts(self):
+        """Annoter chaque événement avec ses compteurs d'inscriptions par statut"""
+        return self.annotate(
+            registered_count=models.Count('registrations', filter=models.Q(registrations__status='REGISTERED')),
+            interested_count=models.Count('registrations', filter=models.Q(registrations__status='INTERESTED')),
+            attended_count=models.Count('registrations', filter=models.Q(registrations__status='ATTENDED')),
+        )
+
+
 class Event(models.Model):
     """Événements organisés par le BDE"""
     title = models.CharField(max_length=200)
@@ -78,6 +95,16 @@ class Event(models.Model):
     ])
     manually_set_status = models.BooleanField(default=False)  # Track if status was manually set
     
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Liste des événements filtrée et triée par date de début
+            models.Index(fields=['start_date'], name='event_start_date_idx'),
+            # Événements à venir (tableau de bord)
+            models.Index(fields=['end_date'], name='event_end_date_idx'),
+        ]
+    
     def __str__(self):
         return self.title
     
@@ -161,11 +188,26 @@ class EventRegistration(models.Model):
     
     class Meta:
         unique_together = ('event', 'user')
+        indexes = [
+            # Comptage des inscrits par statut (Event.objects.with_registration_counts)
+            models.Index(fields=['event', 'status'], name='registration_event_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.event.title} ({self.get_status_display()})"
 
 
+class ForumCategoryQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annoter chaque catégorie avec son nombre de sujets et de messages (sujets + réponses)"""
+        return self.annotate(
+            topics_total=models.Count('topics'),
+            replies_total=Coalesce(models.Sum('topics__reply_count'), 0),
+        ).annotate(
+            posts_total=models.F('topics_total') + models.F('replies_total'),
+        )
+
+
 class ForumCategory(models.Model):
     """Catégorie pour le forum (aide, questions, débats, etc.)"""
     name = models.CharField(max_length=100)
@@ -173,6 +215,8 @@ class ForumCategory(models.Model):
     icon = models.CharField(max_length=50, blank=True, null=True)  # Nom d'icône CSS
     order = models.PositiveIntegerField(default=0)  # Pour l'ordre d'affichage
     
+    objects = ForumCategoryQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Forum categories"
         ordering = ['order']
@@ -192,6 +236,9 @@ class ForumTopic(models.Model):
     is_pinned = models.BooleanField(default=False)  # Épinglé en haut du forum
     is_closed = models.BooleanField(default=False)  # Fermé aux nouvelles réponses
     views_count = models.PositiveIntegerField(default=0)
+    # Dénormalisés, maintenus par ForumReply.save() et le signal post_delete des réponses
+    reply_count = models.PositiveIntegerField(default=0, db_index=True)
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-is_pinned', '-created_at']
@@ -223,13 +270,24 @@ class ForumReply(models.Model):
     
     def __str__(self):
         return f"Réponse de {self.created_by.username} à {self.topic.title}"
+    
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        # Insert the reply and bump the topic counters in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                ForumTopic.objects.filter(pk=self.topic_id).update(
+                    reply_count=models.F('reply_count') + 1,
+                    last_activity_at=Greatest(models.F('last_activity_at'), self.created_at)
+                )
 
 
 class ChatRoom(models.Model):
     """Salle de chat privée entre deux utilisateurs ou plus"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, blank=True, null=True)  # Optionnel pour groupes
-    participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms')
+    participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms', through='ChatParticipant')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_group_chat = models.BooleanField(default=False)
@@ -238,30 +296,67 @@ class ChatRoom(models.Model):
         if self.is_group_chat and self.name:
             return f"Groupe: {self.name}"
         
-        participants_list = ", ".join([user.username for user in self.participants.all()])
+        participants_list = ", ".join([user.username for user in self.get_participants()])
         return f"Chat: {participants_list}"
     
+    def get_participants(self):
+        """Les participants de la salle
+
+        Les salles sont dans la base du chat et les utilisateurs dans la base
+        principale : on lit d'abord les identifiants, puis les utilisateurs.
+        """
+        user_ids = list(ChatParticipant.objects.filter(chatroom=self).values_list('user_id', flat=True))
+        return User.objects.filter(id__in=user_ids)
+    
     @property
     def last_message(self):
         return self.messages.order_by('-timestamp').first()
 
 
+class ChatParticipant(models.Model):
+    """Participation d'un utilisateur à une salle de chat (table de ChatRoom.participants)"""
+    chatroom = models.ForeignKey(ChatRoom, on_delete=models.CASCADE)
+    # L'utilisateur est dans une autre base : ni contrainte ni cascade (voir signals.py)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False)
+    
+    class Meta:
+        db_table = 'blickers_app_chatroom_participants'
+        unique_together = ('chatroom', 'user')
+
+
 class Message(models.Model):
     """Message envoyé dans un chat"""
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
-    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
+    # L'expéditeur est dans la base principale : ni contrainte ni cascade (voir signals.py)
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='sent_messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
-    read_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='read_messages', blank=True)
+    read_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='read_messages', blank=True, through='MessageRead')
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Historique paginé d'une salle (keyset sur timestamp, id)
+            models.Index(fields=['room', 'timestamp', 'id'], name='message_room_timestamp_idx'),
+            # Messages des dernières 24 heures (tableau de bord)
+            models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ]
     
     def __str__(self):
         return f"Message de {self.sender.username} à {self.timestamp}"
 
 
+class MessageRead(models.Model):
+    """Accusé de lecture d'un message (table de Message.read_by)"""
+    message = models.ForeignKey(Message, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False)
+    
+    class Meta:
+        db_table = 'blickers_app_message_read_by'
+        unique_together = ('message', 'user')
+
+
 class Post(models.Model):
     """Publication/annonce du BDE ou des étudiants (selon configuration)"""
     ANNOUNCEMENT_TYPES = (
@@ -286,6 +381,14 @@ class Post(models.Model):
     
     class Meta:
         ordering = ['-is_pinned', '-created_at']
+        indexes = [
+            # Fil des annonces : épinglées d'abord, puis les plus récentes. Index partiel,
+            # car SQLite n'utilise pas une colonne booléenne nue (WHERE is_announcement) comme clé
+            models.Index(
+                fields=['-is_pinned', '-created_at'], condition=models.Q(is_announcement=True),
+                name='post_announcement_feed_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.title
@@ -307,9 +410,10 @@ class Post(models.Model):
         return min(100, int((total_interactions / self.views_count) * 100))
     
     def increment_views(self):
-        """Increment the views count"""
-        self.views_count += 1
-        self.save(update_fields=['views_count'])
+        """Record a view through the buffered view counter instead of saving the row"""
+        from .view_counter import view_counter
+        # Reflect the views not yet flushed to the database, including this one
+        self.views_count += view_counter.add(Post, self.pk)
 
 
 class PostComment(models.Model):
@@ -374,6 +478,12 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dernières notifications d'un utilisateur
+            models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
+            # Notifications non lues d'un utilisateur (marquage comme lues, compteurs)
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread_idx'),
+        ]
     
     def __str__(self):
         return f"Notification pour {self.user.username}: {self.title}"
@@ -406,6 +516,12 @@ class Report(models.Model):
     handled_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, 
                                  null=True, blank=True, related_name='reports_handled')
     resolution_note = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # File de modération : signalements en attente, les plus récents d'abord
+            models.Index(fields=['status', 'created_at'], name='report_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Signalement de {self.reporter.username} - {self.get_content_type_display()}"
@@ -428,6 +544,116 @@ class Settings(models.Model):
         return f"Paramètres de {self.school_name}"
 
 
+class DashboardSnapshot(models.Model):
+    """Compteurs d'activité journaliers pour le tableau de bord d'administration.
+
+    Les compteurs sont mis à jour de façon incrémentale par les signaux de
+    ``signals.py`` et peuvent être reconstruits avec la commande
+    ``rebuild_dashboard_snapshot``.
+    """
+    COUNTER_FIELDS = ('new_users', 'logins', 'posts', 'comments', 'topics', 'replies', 'reactions', 'messages')
+    
+    date = models.DateField(unique=True)
+    new_users = models.PositiveIntegerField(default=0)
+    # Utilisateurs qui se sont connectés ce jour-là (une fois chacun, pas le nombre de connexions)
+    logins = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    topics = models.PositiveIntegerField(default=0)
+    replies = models.PositiveIntegerField(default=0)
+    reactions = models.PositiveIntegerField(default=0)
+    messages = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"Activité du {self.date}"
+    
+    @property
+    def activity(self):
+        """Activité totale de la journée (connexions et contenus créés)"""
+        return self.logins + self.posts + self.comments + self.topics + self.replies
+    
+    @classmethod
+    def increment(cls, field, when, delta=1):
+        """Ajouter ``delta`` au compteur ``field`` du jour correspondant à ``when``"""
+        if when is None:
+            return
+        day = timezone.localtime(when).date() if isinstance(when, datetime.datetime) else when
+        if delta < 0:
+            # Never go below zero, e.g. when deleting rows older than the last rebuild
+            cls.objects.filter(date=day).update(**{field: Greatest(models.F(field) + delta, 0)})
+            return
+        if not cls.objects.filter(date=day).update(**{field: models.F(field) + delta}):
+            cls.objects.get_or_create(date=day)
+            cls.objects.filter(date=day).update(**{field: models.F(field) + delta})
+
+
+def _group_by_delta(deltas):
+    """{key: delta} -> {delta: [keys]} so each distinct delta costs one UPDATE"""
+    groups = {}
+    for key, delta in deltas.items():
+        if delta:
+            groups.setdefault(delta, []).append(key)
+    return groups
+
+
+class UnreadCounter(models.Model):
+    """Compteur de notifications non lues d'un utilisateur (badge).
+
+    Maintenu de façon incrémentale par ``unread.py`` et reconstruit avec la
+    commande ``rebuild_unread_counters``. Le total des messages non lus est la
+    somme des ChatRoomUnread, qui restent dans la base du chat.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    notifications = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Non lus de {self.user_id}: {self.notifications} notifications"
+    
+    @classmethod
+    def add(cls, field, deltas):
+        """Ajouter à ``field`` le delta de chaque utilisateur (``{user_id: delta}``)"""
+        groups = _group_by_delta(deltas)
+        if any(delta > 0 for delta in groups):
+            cls.objects.bulk_create(
+                [cls(user_id=user_id) for delta, user_ids in groups.items() if delta > 0 for user_id in user_ids],
+                ignore_conflicts=True
+            )
+        for delta, user_ids in groups.items():
+            # Never go below zero, e.g. for rows read before the last rebuild
+            value = models.F(field) + delta if delta > 0 else Greatest(models.F(field) + delta, 0)
+            cls.objects.filter(user_id__in=user_ids).update(**{field: value})
+
+
+class ChatRoomUnread(models.Model):
+    """Nombre de messages non lus d'un participant dans une salle de chat"""
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='unread_counts')
+    # Stocké avec les salles, dans la base du chat (voir signals.py pour la suppression)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='chat_unread_counts')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('user', 'room')
+    
+    def __str__(self):
+        return f"{self.count} non lus pour {self.user_id} dans {self.room_id}"
+    
+    @classmethod
+    def add(cls, room_id, deltas):
+        """Ajouter au compteur de la salle le delta de chaque participant (``{user_id: delta}``)"""
+        groups = _group_by_delta(deltas)
+        if any(delta > 0 for delta in groups):
+            cls.objects.bulk_create(
+                [cls(room_id=room_id, user_id=user_id) for delta, user_ids in groups.items() if delta > 0 for user_id in user_ids],
+                ignore_conflicts=True
+            )
+        for delta, user_ids in groups.items():
+            value = models.F('count') + delta if delta > 0 else Greatest(models.F('count') + delta, 0)
+            cls.objects.filter(room_id=room_id, user_id__in=user_ids).update(count=value)
+
+
 class TwoFactorAuth(models.Model):
     """Two-factor authentication settings for users"""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='two_factor')
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import QuerySet
+
+from .models import Notification, NotificationType, UnreadCounter
+from .unread import get_unread_counts, unread_counts_event
+
+logger = logging.getLogger(__name__)
+
+# A single worker keeps fan-outs in order and never competes with itself for the database
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notifications')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _chunks(user_ids, size):
+    if isinstance(user_ids, QuerySet):
+        user_ids = user_ids.iterator(chunk_size=size)
+    iterator = iter(user_ids)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def notify_users(user_ids, title, message, notification_type, link=None, related_object=None):
+    """Create a notification for every user in ``user_ids`` and push it to their sockets.
+
+    The work runs on a background thread once the current transaction commits,
+    so a request that notifies thousands of users returns immediately.
+    ``user_ids`` may be a lazy ``values_list('id', flat=True)`` queryset; it is
+    evaluated by the worker. Set ``NOTIFICATION_DISPATCH_ASYNC = False`` to run
+    inline (tests, management commands).
+    """
+    job_kwargs = {
+        'user_ids': user_ids,
+        'title': title,
+        'message': message,
+        'notification_type': notification_type,
+        'link': link,
+        'related_object': related_object,
+    }
+    if not _setting('NOTIFICATION_DISPATCH_ASYNC', True):
+        transaction.on_commit(lambda: dispatch_notifications(**job_kwargs))
+        return
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, job_kwargs))
+
+
+def _run_in_background(job_kwargs):
+    try:
+        dispatch_notifications(**job_kwargs)
+    except Exception:
+        logger.exception('Notification dispatch failed')
+    finally:
+        # The worker thread owns its own connections; don't leak them
+        connections.close_all()
+
+
+def dispatch_notifications(user_ids, title, message, notification_type, link=None, related_object=None, batch_size=None):
+    """Store and push notifications batch by batch; returns the timing of every batch.
+
+    Each batch is one ``bulk_create`` and one unread-counter update, followed
+    by concurrent ``group_send`` calls (the notification, then the new badge)
+    to the ``notifications_<user_id>`` groups, at most
+    ``NOTIFICATION_PUSH_CONCURRENCY`` users in flight at once.
+    """
+    batch_size = batch_size or _setting('NOTIFICATION_BATCH_SIZE', 1000)
+    if not isinstance(notification_type, NotificationType):
+        notification_type, _ = NotificationType.objects.get_or_create(name=notification_type)
+    related_object_type = related_object._meta.model_name if related_object is not None else None
+    related_object_id = related_object.pk if related_object is not None else None
+    channel_layer = get_channel_layer()
+
+    reports = []
+    for number, chunk in enumerate(_chunks(user_ids, batch_size), start=1):
+        started = time.perf_counter()
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                title=title,
+                message=message,
+                notification_type=notification_type,
+                link=link,
+                related_object_id=related_object_id,
+                related_object_type=related_object_type,
+            )
+            for user_id in chunk
+        ])
+        # bulk_create skips post_save, so bump the unread badges here
+        UnreadCounter.add('notifications', Counter(chunk))
+        inserted = time.perf_counter()
+
+        if channel_layer is not None:
+            unread_counts = get_unread_counts(set(chunk), room_ids=[])
+            async_to_sync(_push)(channel_layer, notifications, notification_type.name, unread_counts)
+        pushed = time.perf_counter()
+
+        report = {
+            'batch': number,
+            'size': len(notifications),
+            'insert_ms': (inserted - started) * 1000,
+            'push_ms': (pushed - inserted) * 1000,
+        }
+        reports.append(report)
+        logger.info(
+            'Notification batch %(batch)d: %(size)d rows, insert %(insert_ms).1f ms, push %(push_ms).1f ms', report
+        )
+    return reports
+
+
+async def _push(channel_layer, notifications, type_name, unread_counts):
+    semaphore = asyncio.Semaphore(_setting('NOTIFICATION_PUSH_CONCURRENCY', 100))
+
+    async def send(notification):
+        async with semaphore:
+            await channel_layer.group_send(f'notifications_{notification.user_id}', {
+                'type': 'notification',
+                'notification_id': notification.id,
+                'title': notification.title,
+                'message': notification.message,
+                'notification_type': type_name,
+                'created_at': notification.created_at.isoformat(),
+                'link': notification.link or '',
+            })
+            # Then the new badge, so clients never poll the counters
+            await channel_layer.group_send(
+                f'notifications_{notification.user_id}', unread_counts_event(unread_counts[notification.user_id])
+            )
+
+    # One user's socket going away must not stop the rest of the batch
+    results = await asyncio.gather(*(send(notification) for notification in notifications), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning('%d of %d notification pushes failed: %r', len(failures), len(results), failures[0])
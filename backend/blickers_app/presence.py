@@ -0,0 +1,106 @@
+import asyncio
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import User
+
+
+def _connections_key(user_id):
+    return f'presence:connections:{user_id}'
+
+
+class PresenceTracker:
+    """Track live websocket connections per user and persist online status in batches.
+
+    Connection counts live in the Django cache, so they are shared by every
+    worker when a Redis cache is configured. A user is online while at least one
+    connection is open, which keeps ``is_online`` right with several tabs.
+    Transitions are written ``PRESENCE_FLUSH_DELAY`` seconds later with one
+    ``update()`` per state, using the connection count at that time: a
+    disconnect followed by a quick reconnect never reaches the ``User`` table.
+    """
+
+    def __init__(self):
+        self._dirty = set()
+        self._flush_handle = None
+
+    @property
+    def flush_delay(self):
+        return getattr(settings, 'PRESENCE_FLUSH_DELAY', 2)
+
+    @property
+    def timeout(self):
+        # Counts expire eventually in case a worker dies without closing its connections
+        return getattr(settings, 'PRESENCE_TIMEOUT', 60 * 60 * 24)
+
+    async def connect(self, user_id):
+        """Register a new connection; returns True if the user just came online"""
+        key = _connections_key(user_id)
+        await cache.aadd(key, 0, self.timeout)
+        try:
+            count = await cache.aincr(key)
+        except ValueError:
+            # The key expired between add() and incr()
+            await cache.aset(key, 1, self.timeout)
+            count = 1
+        if count == 1:
+            self._mark_dirty(user_id)
+        return count == 1
+
+    async def disconnect(self, user_id):
+        """Unregister a connection; returns True if it was the user's last one"""
+        key = _connections_key(user_id)
+        try:
+            count = await cache.adecr(key)
+        except ValueError:
+            count = 0
+        if count <= 0:
+            await cache.adelete(key)
+            self._mark_dirty(user_id)
+        return count <= 0
+
+    async def is_online(self, user_id):
+        return (await cache.aget(_connections_key(user_id), 0)) > 0
+
+    def _mark_dirty(self, user_id):
+        self._dirty.add(user_id)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Persist the current status of every user whose connection count changed"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        counts = await cache.aget_many([_connections_key(user_id) for user_id in dirty])
+        online = [user_id for user_id in dirty if counts.get(_connections_key(user_id), 0) > 0]
+        offline = [user_id for user_id in dirty if counts.get(_connections_key(user_id), 0) <= 0]
+        await database_sync_to_async(self._write)(online, offline)
+
+    @staticmethod
+    def _write(online, offline):
+        # Only touch rows whose status actually changes
+        if online:
+            User.objects.filter(id__in=online, is_online=False).update(is_online=True)
+        if offline:
+            User.objects.filter(id__in=offline, is_online=True).update(is_online=False, last_online=timezone.now())
+
+
+_trackers = weakref.WeakKeyDictionary()
+
+
+def get_presence_tracker():
+    """Return the PresenceTracker bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    tracker = _trackers.get(loop)
+    if tracker is None:
+        tracker = _trackers[loop] = PresenceTracker()
+    return tracker
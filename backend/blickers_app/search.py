@@ -0,0 +1,446 @@
+import html
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Event, ForumReply, ForumTopic, Post, User
+
+FORUM_SEARCH_TABLE = 'blickers_app_forum_search'
+ANNOUNCEMENT_SEARCH_TABLE = 'blickers_app_announcement_search'
+GLOBAL_SEARCH_TABLE = 'blickers_app_global_search'
+
+# Control characters never appear in user text, so highlight() can use them as
+# markers and the text can be HTML-escaped before they become <mark> tags
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+MAX_QUERY_TERMS = 10
+SNIPPET_TOKENS = 24
+
+
+def uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 MATCH expression: every word must match, as a prefix.
+
+    Each term is quoted, so FTS5 operators typed by the user (AND, NEAR, *, ")
+    are searched for as plain words instead of raising a syntax error.
+    """
+    terms = re.findall(r'\w+', text.lower())[:MAX_QUERY_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def render_highlight(text):
+    """HTML-escape FTS output and turn the match markers into <mark> tags"""
+    return html.escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _fallback_snippet(text, length=160):
+    text = text or ''
+    return html.escape(text[:length] + '...' if len(text) > length else text)
+
+
+def search_forum(text, limit, offset=0):
+    """Search forum topics and replies, best matches first.
+
+    Returns ``(total, hits)`` where each hit is a dict with ``kind`` ('topic'
+    or 'reply'), ``object_id``, ``topic_id``, ``score`` (higher is better),
+    and HTML-safe ``title`` and ``snippet`` with the matched terms in <mark>.
+    """
+    match = build_match_query(text)
+    if not match:
+        return 0, []
+    if not uses_fts():
+        return _search_forum_fallback(text, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {FORUM_SEARCH_TABLE} WHERE {FORUM_SEARCH_TABLE} MATCH %s', [match])
+        total = cursor.fetchone()[0]
+        if not total or offset >= total:
+            return total, []
+        # bm25() weights follow the column order: a title hit counts ten times a content hit
+        cursor.execute(
+            f'''
+            SELECT kind, object_id, topic_id,
+                   bm25({FORUM_SEARCH_TABLE}, 0, 0, 0, 10.0, 1.0) AS rank,
+                   highlight({FORUM_SEARCH_TABLE}, 3, %s, %s),
+                   snippet({FORUM_SEARCH_TABLE}, 4, %s, %s, '...', %s)
+            FROM {FORUM_SEARCH_TABLE}
+            WHERE {FORUM_SEARCH_TABLE} MATCH %s
+            ORDER BY rank
+            LIMIT %s OFFSET %s
+            ''',
+            [MARK_START, MARK_END, MARK_START, MARK_END, SNIPPET_TOKENS, match, limit, offset],
+        )
+        rows = cursor.fetchall()
+
+    return total, [{
+        'kind': kind,
+        'object_id': int(object_id),
+        'topic_id': int(topic_id),
+        'score': -rank,  # bm25() is negative, lower is better
+        'title': render_highlight(title),
+        'snippet': render_highlight(snippet),
+    } for kind, object_id, topic_id, rank, title, snippet in rows]
+
+
+def _search_forum_fallback(text, limit, offset):
+    # Unranked icontains search for databases without FTS5
+    topics = ForumTopic.objects.filter(Q(title__icontains=text) | Q(content__icontains=text)).order_by('-created_at')
+    replies = ForumReply.objects.filter(content__icontains=text).order_by('-created_at')
+    topic_total = topics.count()
+    total = topic_total + replies.count()
+
+    hits = [{
+        'kind': 'topic',
+        'object_id': topic.id,
+        'topic_id': topic.id,
+        'score': 0,
+        'title': html.escape(topic.title),
+        'snippet': _fallback_snippet(topic.content),
+    } for topic in topics[offset:offset + limit]]
+    if len(hits) < limit:
+        reply_offset = max(0, offset - topic_total)
+        hits += [{
+            'kind': 'reply',
+            'object_id': reply.id,
+            'topic_id': reply.topic_id,
+            'score': 0,
+            'title': '',
+            'snippet': _fallback_snippet(reply.content),
+        } for reply in replies[reply_offset:reply_offset + limit - len(hits)]]
+    return total, hits
+
+
+# Saves touching none of these leave the forum index alone
+FORUM_INDEX_FIELDS = {
+    ForumTopic: frozenset(['title', 'content']),
+    ForumReply: frozenset(['content', 'topic', 'topic_id']),
+}
+
+
+def _forum_rowid(instance):
+    # Topics and replies share the table: even rowids for topics, odd ones for replies
+    return instance.pk * 2 if isinstance(instance, ForumTopic) else instance.pk * 2 + 1
+
+
+def index_forum_post(instance, update_fields=None):
+    """Add or refresh one forum topic or reply in the forum index"""
+    if not uses_fts() or (update_fields is not None and FORUM_INDEX_FIELDS[type(instance)].isdisjoint(update_fields)):
+        return
+    if isinstance(instance, ForumTopic):
+        row = [_forum_rowid(instance), 'topic', instance.pk, instance.pk, instance.title, instance.content]
+    else:
+        row = [_forum_rowid(instance), 'reply', instance.pk, instance.topic_id, '', instance.content]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = %s', [row[0]])
+        cursor.execute(
+            f'INSERT INTO {FORUM_SEARCH_TABLE} (rowid, kind, object_id, topic_id, title, content) VALUES (%s, %s, %s, %s, %s, %s)',
+            row,
+        )
+
+
+def unindex_forum_post(instance):
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = %s', [_forum_rowid(instance)])
+
+
+def rebuild_forum_index():
+    """Re-index every forum topic and reply; returns the number of indexed rows"""
+    if not uses_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FORUM_SEARCH_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {FORUM_SEARCH_TABLE} (rowid, kind, object_id, topic_id, title, content) "
+            f"SELECT id * 2, 'topic', id, id, title, content FROM {ForumTopic._meta.db_table}"
+        )
+        cursor.execute(
+            f"INSERT INTO {FORUM_SEARCH_TABLE} (rowid, kind, object_id, topic_id, title, content) "
+            f"SELECT id * 2 + 1, 'reply', id, topic_id, '', content FROM {ForumReply._meta.db_table}"
+        )
+        # Merge the index b-trees now that it was rewritten in one go
+        cursor.execute(f"INSERT INTO {FORUM_SEARCH_TABLE} ({FORUM_SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FORUM_SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_announcements(announcements, text):
+    """Restrict an announcement queryset to the posts matching ``text``.
+
+    The FTS5 table is joined into the same query, so the result still
+    composes with filters, ordering, slicing and ``count()``. Each row gets
+    ``search_score`` (higher is better; order by ``-search_score`` for
+    relevance) and HTML-safe ``search_title`` / ``search_snippet``.
+    """
+    match = build_match_query(text)
+    if not match:
+        return announcements.none()
+    if not uses_fts():
+        return announcements.filter(
+            Q(title__icontains=text) |
+            Q(content__icontains=text) |
+            Q(created_by__username__icontains=text) |
+            Q(created_by__first_name__icontains=text) |
+            Q(created_by__last_name__icontains=text)
+        ).annotate(
+            search_score=Value(0.0),
+            search_title=Value(None, output_field=TextField()),
+            search_snippet=Value(None, output_field=TextField()),
+        )
+
+    table = ANNOUNCEMENT_SEARCH_TABLE
+
+    def matched(expression, output_field):
+        # FTS5 auxiliary functions only run in a query that MATCHes their table:
+        # a subquery per column, looking up this post's row of the full-text match
+        return RawSQL(
+            f'SELECT {expression} FROM {table} WHERE {table} MATCH %s AND {table}.rowid = {Post._meta.db_table}.id',
+            (match,),
+            output_field=output_field,
+        )
+
+    return announcements.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (match,))
+    ).annotate(
+        # Weights follow the column order: title, content, author
+        search_score=matched(f'-bm25({table}, 10.0, 1.0, 2.0)', FloatField()),
+        search_title=matched(f'highlight({table}, 0, char(2), char(3))', TextField()),
+        search_snippet=matched(f"snippet({table}, 1, char(2), char(3), '...', {SNIPPET_TOKENS})", TextField()),
+    )
+
+
+# Saves touching none of these leave the announcement index alone
+ANNOUNCEMENT_INDEX_FIELDS = frozenset(['title', 'content', 'is_announcement', 'created_by'])
+AUTHOR_NAME_FIELDS = ('first_name', 'last_name', 'username')
+
+
+def announcement_author(user):
+    return ' '.join(getattr(user, field) or '' for field in AUTHOR_NAME_FIELDS).strip(' ')
+
+
+def index_announcement(post, update_fields=None):
+    """Add, refresh or drop one post in the announcement index"""
+    if not uses_fts() or (update_fields is not None and ANNOUNCEMENT_INDEX_FIELDS.isdisjoint(update_fields)):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ANNOUNCEMENT_SEARCH_TABLE} WHERE rowid = %s', [post.pk])
+        if post.is_announcement:
+            cursor.execute(
+                f'INSERT INTO {ANNOUNCEMENT_SEARCH_TABLE} (rowid, title, content, author) VALUES (%s, %s, %s, %s)',
+                [post.pk, post.title, post.content, announcement_author(post.created_by)],
+            )
+
+
+def unindex_announcement(post):
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ANNOUNCEMENT_SEARCH_TABLE} WHERE rowid = %s', [post.pk])
+
+
+def reindex_author_announcements(user):
+    """Store the new name of ``user`` with each of their announcements"""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {ANNOUNCEMENT_SEARCH_TABLE} SET author = %s WHERE rowid IN '
+            f'(SELECT id FROM {Post._meta.db_table} WHERE created_by_id = %s AND is_announcement)',
+            [announcement_author(user), user.pk],
+        )
+
+
+def rebuild_announcement_index():
+    """Re-index every announcement; returns the number of indexed rows"""
+    if not uses_fts():
+        return 0
+    post_table = Post._meta.db_table
+    user_table = Post._meta.get_field('created_by').related_model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ANNOUNCEMENT_SEARCH_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {ANNOUNCEMENT_SEARCH_TABLE} (rowid, title, content, author) "
+            f"SELECT p.id, p.title, p.content, trim(u.first_name || ' ' || u.last_name || ' ' || u.username) "
+            f"FROM {post_table} p JOIN {user_table} u ON u.id = p.created_by_id WHERE p.is_announcement"
+        )
+        cursor.execute(f"INSERT INTO {ANNOUNCEMENT_SEARCH_TABLE} ({ANNOUNCEMENT_SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {ANNOUNCEMENT_SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _event_document(event):
+    if not event.is_published:
+        return None
+    return event.title, f'{event.description} {event.location}'
+
+
+def _announcement_document(post):
+    if not post.is_announcement:
+        return None
+    return post.title, post.content
+
+
+def _topic_document(topic):
+    return topic.title, topic.content
+
+
+def _user_document(user):
+    if not user.is_active:
+        return None
+    return f'{user.first_name} {user.last_name} {user.username}'.strip(), user.major or ''
+
+
+class SearchKind:
+    """How one model is stored in the global search index"""
+
+    def __init__(self, name, model, code, document, fields, fallback_fields, filters=None):
+        self.name = name
+        self.model = model
+        self.code = code  # rowid = pk * len(GLOBAL_SEARCH_KINDS) + code
+        self.document = document  # instance -> (title, body), or None to leave it out
+        self.fields = frozenset(fields)  # saves touching none of these don't re-index
+        self.fallback_fields = fallback_fields
+        self.filters = filters or {}  # the rows document() keeps, as queryset filters
+
+    def rowid(self, pk):
+        return pk * len(GLOBAL_SEARCH_KINDS) + self.code
+
+    def queryset(self):
+        return self.model.objects.filter(**self.filters)
+
+
+GLOBAL_SEARCH_KINDS = {
+    kind.name: kind for kind in (
+        SearchKind('event', Event, 0, _event_document,
+                   ['title', 'description', 'location', 'is_published'], ['title', 'description', 'location'],
+                   {'is_published': True}),
+        SearchKind('announcement', Post, 1, _announcement_document,
+                   ['title', 'content', 'is_announcement'], ['title', 'content'],
+                   {'is_announcement': True}),
+        SearchKind('topic', ForumTopic, 2, _topic_document,
+                   ['title', 'content'], ['title', 'content']),
+        SearchKind('user', User, 3, _user_document,
+                   ['first_name', 'last_name', 'username', 'major', 'is_active'], ['first_name', 'last_name', 'username', 'major'],
+                   {'is_active': True}),
+    )
+}
+GLOBAL_SEARCH_MODELS = {kind.model: kind for kind in GLOBAL_SEARCH_KINDS.values()}
+
+
+def index_instance(instance, update_fields=None):
+    """Add, refresh or drop one object in the global search index"""
+    kind = GLOBAL_SEARCH_MODELS[type(instance)]
+    if not uses_fts() or (update_fields is not None and kind.fields.isdisjoint(update_fields)):
+        return
+    document = kind.document(instance)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {GLOBAL_SEARCH_TABLE} WHERE rowid = %s', [kind.rowid(instance.pk)])
+        if document is not None:
+            cursor.execute(
+                f'INSERT INTO {GLOBAL_SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)',
+                [kind.rowid(instance.pk), kind.name, instance.pk, *document],
+            )
+
+
+def unindex_instance(instance):
+    kind = GLOBAL_SEARCH_MODELS[type(instance)]
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {GLOBAL_SEARCH_TABLE} WHERE rowid = %s', [kind.rowid(instance.pk)])
+
+
+def search_global(text, kinds=None, limit=5):
+    """Search every indexed kind in one query, keeping the ``limit`` best hits of each.
+
+    Returns ``{kind: {'total': int, 'hits': [{'object_id', 'score', 'title', 'snippet'}]}}``
+    for the requested kinds, best hits first.
+    """
+    kinds = [kind for kind in (kinds or GLOBAL_SEARCH_KINDS) if kind in GLOBAL_SEARCH_KINDS]
+    groups = {kind: {'total': 0, 'hits': []} for kind in kinds}
+    match = build_match_query(text)
+    if not match or not kinds:
+        return groups
+    if not uses_fts():
+        return _search_global_fallback(text, kinds, limit)
+
+    table = GLOBAL_SEARCH_TABLE
+    kind_placeholders = ', '.join(['%s'] * len(kinds))
+    with connection.cursor() as cursor:
+        # Rank inside each kind with a window function so one query serves every group
+        cursor.execute(
+            f'''
+            SELECT kind, object_id, rank, title, snippet, total FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY kind ORDER BY rank) AS position,
+                       COUNT(*) OVER (PARTITION BY kind) AS total
+                FROM (
+                    SELECT kind, object_id,
+                           bm25({table}, 0, 0, 5.0, 1.0) AS rank,
+                           highlight({table}, 2, %s, %s) AS title,
+                           snippet({table}, 3, %s, %s, '...', %s) AS snippet
+                    FROM {table}
+                    WHERE {table} MATCH %s AND kind IN ({kind_placeholders})
+                )
+            )
+            WHERE position <= %s
+            ORDER BY kind, position
+            ''',
+            [MARK_START, MARK_END, MARK_START, MARK_END, SNIPPET_TOKENS, match, *kinds, limit],
+        )
+        for kind, object_id, rank, title, snippet, total in cursor.fetchall():
+            groups[kind]['total'] = total
+            groups[kind]['hits'].append({
+                'object_id': int(object_id),
+                'score': -rank,
+                'title': render_highlight(title),
+                'snippet': render_highlight(snippet),
+            })
+    return groups
+
+
+def _search_global_fallback(text, kinds, limit):
+    # Unranked icontains search for databases without FTS5
+    groups = {}
+    for name in kinds:
+        kind = GLOBAL_SEARCH_KINDS[name]
+        condition = Q()
+        for field in kind.fallback_fields:
+            condition |= Q(**{f'{field}__icontains': text})
+        matches = kind.queryset().filter(condition).order_by('-pk')
+        hits = []
+        for instance in matches[:limit]:
+            title, body = kind.document(instance)
+            hits.append({'object_id': instance.pk, 'score': 0, 'title': html.escape(title), 'snippet': _fallback_snippet(body)})
+        groups[name] = {'total': matches.count(), 'hits': hits}
+    return groups
+
+
+def rebuild_global_index(batch_size=1000):
+    """Re-index every event, announcement, forum topic and user; returns the number of indexed rows"""
+    if not uses_fts():
+        return 0
+    indexed = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {GLOBAL_SEARCH_TABLE}')
+        for kind in GLOBAL_SEARCH_KINDS.values():
+            rows = []
+            for instance in kind.queryset().iterator(chunk_size=batch_size):
+                document = kind.document(instance)
+                if document is not None:
+                    rows.append((kind.rowid(instance.pk), kind.name, instance.pk, *document))
+                if len(rows) >= batch_size:
+                    cursor.executemany(f'INSERT INTO {GLOBAL_SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)', rows)
+                    indexed += len(rows)
+                    rows = []
+            if rows:
+                cursor.executemany(f'INSERT INTO {GLOBAL_SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)', rows)
+                indexed += len(rows)
+        cursor.execute(f"INSERT INTO {GLOBAL_SEARCH_TABLE} ({GLOBAL_SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
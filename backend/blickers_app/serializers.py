@@ -1,10 +1,11 @@
-from datetime import timezone
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import ChatRoom, Message, User, Post, Reaction
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from .models import Event, ForumTopic
+from .images import PICTURE_PRESETS, derivative_url, derivative_urls
 
 User = get_user_model()
 
@@ -96,8 +97,15 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'is_online', 'last_online']
 
 
+class ChatParticipantSerializer(serializers.ModelSerializer):
+    """Short participant summary for chat listings"""
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture', 'is_online']
+
+
 class MessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer(read_only=True)
+    sender = ChatParticipantSerializer(read_only=True)
     formatted_timestamp = serializers.SerializerMethodField()
     
     class Meta:
@@ -109,7 +117,7 @@ class MessageSerializer(serializers.ModelSerializer):
 
 
 class ChatRoomSerializer(serializers.ModelSerializer):
-    participants = UserSerializer(many=True, read_only=True)
+    participants = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
     
@@ -118,40 +126,71 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'participants', 'created_at', 'updated_at', 
                   'is_group_chat', 'last_message', 'unread_count']
     
+    def get_participants(self, obj):
+        # The inbox view attaches the participants of a whole page at once
+        if hasattr(obj, 'prefetched_participants'):
+            participants = obj.prefetched_participants
+        else:
+            participants = obj.get_participants().order_by('id')
+        return ChatParticipantSerializer(participants, many=True).data
+    
     def get_last_message(self, obj):
-        last_msg = obj.messages.order_by('-timestamp').first()
+        # The inbox view attaches the last messages of a whole page at once
+        if hasattr(obj, 'prefetched_last_message'):
+            last_msg = obj.prefetched_last_message
+        else:
+            last_msg = obj.messages.order_by('-timestamp').first()
         if last_msg:
             return MessageSerializer(last_msg).data
         return None
     
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread'):
+            return obj.unread  # annotated by chat_views.inbox_queryset
         user = self.context.get('request').user if self.context.get('request') else None
         if user:
-            return obj.messages.filter(is_read=False).exclude(sender=user).count()
+            # Maintained per-participant counter (see unread.py)
+            return obj.unread_counts.filter(user=user).values_list('count', flat=True).first() or 0
         return 0
     
 
 class EventSerializer(serializers.ModelSerializer):
     registered = serializers.SerializerMethodField()
+    interested = serializers.SerializerMethodField()
+    attended = serializers.SerializerMethodField()
     createdDate = serializers.SerializerMethodField()
     time = serializers.SerializerMethodField()
     endTime = serializers.SerializerMethodField()
     date = serializers.SerializerMethodField()
     type = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'type', 'date', 'time', 'endTime',
-            'location', 'capacity', 'registered', 'status', 'image', 'createdDate',
+            'location', 'capacity', 'registered', 'interested', 'attended', 'status', 'image', 'image_variants', 'createdDate',
             'start_date', 'end_date', 'start_time', 'end_time', 'is_published',
             'created_by', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
     
+    def _registration_count(self, obj, annotation, registration_status):
+        # Use the counts annotated by Event.objects.with_registration_counts() when available
+        count = getattr(obj, annotation, None)
+        if count is not None:
+            return count
+        return obj.registrations.filter(status=registration_status).count()
+    
     def get_registered(self, obj):
-        return obj.registrations.filter(status='REGISTERED').count()
+        return self._registration_count(obj, 'registered_count', 'REGISTERED')
+    
+    def get_interested(self, obj):
+        return self._registration_count(obj, 'interested_count', 'INTERESTED')
+    
+    def get_attended(self, obj):
+        return self._registration_count(obj, 'attended_count', 'ATTENDED')
     
     def get_createdDate(self, obj):
         return obj.created_at.strftime("%b %d, %Y")
@@ -171,13 +210,20 @@ class EventSerializer(serializers.ModelSerializer):
         return obj.event_type.name if obj.event_type else "Other"
         
     def get_image(self, obj):
+        request = self.context.get('request')
+        # Lists ask for a resized copy (see images.py); the other views return the original upload
+        preset = self.context.get('image_preset')
+        if preset:
+            return derivative_url(obj.image, preset, request=request)
         if obj.image:
-            request = self.context.get('request')
             if request:
                 # Ensure we're using the correct domain and protocol
                 return request.build_absolute_uri(obj.image.url)
             return obj.image.url
         return None
+    
+    def get_image_variants(self, obj):
+        return derivative_urls(obj.image, PICTURE_PRESETS, self.context.get('request'))
 
 class ForumTopicListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name')
@@ -198,11 +244,10 @@ class ForumTopicListSerializer(serializers.ModelSerializer):
         }
     
     def get_replies_count(self, obj):
-        return obj.replies.count()
+        return obj.reply_count
         
     def get_last_activity(self, obj):
-        last_reply = obj.replies.order_by('-created_at').first()
-        last_activity = last_reply.created_at if last_reply else obj.created_at
+        last_activity = obj.last_activity_at
         
         try:
             # Calculate time difference
@@ -0,0 +1,202 @@
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .chat_membership import invalidate_room_membership
+from .db_routers import chat_database, is_chat_model
+from .models import (
+    ChatParticipant, ChatRoom, ChatRoomUnread, DashboardSnapshot, ForumReply, ForumTopic, Message, MessageRead, Notification,
+    Post, PostComment, Reaction, User,
+)
+from .search import (
+    AUTHOR_NAME_FIELDS, FORUM_INDEX_FIELDS, GLOBAL_SEARCH_MODELS, index_announcement, index_forum_post, index_instance,
+    reindex_author_announcements, unindex_announcement, unindex_forum_post, unindex_instance,
+)
+from .unread import (
+    forget_deleted_message, forget_deleted_notification, record_new_messages, record_new_notifications,
+    record_participants_added, record_participants_removed,
+)
+
+# Modèle -> (compteur de DashboardSnapshot, champ de date utilisé pour le jour)
+DASHBOARD_COUNTERS = {
+    User: ('new_users', 'date_joined'),
+    Post: ('posts', 'created_at'),
+    PostComment: ('comments', 'created_at'),
+    ForumTopic: ('topics', 'created_at'),
+    ForumReply: ('replies', 'created_at'),
+    Reaction: ('reactions', 'created_at'),
+    Message: ('messages', 'timestamp'),
+}
+
+
+def _increment_dashboard(sender, instance, delta):
+    field, date_field = DASHBOARD_COUNTERS[sender]
+    when = getattr(instance, date_field)
+    if is_chat_model(sender):
+        # Once the chat transaction is over, so the primary is never written while it holds the chat database
+        transaction.on_commit(lambda: DashboardSnapshot.increment(field, when, delta), using=chat_database())
+    else:
+        DashboardSnapshot.increment(field, when, delta)
+
+
+def _count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _increment_dashboard(sender, instance, 1)
+
+
+def _count_deleted(sender, instance, **kwargs):
+    _increment_dashboard(sender, instance, -1)
+
+
+for model in DASHBOARD_COUNTERS:
+    post_save.connect(_count_created, sender=model, dispatch_uid=f'dashboard_created_{model._meta.label}')
+    post_delete.connect(_count_deleted, sender=model, dispatch_uid=f'dashboard_deleted_{model._meta.label}')
+
+
+@receiver(pre_save, sender=User, dispatch_uid='dashboard_logins')
+def count_login(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Every login saves last_login alone (update_last_login). Count each user once a day:
+    # "logins" is the number of users who logged in that day, not of login events
+    if raw or not update_fields or 'last_login' not in update_fields or instance.last_login is None:
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list('last_login', flat=True).first()
+    if previous is None or timezone.localdate(previous) != timezone.localdate(instance.last_login):
+        DashboardSnapshot.increment('logins', instance.last_login)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through, dispatch_uid='chat_membership_changed')
+def chat_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is None for clear(), so remember who is about to be removed
+        if reverse:
+            instance._cleared_chat_room_ids = list(sender.objects.filter(user=instance).values_list('chatroom_id', flat=True))
+        else:
+            instance._cleared_participant_ids = list(sender.objects.filter(chatroom=instance).values_list('user_id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_chat_room_ids' if reverse else '_cleared_participant_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        room_ids, user_ids = list(pk_set), [instance.pk]
+    else:
+        room_ids, user_ids = [instance.pk], list(pk_set)
+    invalidate_room_membership(room_ids, user_ids)
+
+    # Keep the unread counters in step with who is in the room
+    if action == 'post_add':
+        for room_id in room_ids:
+            record_participants_added(room_id, user_ids)
+    else:
+        record_participants_removed(room_ids, user_ids)
+
+
+@receiver(pre_delete, sender=ChatRoom, dispatch_uid='chat_membership_room_deleted')
+def invalidate_deleted_room_membership(sender, instance, **kwargs):
+    participant_ids = list(ChatParticipant.objects.filter(chatroom=instance).values_list('user_id', flat=True))
+    invalidate_room_membership([instance.pk], participant_ids)
+    record_participants_removed([instance.pk], participant_ids)
+
+
+@receiver(post_delete, sender=User, dispatch_uid='chat_user_deleted')
+def delete_chat_rows_of_user(sender, instance, **kwargs):
+    # The chat tables are in another database, out of reach of the deletion cascade
+    room_ids = list(ChatParticipant.objects.filter(user_id=instance.pk).values_list('chatroom_id', flat=True))
+    Message.objects.filter(sender_id=instance.pk).delete()
+    ChatParticipant.objects.filter(user_id=instance.pk).delete()
+    MessageRead.objects.filter(user_id=instance.pk).delete()
+    ChatRoomUnread.objects.filter(user_id=instance.pk).delete()
+    invalidate_room_membership(room_ids, [instance.pk])
+
+
+@receiver(post_save, sender=Message, dispatch_uid='unread_message_created')
+def count_unread_message(sender, instance, created, raw=False, **kwargs):
+    # MessageBatcher's bulk_create skips post_save and records its batch itself
+    if created and not raw:
+        record_new_messages([instance])
+
+
+@receiver(pre_delete, sender=Message, dispatch_uid='unread_message_deleted')
+def forget_unread_message(sender, instance, **kwargs):
+    # pre_delete: the read receipts are still there to tell who had not read it
+    forget_deleted_message(instance)
+
+
+@receiver(post_save, sender=Notification, dispatch_uid='unread_notification_created')
+def count_unread_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not instance.is_read:
+        record_new_notifications([instance.user_id])
+
+
+@receiver(post_delete, sender=Notification, dispatch_uid='unread_notification_deleted')
+def forget_unread_notification(sender, instance, **kwargs):
+    forget_deleted_notification(instance)
+
+
+@receiver(post_delete, sender=ForumReply, dispatch_uid='forum_reply_deleted')
+def update_topic_after_reply_delete(sender, instance, **kwargs):
+    # post_delete runs inside the deletion transaction, cascades included
+    latest_reply = ForumReply.objects.filter(topic_id=instance.topic_id).order_by('-created_at').values('created_at')[:1]
+    ForumTopic.objects.filter(pk=instance.topic_id).update(
+        reply_count=Greatest(F('reply_count') - 1, 0),
+        last_activity_at=Coalesce(Subquery(latest_reply), F('created_at'))
+    )
+
+
+def _index_for_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        index_instance(instance, update_fields)
+
+
+def _unindex_for_search(sender, instance, **kwargs):
+    unindex_instance(instance)
+
+
+for model in GLOBAL_SEARCH_MODELS:
+    post_save.connect(_index_for_search, sender=model, dispatch_uid=f'global_search_index_{model._meta.label}')
+    post_delete.connect(_unindex_for_search, sender=model, dispatch_uid=f'global_search_unindex_{model._meta.label}')
+
+
+def _index_for_forum_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        index_forum_post(instance, update_fields)
+
+
+def _unindex_for_forum_search(sender, instance, **kwargs):
+    unindex_forum_post(instance)
+
+
+for model in FORUM_INDEX_FIELDS:
+    post_save.connect(_index_for_forum_search, sender=model, dispatch_uid=f'forum_search_index_{model._meta.label}')
+    post_delete.connect(_unindex_for_forum_search, sender=model, dispatch_uid=f'forum_search_unindex_{model._meta.label}')
+
+
+@receiver(post_save, sender=Post, dispatch_uid='announcement_search_index')
+def index_announcement_for_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        index_announcement(instance, update_fields)
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='announcement_search_unindex')
+def unindex_announcement_for_search(sender, instance, **kwargs):
+    unindex_announcement(instance)
+
+
+@receiver(pre_save, sender=User, dispatch_uid='announcement_search_author_renamed')
+def note_author_rename(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Logins save last_login alone: only look the old name up when a name field may have changed
+    instance._author_renamed = False
+    if raw or instance.pk is None or (update_fields is not None and set(AUTHOR_NAME_FIELDS).isdisjoint(update_fields)):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(*AUTHOR_NAME_FIELDS).first()
+    instance._author_renamed = previous is not None and previous != tuple(getattr(instance, field) for field in AUTHOR_NAME_FIELDS)
+
+
+@receiver(post_save, sender=User, dispatch_uid='announcement_search_author_reindex')
+def reindex_renamed_author(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created and getattr(instance, '_author_renamed', False):
+        reindex_author_announcements(instance)
@@ -0,0 +1,146 @@
+"""SQLite backend tuned for concurrent writers.
+
+Same as ``django.db.backends.sqlite3`` with two extra ``OPTIONS``:
+
+``pragmas``
+    Run on every new connection, on top of ``DEFAULT_PRAGMAS`` (a ``None``
+    value drops a default).
+``write_queue``
+    When true, the writers of this process wait on one lock per database file
+    instead of polling SQLite's busy handler. Every transaction (``atomic``)
+    and every write outside a transaction holds the lock. SQLite's own locking
+    still arbitrates between processes.
+"""
+import threading
+from contextlib import nullcontext
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # Readers no longer block the writer, nor the writer the readers
+    'journal_mode': 'WAL',
+    # With WAL, only checkpoints fsync; a power loss can drop the last commits, never corrupt
+    'synchronous': 'NORMAL',
+    # Milliseconds a writer waits for the lock before "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative means KiB: 64 MiB of page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def get_write_lock(name):
+    """The process-wide lock shared by every connection to the database ``name``"""
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+class WriteSlot:
+    """Hold the write lock of a database, giving up after ``timeout`` seconds like SQLite would"""
+
+    def __init__(self, lock, timeout):
+        self.lock = lock
+        self.timeout = timeout
+
+    def acquire(self):
+        if not self.lock.acquire(timeout=self.timeout):
+            raise OperationalError('database is locked (write queue timeout)')
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class QueuedCursorWrapper(base.SQLiteCursorWrapper):
+    """Takes the write slot around writes issued outside a transaction"""
+    write_slot = None
+
+    def slot_for(self, query):
+        if self.write_slot is None or self.connection.in_transaction:
+            # Inside a transaction the slot is already held since BEGIN
+            return nullcontext()
+        if not query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            return nullcontext()
+        return self.write_slot
+
+    def execute(self, query, params=None):
+        with self.slot_for(query):
+            return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        with self.slot_for(query):
+            return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_slot = None
+        self.holds_write_slot = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        if kwargs.pop('write_queue', False):
+            timeout = (self.pragmas.get('busy_timeout') or 0) / 1000
+            self.write_slot = WriteSlot(get_write_lock(self.settings_dict['NAME']), timeout)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                # In-memory databases answer "memory" to journal_mode=WAL, which is fine
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=QueuedCursorWrapper)
+        cursor.write_slot = self.write_slot
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        if self.write_slot is not None and not self.holds_write_slot:
+            self.write_slot.acquire()
+            self.holds_write_slot = True
+        try:
+            super()._start_transaction_under_autocommit()
+        except Exception:
+            self.release_write_slot()
+            raise
+
+    def release_write_slot(self):
+        if self.holds_write_slot:
+            self.holds_write_slot = False
+            self.write_slot.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_slot()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_slot()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_slot()
@@ -1,3 +1,1582 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import urlparse
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import Sum
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    ChatRoom, ChatRoomUnread, DashboardSnapshot, Message, Event, EventRegistration, EventType, ForumCategory, ForumReply, ForumTopic,
+    Notification, NotificationType, Post, PostComment, Reaction, Report, UnreadCounter, User,
+)
+from .chat_membership import is_room_member
+from .chat_persistence import get_message_batcher
+from .db_routers import ReplicaRouter, _pin_key
+from .notifications import dispatch_notifications
+from .presence import get_presence_tracker
+from .routing import websocket_urlpatterns
+from .search import search_announcements, search_forum
+from .view_counter import view_counter
+
+# Tests touching chat models also use the chat database (see ChatRouter)
+CHAT_TEST_DATABASES = {'default', settings.CHAT_DATABASE}
+
+
+@contextmanager
+def capture_chat_queries():
+    """Collect the queries run on the primary and on the chat database"""
+    captured = []
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in sorted(CHAT_TEST_DATABASES)]
+        yield captured
+    for context in contexts:
+        captured.extend(context.captured_queries)
+
+
+class EventListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.organizer = User.objects.create_user(username='bde', email='bde@example.com', password='pass', role='BDE')
+        self.event_type = EventType.objects.create(name='Hackathon')
+        start = timezone.now() + timedelta(days=7)
+        self.events = [
+            Event.objects.create(
+                title=f'Event {i}',
+                description='Description',
+                event_type=self.event_type,
+                start_date=start + timedelta(days=i),
+                end_date=start + timedelta(days=i, hours=2),
+                location='Campus',
+                created_by=self.organizer,
+            )
+            for i in range(5)
+        ]
+        statuses = ['REGISTERED', 'REGISTERED', 'INTERESTED', 'ATTENDED', 'CANCELLED']
+        for i, registration_status in enumerate(statuses):
+            student = User.objects.create_user(username=f'student{i}', email=f'student{i}@example.com', password='pass')
+            for event in self.events:
+                EventRegistration.objects.create(event=event, user=student, status=registration_status)
+
+    def test_listing_includes_registration_counts(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        for event in response.data:
+            self.assertEqual(event['registered'], 2)
+            self.assertEqual(event['interested'], 1)
+            self.assertEqual(event['attended'], 1)
+
+    def test_listing_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/events/')
+
+        start = timezone.now() + timedelta(days=30)
+        for i in range(20):
+            Event.objects.create(
+                title=f'Extra {i}',
+                description='Description',
+                event_type=self.event_type,
+                start_date=start,
+                end_date=start + timedelta(hours=1),
+                location='Campus',
+                created_by=self.organizer,
+            )
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/events/')
+        self.assertEqual(len(response.data), 25)
+
+
+class AnnouncementCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='admin', email='admin@example.com', password='pass', role='ADMIN')
+        self.client.force_authenticate(self.author)
+        created_at = timezone.now()
+        for i in range(7):
+            post = Post.objects.create(
+                title=f'Announcement {i}',
+                content='Content',
+                created_by=self.author,
+                is_announcement=True,
+                announcement_type='info',
+                is_pinned=i in (2, 5),
+            )
+            # Give several announcements the same timestamp to exercise the id tie-breaker
+            Post.objects.filter(pk=post.pk).update(created_at=created_at - timedelta(minutes=i // 2))
+
+    def _walk(self, sort):
+        ids = []
+        params = {'pagination': 'cursor', 'per_page': 3, 'sort': sort}
+        while True:
+            response = self.client.get('/api/announcements/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                self.assertFalse(response.data['has_next'])
+                return ids
+            params['cursor'] = response.data['next']
+
+    def test_cursor_pages_match_ordering(self):
+        expected = list(Post.objects.order_by('-is_pinned', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self._walk('newest'), expected)
+        expected = list(Post.objects.order_by('-is_pinned', 'created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self._walk('oldest'), expected)
+
+    def test_cursor_page_skips_count(self):
+        response = self.client.get('/api/announcements/', {'pagination': 'cursor', 'per_page': 3})
+        self.assertTrue(response.data['has_next'])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/announcements/', {'cursor': response.data['next'], 'per_page': 3})
+        post_queries = [q['sql'] for q in context.captured_queries if 'FROM "blickers_app_post"' in q['sql']]
+        self.assertEqual(len(post_queries), 1)
+        self.assertNotIn('COUNT', post_queries[0])
+        self.assertNotIn('OFFSET', post_queries[0])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/announcements/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=None, VIEW_COUNT_FLUSH_THRESHOLD=5)
+class ViewCounterBufferTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='admin', email='admin@example.com', password='pass', role='ADMIN')
+        self.client.force_authenticate(self.author)
+        self.post = Post.objects.create(title='Announcement', content='Content', created_by=self.author, is_announcement=True)
+        view_counter.flush()
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def test_detail_views_are_buffered(self):
+        for expected in range(1, 4):
+            response = self.client.get(f'/api/announcements/{self.post.pk}/')
+            self.assertEqual(response.data['views_count'], expected)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 0)
+
+        self.assertEqual(view_counter.flush(), 3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 3)
+        self.assertEqual(view_counter.pending(Post, self.post.pk), 0)
+
+    def test_threshold_triggers_flush(self):
+        other = Post.objects.create(title='Other', content='Content', created_by=self.author, is_announcement=True)
+        for _ in range(3):
+            view_counter.add(Post, self.post.pk)
+        view_counter.add(Post, other.pk)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).views_count, 0)
+        view_counter.add(Post, other.pk)
+        self.post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.post.views_count, other.views_count), (3, 2))
+
+
+class DashboardSnapshotTests(TestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='pass', role='ADMIN')
+        self.client.force_authenticate(self.admin)
+        self.student = User.objects.create_user(username='student', email='student@example.com', password='pass')
+        self.post = Post.objects.create(title='Announcement', content='Content', created_by=self.admin, is_announcement=True)
+        PostComment.objects.create(post=self.post, user=self.student, content='Comment')
+        Reaction.objects.create(post=self.post, user=self.student)
+
+    def _counters(self):
+        return {
+            snapshot.date: {field: getattr(snapshot, field) for field in DashboardSnapshot.COUNTER_FIELDS}
+            for snapshot in DashboardSnapshot.objects.all()
+        }
+
+    def test_counters_follow_saves_and_deletes(self):
+        today = DashboardSnapshot.objects.get(date=timezone.localdate())
+        self.assertEqual((today.new_users, today.posts, today.comments, today.reactions), (2, 1, 1, 1))
+
+        self.post.delete()
+        today.refresh_from_db()
+        self.assertEqual((today.posts, today.comments, today.reactions), (0, 0, 0))
+
+    def test_logins_count_users_once_a_day(self):
+        for user in (self.student, self.student, self.admin):
+            user_logged_in.send(sender=User, request=None, user=user)
+        self.assertEqual(DashboardSnapshot.objects.get(date=timezone.localdate()).logins, 2)
+
+    def test_migration_backfills_days_before_the_snapshot(self):
+        DashboardSnapshot.objects.all().delete()
+        migration = import_module('blickers_app.migrations.0022_dashboard_backfill')
+        migration.backfill_snapshots(django_apps, SimpleNamespace(connection=connection))
+        response = self.client.get('/api/dashboard/stats/')
+        self.assertEqual(response.data['total_users']['value'], 2)
+
+    def test_rebuild_matches_incremental_counters(self):
+        incremental = self._counters()
+        DashboardSnapshot.objects.all().delete()
+        call_command('rebuild_dashboard_snapshot', stdout=StringIO())
+        self.assertEqual(self._counters(), incremental)
+
+    def test_dashboard_views_use_snapshot(self):
+        room = ChatRoom.objects.create()
+        Message.objects.create(room=room, sender=self.admin, content='Recent')
+        Message.objects.filter(pk=Message.objects.create(room=room, sender=self.admin, content='Old').pk).update(
+            timestamp=timezone.now() - timedelta(hours=30)
+        )
+        with capture_chat_queries() as queries:
+            response = self.client.get('/api/dashboard/stats/')
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(response.data['total_users']['value'], 2)
+        # The last 24 hours, not the last two calendar days
+        self.assertEqual(response.data['new_messages']['value'], 1)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/dashboard/activity-overview/')
+        self.assertEqual(response.data['user_activity'][-1], 2)
+        self.assertEqual(response.data['content_engagement']['posts'], 1)
+        self.assertEqual(response.data['content_engagement']['reactions'], 1)
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='pass', role='ADMIN', first_name='Ada', last_name='Admin')
+        self.client.force_authenticate(self.admin)
+        start = timezone.now() + timedelta(days=3)
+        for i in range(3):
+            event = Event.objects.create(
+                title=f'Event {i}',
+                description='Description',
+                start_date=start,
+                end_date=start + timedelta(hours=2),
+                location='Campus',
+                created_by=self.admin,
+            )
+            EventRegistration.objects.create(event=event, user=self.admin, status='REGISTERED')
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_users_csv_export(self):
+        response = self.client.get('/api/users/export/', {'export_format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(self._content(response).splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['Name'], 'Ada Admin')
+        self.assertEqual(rows[0]['Year of Study'], 'N/A')
+
+    def test_events_ndjson_export_counts_in_one_query(self):
+        response = self.client.get('/api/events/export/', {'export_format': 'ndjson'})
+        with self.assertNumQueries(1):
+            rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row['Registered'] == '1' and row['Interested'] == '0' for row in rows))
+
+    async def test_asgi_export_reads_one_chunk_at_a_time(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.admin).access_token))()
+        with mock.patch('blickers_app.exports.EXPORT_CHUNK_SIZE', 2):
+            response = await AsyncClient().get(
+                '/api/events/export/', {'export_format': 'ndjson'}, headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertTrue(response.is_async)
+            parts = [part async for part in response.streaming_content]
+        self.assertEqual([len(part.splitlines()) for part in parts], [2, 1])
+        rows = [json.loads(line) for line in b''.join(parts).decode().splitlines()]
+        self.assertEqual([row['Title'] for row in rows], ['Event 0', 'Event 1', 'Event 2'])
+
+    def test_unknown_export_format_is_rejected(self):
+        response = self.client.get('/api/users/export/', {'export_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatChannelLayerTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'chatter{i}', email=f'chatter{i}@example.com', password='pass')
+            for i in range(3)
+        ]
+        self.room = ChatRoom.objects.create(name='Group', is_group_chat=True)
+        self.room.participants.add(*self.users)
+
+    def test_default_layer_is_in_memory(self):
+        self.assertEqual(type(get_channel_layer()).__name__, 'InMemoryChannelLayer')
+
+    def test_chat_message_fans_out_to_room(self):
+        async def scenario():
+            application = URLRouter(websocket_urlpatterns)
+            communicators = []
+            for user in self.users:
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{self.room.id}/')
+                communicator.scope['user'] = user
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                communicators.append(communicator)
+
+            await communicators[0].send_json_to({'type': 'message', 'message': 'Hello'})
+            for communicator in communicators:
+                while True:
+                    frame = await communicator.receive_json_from(timeout=5)
+                    if frame['type'] == 'message':
+                        break
+                self.assertEqual(frame['message'], 'Hello')
+                self.assertEqual(frame['user_id'], self.users[0].id)
+
+            for communicator in communicators:
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_outsider_is_rejected(self):
+        outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='pass')
+
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.room.id}/')
+            communicator.scope['user'] = outsider
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(scenario)()
+
+    def test_benchmark_command_reports_latency(self):
+        def dashboard():
+            totals = DashboardSnapshot.objects.aggregate(users=Sum('new_users'), messages=Sum('messages'))
+            return {field: total or 0 for field, total in totals.items()}
+
+        # Real messages of the day, which the deletion of the benchmark's own must not eat into
+        DashboardSnapshot.increment('messages', timezone.now(), 10)
+        before = dashboard()
+        out = StringIO()
+        call_command('benchmark_chat', clients=3, messages=6, stdout=out)
+        self.assertIn('Delivered 18/18', out.getvalue())
+        self.assertIn('p95', out.getvalue())
+        # Its scratch users and messages leave the dashboard as it was
+        self.assertEqual(dashboard(), before)
+
+
+class MessageBatcherTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'writer{i}', email=f'writer{i}@example.com', password='pass')
+            for i in range(3)
+        ]
+        self.room = ChatRoom.objects.create(name='Group', is_group_chat=True)
+        self.room.participants.add(*self.users)
+
+    def test_concurrent_messages_are_written_together(self):
+        async def scenario():
+            batcher = get_message_batcher()
+            saved = await asyncio.gather(*[
+                batcher.save(str(self.room.id), self.users[i % 3].id, f'Message {i}') for i in range(6)
+            ])
+            return saved, batcher
+
+        previous_update = ChatRoom.objects.get(pk=self.room.pk).updated_at
+        with CaptureQueriesContext(connections[settings.CHAT_DATABASE]) as context:
+            saved, batcher = async_to_sync(scenario)()
+
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT INTO "blickers_app_message"')]
+        room_updates = [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE "blickers_app_chatroom"')]
+        self.assertEqual((len(inserts), len(room_updates)), (1, 1))
+        self.assertEqual(len({message.id for message in saved}), 6)
+        self.assertTrue(all(message.timestamp for message in saved))
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('content', flat=True)),
+            [f'Message {i}' for i in range(6)]
+        )
+        self.assertGreater(ChatRoom.objects.get(pk=self.room.pk).updated_at, previous_update)
+        # Counted once the batches are over, not per message
+        self.assertEqual(DashboardSnapshot.objects.get(date=timezone.localdate()).messages, 0)
+        async_to_sync(batcher.flush_dashboard)()
+        self.assertEqual(DashboardSnapshot.objects.get(date=timezone.localdate()).messages, 6)
+
+
+class ChatMembershipCacheTests(TestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user(username='member', email='member@example.com', password='pass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass')
+        self.room = ChatRoom.objects.create(name='Group', is_group_chat=True)
+        self.room.participants.add(self.member)
+
+    def test_membership_is_cached(self):
+        self.assertTrue(is_room_member(self.room.id, self.member.id))
+        self.assertFalse(is_room_member(self.room.id, self.other.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_room_member(str(self.room.id), self.member.id))
+            self.assertFalse(is_room_member(self.room.id, self.other.id))
+            self.assertFalse(is_room_member('not-a-room', self.member.id))
+
+    def test_participant_changes_invalidate_cache(self):
+        self.assertFalse(is_room_member(self.room.id, self.other.id))
+        self.room.participants.add(self.other)
+        self.assertTrue(is_room_member(self.room.id, self.other.id))
+
+        self.other.chat_rooms.remove(self.room)
+        self.assertFalse(is_room_member(self.room.id, self.other.id))
+
+        self.assertTrue(is_room_member(self.room.id, self.member.id))
+        self.room.participants.clear()
+        self.assertFalse(is_room_member(self.room.id, self.member.id))
+
+        self.member.chat_rooms.add(self.room)
+        self.assertTrue(is_room_member(self.room.id, self.member.id))
+        self.member.chat_rooms.clear()
+        self.assertFalse(is_room_member(self.room.id, self.member.id))
+
+    def test_invalidation_is_repeated_after_commit(self):
+        with self.captureOnCommitCallbacks(using=settings.CHAT_DATABASE, execute=True):
+            self.room.participants.add(self.other)
+            # Cached meanwhile by a request that could not see the change yet
+            cache.set(f'chat_member:{self.room.id}:{self.other.id}', False)
+        self.assertTrue(is_room_member(self.room.id, self.other.id))
+
+    def test_room_deletion_invalidates_cache(self):
+        room_id = self.room.id
+        self.assertTrue(is_room_member(room_id, self.member.id))
+        self.room.delete()
+        self.assertFalse(is_room_member(room_id, self.member.id))
+
+
+@override_settings(PRESENCE_FLUSH_DELAY=60)
+class PresenceTrackerTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='present', email='present@example.com', password='pass')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com', password='pass')
+        self.room = ChatRoom.objects.create()
+        self.room.participants.add(self.user, self.friend)
+
+    def _connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.room.id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_status_follows_last_connection(self):
+        async def scenario():
+            tracker = get_presence_tracker()
+            first, second = self._connect(self.user), self._connect(self.user)
+            watcher = self._connect(self.friend)
+            await watcher.connect()
+            await first.connect()
+            await second.connect()
+            await tracker.flush()
+            online_after_connect = await database_sync_to_async(User.objects.get)(pk=self.user.pk)
+
+            # Closing one tab keeps the user online and is not broadcast
+            await first.disconnect()
+            await tracker.flush()
+            online_after_one_close = await database_sync_to_async(User.objects.get)(pk=self.user.pk)
+
+            # A reconnect storm within the flush delay never persists an offline transition
+            for _ in range(5):
+                await second.disconnect()
+                second = self._connect(self.user)
+                await second.connect()
+            await tracker.flush()
+            after_storm = await database_sync_to_async(User.objects.get)(pk=self.user.pk)
+
+            await second.disconnect()
+            await tracker.flush()
+            offline = await database_sync_to_async(User.objects.get)(pk=self.user.pk)
+
+            statuses = []
+            while not await watcher.receive_nothing(timeout=0.1):
+                frame = await watcher.receive_json_from()
+                if frame['type'] == 'user_status' and frame['user_id'] == self.user.id:
+                    statuses.append(frame['status'])
+            await watcher.disconnect()
+            return online_after_connect, online_after_one_close, after_storm, offline, statuses
+
+        online_after_connect, online_after_one_close, after_storm, offline, statuses = async_to_sync(scenario)()
+        self.assertTrue(online_after_connect.is_online)
+        self.assertTrue(online_after_one_close.is_online)
+        self.assertTrue(after_storm.is_online)
+        self.assertIsNone(after_storm.last_online)
+        self.assertFalse(offline.is_online)
+        self.assertIsNotNone(offline.last_online)
+        # Five storm disconnects plus the final one; closing the first tab broadcast nothing
+        self.assertEqual(statuses.count('offline'), 6)
+
+
+class BulkReadReceiptTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com', password='pass')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.room = ChatRoom.objects.create()
+        self.room.participants.add(self.sender, self.reader)
+        self.messages = Message.objects.bulk_create([
+            Message(room=self.room, sender=self.sender, content=f'Message {i}') for i in range(50)
+        ])
+        self.own = Message.objects.create(room=self.room, sender=self.reader, content='Mine')
+
+    def test_read_up_to_marks_earlier_messages_in_one_pass(self):
+        up_to = self.messages[39].id
+
+        async def scenario():
+            sender = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.room.id}/')
+            sender.scope['user'] = self.sender
+            reader = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.room.id}/')
+            reader.scope['user'] = self.reader
+            await sender.connect()
+            await reader.connect()
+            await reader.send_json_to({'type': 'read_receipt', 'up_to_message_id': up_to})
+            while True:
+                frame = await sender.receive_json_from(timeout=5)
+                if frame['type'] == 'read_receipt_bulk':
+                    break
+            await sender.disconnect()
+            await reader.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual(frame, {'type': 'read_receipt_bulk', 'up_to_message_id': up_to, 'count': 40, 'user_id': self.reader.id})
+        self.assertEqual(Message.objects.filter(is_read=True).count(), 40)
+        self.assertEqual(self.reader.read_messages.count(), 40)
+        self.assertFalse(Message.objects.get(pk=self.messages[40].pk).is_read)
+        self.assertFalse(Message.objects.get(pk=self.own.pk).is_read)
+
+
+class ForumTopicCountersTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='student', email='student@example.com', password='pass')
+        self.client.force_authenticate(self.user)
+        self.category = ForumCategory.objects.create(name='Aide', description='Questions')
+        self.topics = [
+            ForumTopic.objects.create(title=f'Topic {i}', content='Content', category=self.category, created_by=self.user)
+            for i in range(5)
+        ]
+
+    def test_reply_create_and_delete_maintain_counters(self):
+        topic = self.topics[0]
+        first = ForumReply.objects.create(topic=topic, content='First', created_by=self.user)
+        second = ForumReply.objects.create(topic=topic, content='Second', created_by=self.user)
+        topic.refresh_from_db()
+        self.assertEqual(topic.reply_count, 2)
+        self.assertEqual(topic.last_activity_at, second.created_at)
+
+        second.delete()
+        topic.refresh_from_db()
+        self.assertEqual(topic.reply_count, 1)
+        self.assertEqual(topic.last_activity_at, first.created_at)
+
+        first.delete()
+        topic.refresh_from_db()
+        self.assertEqual(topic.reply_count, 0)
+        self.assertEqual(topic.last_activity_at, topic.created_at)
+
+    def test_list_does_not_query_replies(self):
+        for i, topic in enumerate(self.topics):
+            for _ in range(i):
+                ForumReply.objects.create(topic=topic, content='Reply', created_by=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/forum/topics/', {'sort_by': '-replies', 'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        # One COUNT for the paginator and one SELECT joining category and author
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertFalse(any('blickers_app_forumreply' in q['sql'] for q in queries.captured_queries))
+        counts = [topic['replies_count'] for topic in response.data['topics']]
+        self.assertEqual(counts, [4, 3, 2, 1, 0])
+
+    def test_backfill_command_recomputes_counters(self):
+        topic = self.topics[1]
+        replies = [ForumReply.objects.create(topic=topic, content='Reply', created_by=self.user) for _ in range(3)]
+        ForumTopic.objects.update(reply_count=0, last_activity_at=timezone.now() - timedelta(days=30))
+
+        call_command('backfill_forum_counters', batch_size=2, stdout=StringIO())
+        topic.refresh_from_db()
+        self.assertEqual(topic.reply_count, 3)
+        self.assertEqual(topic.last_activity_at, replies[-1].created_at)
+        untouched = ForumTopic.objects.get(pk=self.topics[0].pk)
+        self.assertEqual(untouched.reply_count, 0)
+        self.assertEqual(untouched.last_activity_at, untouched.created_at)
+
+    def test_migration_backfills_counters(self):
+        topic = self.topics[1]
+        replies = [ForumReply.objects.create(topic=topic, content='Reply', created_by=self.user) for _ in range(2)]
+        # As 0013 left them: no replies, active when migrated
+        ForumTopic.objects.update(reply_count=0, last_activity_at=timezone.now())
+
+        migration = import_module('blickers_app.migrations.0025_forum_counters_backfill')
+        migration.backfill_forum_counters(django_apps, SimpleNamespace(connection=connection))
+        topic.refresh_from_db()
+        self.assertEqual((topic.reply_count, topic.last_activity_at), (2, replies[-1].created_at))
+        untouched = ForumTopic.objects.get(pk=self.topics[0].pk)
+        self.assertEqual((untouched.reply_count, untouched.last_activity_at), (0, untouched.created_at))
+
+
+class ForumCategoryCountsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='student', email='student@example.com', password='pass')
+        self.categories = [
+            ForumCategory.objects.create(name=f'Category {i}', description='Description', order=i) for i in range(3)
+        ]
+
+    def add_topics(self, category, topics, replies_per_topic):
+        for i in range(topics):
+            topic = ForumTopic.objects.create(title=f'Topic {i}', content='Content', category=category, created_by=self.user)
+            for _ in range(replies_per_topic):
+                ForumReply.objects.create(topic=topic, content='Reply', created_by=self.user)
+
+    def test_category_list_counts_in_one_query(self):
+        self.add_topics(self.categories[0], 3, 2)
+        self.add_topics(self.categories[1], 1, 0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/forum/categories/')
+        self.assertEqual(response.status_code, 200)
+        counts = [(category['topics'], category['posts']) for category in response.data]
+        self.assertEqual(counts, [(3, 9), (1, 1), (0, 0)])
+
+        self.add_topics(self.categories[2], 10, 3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/forum/categories/')
+        self.assertEqual((response.data[2]['topics'], response.data[2]['posts']), (10, 40))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 search indexes only exist on SQLite')
+class ForumSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='student', email='student@example.com', password='pass', first_name='Sara')
+        category = ForumCategory.objects.create(name='Aide', description='Questions')
+        self.title_match = ForumTopic.objects.create(
+            title='Stage en cybersécurité', content='Qui a des conseils ?', category=category, created_by=self.user
+        )
+        self.content_match = ForumTopic.objects.create(
+            title='Questions diverses', content='Je cherche un stage, surtout en cybersécurité', category=category, created_by=self.user
+        )
+        self.other = ForumTopic.objects.create(title='Soirée BDE', content='Programme', category=category, created_by=self.user)
+        self.reply = ForumReply.objects.create(
+            topic=self.other, content='Il y a un atelier <b>cybersecurite</b> après la soirée', created_by=self.user
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/forum/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_topics_and_replies_with_highlights(self):
+        data = self.search(q='cyber')
+        self.assertEqual(data['total_count'], 3)
+        found = [(result['type'], result['id']) for result in data['results']]
+        self.assertEqual(found[0], ('topic', self.title_match.id))
+        self.assertCountEqual(found[1:], [('topic', self.content_match.id), ('reply', self.reply.id)])
+        self.assertIn('<mark>cybersécurité</mark>', data['results'][0]['title_highlight'])
+        reply = next(result for result in data['results'] if result['type'] == 'reply')
+        # Accents are folded and user markup is escaped
+        self.assertIn('&lt;b&gt;<mark>cybersecurite</mark>&lt;/b&gt;', reply['snippet'])
+        self.assertEqual(reply['topic']['id'], self.other.id)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.reply.content = 'Plus rien à voir'
+        self.reply.save()
+        self.content_match.delete()
+        self.title_match.title = 'Alternance'
+        self.title_match.save()
+
+        self.assertEqual(self.search(q='cybersécurité')['total_count'], 0)
+        self.assertEqual(self.search(q='alternance')['results'][0]['id'], self.title_match.id)
+
+    def test_pagination_and_operator_input(self):
+        data = self.search(q='cyber', page=2, page_size=2)
+        self.assertEqual((len(data['results']), data['total_pages'], data['has_previous'], data['has_next']), (1, 2, True, False))
+        # FTS5 syntax in the query is treated as plain words
+        self.assertEqual(self.search(q='"stage* (')['total_count'], 2)
+        self.assertEqual(self.client.get('/api/forum/search/').status_code, 400)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blickers_app_forum_search')
+        self.assertEqual(self.search(q='cyber')['total_count'], 0)
+        call_command('rebuild_forum_search', stdout=StringIO())
+        self.assertEqual(self.search(q='cyber')['total_count'], 3)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 search indexes only exist on SQLite')
+class AnnouncementSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(
+            username='bde', email='bde@example.com', password='pass', role='BDE', first_name='Yasmine', last_name='Alaoui'
+        )
+        self.client.force_authenticate(self.author)
+        self.title_match = Post.objects.create(
+            title='Inscriptions au gala', content='Les places partent vite', created_by=self.author,
+            is_announcement=True, announcement_type='event',
+        )
+        self.content_match = Post.objects.create(
+            title='Rappel', content='Le gala aura lieu vendredi, pensez au dress code', created_by=self.author,
+            is_announcement=True, announcement_type='info',
+        )
+        self.not_announcement = Post.objects.create(title='Gala', content='Gala', created_by=self.author)
+
+    def search(self, **params):
+        response = self.client.get('/api/announcements/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_are_ranked_with_snippets(self):
+        data = self.search(search='gala')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([item['id'] for item in data['results']], [self.title_match.id, self.content_match.id])
+        self.assertEqual(data['results'][0]['title_highlight'], 'Inscriptions au <mark>gala</mark>')
+        self.assertIn('<mark>gala</mark> aura lieu', data['results'][1]['snippet'])
+        self.assertGreater(data['results'][0]['search_score'], data['results'][1]['search_score'])
+
+    def test_search_composes_with_type_filter_and_sort(self):
+        data = self.search(search='gala', type='info')
+        self.assertEqual([item['id'] for item in data['results']], [self.content_match.id])
+        data = self.search(search='gala', sort='oldest', per_page=1, page=2)
+        self.assertEqual((data['count'], data['results'][0]['id']), (2, self.content_match.id))
+
+    def test_author_name_is_indexed_and_follows_renames(self):
+        self.assertEqual(self.search(search='yasmine')['count'], 2)
+        self.author.first_name = 'Salma'
+        self.author.save()
+        self.assertEqual(self.search(search='yasmine')['count'], 0)
+        self.assertEqual(self.search(search='salma alaoui')['count'], 2)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.not_announcement.is_announcement = True
+        self.not_announcement.save()
+        self.assertEqual(self.search(search='gala')['count'], 3)
+        self.title_match.delete()
+        self.content_match.is_announcement = False
+        self.content_match.save(update_fields=['is_announcement'])
+        self.assertEqual([item['id'] for item in self.search(search='gala')['results']], [self.not_announcement.id])
+
+        # Saves that leave the names alone do not touch the index
+        with CaptureQueriesContext(connection) as queries:
+            self.author.last_login = timezone.now()
+            self.author.save(update_fields=['last_login'])
+        self.assertFalse(any('announcement_search' in query['sql'] for query in queries))
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blickers_app_announcement_search')
+        call_command('rebuild_announcement_search', stdout=StringIO())
+        self.assertEqual(self.search(search='gala')['count'], 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 search indexes only exist on SQLite')
+class SearchIndexSchemaChangeTests(TransactionTestCase):
+    """SQLite rebuilds a table to alter one of its columns: the indexes must keep up afterwards"""
+
+    def rebuild_table(self, model, field_name):
+        old_field = model._meta.get_field(field_name)
+        new_field = old_field.clone()
+        new_field.set_attributes_from_name(field_name)
+        new_field.max_length += 1
+        with connection.schema_editor() as editor:
+            editor.alter_field(model, old_field, new_field)
+        with connection.schema_editor() as editor:
+            editor.alter_field(model, new_field, old_field)
+
+    def test_announcements_are_indexed_after_a_rebuild(self):
+        self.rebuild_table(Post, 'title')
+        author = User.objects.create_user(username='bde', email='bde@example.com', password='pass', first_name='Yasmine')
+        post = Post.objects.create(title='Gala', content='Vendredi', created_by=author, is_announcement=True)
+        self.assertEqual(search_announcements(Post.objects.all(), 'gala yasmine').get(), post)
+
+    def test_forum_posts_are_indexed_after_a_rebuild(self):
+        self.rebuild_table(ForumTopic, 'title')
+        user = User.objects.create_user(username='student', email='student@example.com', password='pass')
+        category = ForumCategory.objects.create(name='Aide', description='Questions')
+        topic = ForumTopic.objects.create(title='Stage', content='Conseils', category=category, created_by=user)
+        reply = ForumReply.objects.create(topic=topic, content='Un stage en alternance', created_by=user)
+        total, hits = search_forum('stage', limit=10)
+        self.assertEqual((total, {(hit['kind'], hit['object_id']) for hit in hits}), (2, {('topic', topic.id), ('reply', reply.id)}))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 search indexes only exist on SQLite')
+class GlobalSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='ines', email='ines@example.com', password='pass', first_name='Inès', major='Robotique'
+        )
+        self.client.force_authenticate(self.user)
+        start = timezone.now() + timedelta(days=3)
+        self.event = Event.objects.create(
+            title='Atelier robotique', description='Construire un robot', location='FabLab',
+            start_date=start, end_date=start + timedelta(hours=2), created_by=self.user,
+        )
+        self.draft = Event.objects.create(
+            title='Robotique (brouillon)', description='Draft', location='FabLab',
+            start_date=start, end_date=start + timedelta(hours=2), created_by=self.user, is_published=False,
+        )
+        self.announcement = Post.objects.create(
+            title='Club robotique', content='Le club recrute', created_by=self.user, is_announcement=True,
+        )
+        self.post = Post.objects.create(title='Robotique', content='Pas une annonce', created_by=self.user)
+        category = ForumCategory.objects.create(name='Aide', description='Questions')
+        self.topic = ForumTopic.objects.create(
+            title='Kit Arduino', content='Quel kit pour débuter la robotique ?', category=category, created_by=self.user
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def ids(self, group):
+        return [item['id'] for item in group['results']]
+
+    def test_groups_results_by_type(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.search(q='robotique')
+        # One search query plus one load per group
+        self.assertEqual(len(queries.captured_queries), 5)
+        self.assertEqual(self.ids(results['events']), [self.event.id])
+        self.assertEqual(self.ids(results['announcements']), [self.announcement.id])
+        self.assertEqual(self.ids(results['topics']), [self.topic.id])
+        self.assertEqual(self.ids(results['users']), [self.user.id])
+        self.assertEqual(results['events']['results'][0]['title_highlight'], 'Atelier <mark>robotique</mark>')
+        self.assertEqual(results['users']['results'][0]['title'], 'Inès')
+
+    def test_type_filter_and_limit(self):
+        for i in range(3):
+            Post.objects.create(title=f'Robotique {i}', content='Annonce', created_by=self.user, is_announcement=True)
+        results = self.search(q='robotique', types='announcement', limit=2)
+        self.assertEqual(list(results), ['announcements'])
+        self.assertEqual((results['announcements']['total'], len(results['announcements']['results'])), (4, 2))
+        self.assertEqual(self.client.get('/api/search/', {'q': 'robot', 'types': 'comment'}).status_code, 400)
+
+    def test_index_follows_model_changes(self):
+        self.draft.is_published = True
+        self.draft.save()
+        self.announcement.delete()
+        self.user.major = 'Chimie'
+        self.user.save()
+        self.topic.title = 'Kit Raspberry'
+        self.topic.save(update_fields=['title'])
+
+        results = self.search(q='robotique')
+        self.assertCountEqual(self.ids(results['events']), [self.event.id, self.draft.id])
+        self.assertEqual(results['announcements']['total'], 0)
+        self.assertEqual(results['users']['total'], 0)
+        self.assertEqual(self.ids(self.search(q='raspberry')['topics']), [self.topic.id])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blickers_app_global_search')
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        results = self.search(q='robotique')
+        self.assertEqual([group['total'] for group in results.values()], [1, 1, 1, 1])
+
+
+@override_settings(NOTIFICATION_DISPATCH_ASYNC=False)
+class NotificationDispatchTests(TestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='bde', email='bde@example.com', password='pass', role='BDE')
+        self.students = [
+            User.objects.create_user(username=f'student{i}', email=f'student{i}@example.com', password='pass')
+            for i in range(5)
+        ]
+        self.channel_layer = get_channel_layer()
+
+    def listen(self, user):
+        channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(f'notifications_{user.id}', channel)
+        return channel
+
+    def test_dispatch_batches_inserts_and_pushes(self):
+        channel = self.listen(self.students[3])
+        with CaptureQueriesContext(connection) as queries:
+            reports = dispatch_notifications(
+                [student.id for student in self.students], 'Title', 'Body', 'announcement', batch_size=2
+            )
+        self.assertEqual([report['size'] for report in reports], [2, 2, 1])
+        self.assertTrue(all(report['insert_ms'] >= 0 and report['push_ms'] >= 0 for report in reports))
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "blickers_app_notification"')]
+        self.assertEqual(len(inserts), 3)
+
+        event = async_to_sync(self.channel_layer.receive)(channel)
+        notification = Notification.objects.get(user=self.students[3])
+        self.assertEqual(event['notification_id'], notification.id)
+        self.assertEqual((event['type'], event['title'], event['notification_type']), ('notification', 'Title', 'announcement'))
+
+    def test_new_announcement_notifies_other_users(self):
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/announcements/create/', {'title': 'Gala', 'content': 'Vendredi soir'})
+        self.assertEqual(response.status_code, 201)
+        notified = set(Notification.objects.values_list('user_id', flat=True))
+        self.assertEqual(notified, {student.id for student in self.students})
+        notification = Notification.objects.first()
+        self.assertEqual((notification.related_object_type, notification.related_object_id), ('post', response.data['id']))
+
+    def test_broadcast_command_reports_batches(self):
+        out = StringIO()
+        call_command('broadcast_notification', title='Maintenance', message='Ce soir', role='STUDENT', batch_size=4, stdout=out)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertIn('Batch 2: 1 notifications', out.getvalue())
+
+
+class UnreadCountersTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        self.room = ChatRoom.objects.create(is_group_chat=True)
+        self.room.participants.add(self.alice, self.bob, self.carol)
+        self.client = APIClient()
+
+    def badge(self, user):
+        self.client.force_authenticate(user)
+        with capture_chat_queries() as queries:
+            response = self.client.get('/api/unread-counts/')
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_messages_are_counted_per_room_and_read_back_down(self):
+        messages = [Message.objects.create(room=self.room, sender=self.alice, content=f'Message {i}') for i in range(3)]
+        Message.objects.create(room=self.room, sender=self.bob, content='Reply')
+
+        self.assertEqual(self.badge(self.carol), {'messages': 4, 'notifications': 0, 'rooms': {str(self.room.id): 4}})
+        self.assertEqual(self.badge(self.alice)['messages'], 1)
+        self.assertEqual(self.alice.get_unread_messages_count(), 1)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.room.id}/')
+            communicator.scope['user'] = self.carol
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'read_receipt', 'up_to_message_id': messages[1].id})
+            while (await communicator.receive_json_from(timeout=5))['type'] != 'read_receipt_bulk':
+                pass
+            await communicator.send_json_to({'type': 'read_receipt', 'message_id': messages[1].id})
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.badge(self.carol)['rooms'], {str(self.room.id): 2})
+
+        messages[2].delete()
+        self.assertEqual(self.badge(self.carol)['messages'], 1)
+        self.room.participants.remove(self.carol)
+        self.assertEqual(self.badge(self.carol), {'messages': 0, 'notifications': 0, 'rooms': {}})
+
+    def test_new_participants_start_with_the_unread_history(self):
+        first, _ = [Message.objects.create(room=self.room, sender=self.alice, content=f'Message {i}') for i in range(2)]
+        dave = User.objects.create_user(username='dave', email='dave@example.com', password='pass')
+        erin = User.objects.create_user(username='erin', email='erin@example.com', password='pass')
+        first.read_by.add(dave)
+
+        with capture_chat_queries() as queries:
+            self.room.participants.add(dave, erin)
+        # One grouped count for every new participant, not one per user
+        self.assertEqual(sum('"blickers_app_message"' in query['sql'] for query in queries), 1)
+        self.assertEqual(self.badge(dave)['rooms'], {str(self.room.id): 1})
+        self.assertEqual(self.badge(erin)['rooms'], {str(self.room.id): 2})
+
+    def test_notifications_are_counted_and_marked_read(self):
+        notification_type = NotificationType.objects.create(name='info')
+        for i in range(3):
+            Notification.objects.create(user=self.bob, title=f'Title {i}', message='Body', notification_type=notification_type)
+        with override_settings(NOTIFICATION_DISPATCH_ASYNC=False):
+            dispatch_notifications([self.bob.id, self.carol.id], 'Broadcast', 'Body', notification_type)
+        self.assertEqual(self.badge(self.bob)['notifications'], 4)
+        self.assertEqual(self.bob.get_notifications_count(), 4)
+
+        first = Notification.objects.filter(user=self.bob).order_by('id').first()
+        self.client.force_authenticate(self.bob)
+        self.client.post('/api/notifications/mark-read/', {'notification_ids': [first.id]}, format='json')
+        self.client.post('/api/notifications/mark-read/', {'notification_ids': [first.id]}, format='json')
+        self.assertEqual(self.badge(self.bob)['notifications'], 3)
+        self.client.post('/api/notifications/mark-read/', {}, format='json')
+        self.assertEqual(self.badge(self.bob)['notifications'], 0)
+        self.assertEqual(self.badge(self.carol)['notifications'], 1)
+
+    def test_changes_are_pushed_to_the_notification_socket(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/notifications/')
+            communicator.scope['user'] = self.bob
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            initial = await communicator.receive_json_from(timeout=5)
+            await database_sync_to_async(Message.objects.create)(room=self.room, sender=self.alice, content='Hello')
+            pushed = await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+            return initial, pushed
+
+        initial, pushed = async_to_sync(scenario)()
+        self.assertEqual(initial, {'type': 'unread_counts', 'messages': 0, 'notifications': 0, 'rooms': {}})
+        self.assertEqual(pushed, {'type': 'unread_counts', 'messages': 1, 'notifications': 0, 'rooms': {str(self.room.id): 1}})
+
+    def test_rebuild_command(self):
+        message = Message.objects.create(room=self.room, sender=self.alice, content='Hello')
+        message.read_by.add(self.bob)
+        notification_type = NotificationType.objects.create(name='info')
+        Notification.objects.create(user=self.bob, title='Title', message='Body', notification_type=notification_type)
+        ChatRoomUnread.objects.update(count=42)
+        UnreadCounter.objects.update(notifications=42)
+        call_command('rebuild_unread_counters', stdout=StringIO())
+        self.assertEqual(self.carol.get_unread_messages_count(), 1)
+        self.assertEqual(self.bob.get_unread_messages_count(), 0)
+        self.assertEqual(self.bob.get_notifications_count(), 1)
+
+
+class ChatInboxTests(TestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='inbox', email='inbox@example.com', password='pass')
+        self.client.force_authenticate(self.user)
+        self.friends = [
+            User.objects.create_user(username=f'friend{i}', email=f'friend{i}@example.com', password='pass') for i in range(3)
+        ]
+        self.rooms = []
+        now = timezone.now()
+        for i in range(12):
+            room = ChatRoom.objects.create(is_group_chat=i % 2 == 0, name=f'Room {i}')
+            room.participants.add(self.user, *self.friends[:1 + i % 3])
+            if i % 4 != 3:
+                for j in range(i % 3 + 1):
+                    message = Message.objects.create(room=room, sender=self.friends[0], content=f'Room {i} message {j}')
+                    Message.objects.filter(pk=message.pk).update(timestamp=now - timedelta(hours=i, minutes=-j))
+            self.rooms.append(room)
+        # Rooms without messages fall back to their creation date: make it older than every message
+        ChatRoom.objects.update(created_at=now - timedelta(days=30))
+        ChatRoom.objects.create(name='Not mine').participants.add(*self.friends)
+
+    def walk(self, per_page):
+        rooms, params = [], {'per_page': per_page}
+        while True:
+            with capture_chat_queries() as queries:
+                response = self.client.get('/api/chat/rooms/', params)
+            # Rooms, their participants and last messages, then the users (kept in the primary database)
+            self.assertLessEqual(len(queries), 4)
+            self.assertEqual(response.status_code, 200)
+            rooms.extend(response.data['results'])
+            if not response.data['has_next']:
+                return rooms
+            params['cursor'] = response.data['next']
+
+    def test_rooms_sorted_by_activity_in_constant_queries(self):
+        rooms = self.walk(per_page=5)
+        self.assertEqual(len(rooms), 12)
+        with_messages = [room for room in self.rooms if room.messages.exists()]
+        self.assertEqual([room['id'] for room in rooms[:len(with_messages)]], [str(room.id) for room in with_messages])
+
+        first = rooms[0]
+        self.assertEqual(first['last_message']['content'], 'Room 0 message 0')
+        self.assertEqual(first['unread_count'], 1)
+        self.assertEqual([p['username'] for p in first['participants']], ['inbox', 'friend0'])
+        self.assertNotIn('email', first['participants'][0])
+        self.assertIsNone(next(room for room in rooms if room['id'] == str(self.rooms[3].id))['last_message'])
+        self.assertEqual(self.walk(per_page=100), rooms)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/chat/rooms/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatMessageHistoryTests(TestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.other = User.objects.create_user(username='writer', email='writer@example.com', password='pass')
+        self.room = ChatRoom.objects.create()
+        self.room.participants.add(self.user, self.other)
+        now = timezone.now()
+        Message.objects.bulk_create([
+            # Pairs of messages share a timestamp to exercise the id tie-breaker
+            Message(room=self.room, sender=self.other, content=f'Message {i}', timestamp=now - timedelta(seconds=(25 - i) // 2))
+            for i in range(25)
+        ])
+        other_room = ChatRoom.objects.create()
+        other_room.participants.add(self.other)
+        Message.objects.create(room=other_room, sender=self.other, content='Elsewhere')
+        self.url = f'/api/chat/rooms/{self.room.id}/messages/'
+
+    def test_pages_backwards_through_history(self):
+        self.client.force_authenticate(self.user)
+        contents, params = [], {'limit': 10}
+        while True:
+            with capture_chat_queries() as queries:
+                response = self.client.get(self.url, params)
+            if 'before' in params:
+                # The page, then its senders (membership is cached by now)
+                self.assertEqual(len(queries), 2)
+            self.assertEqual(response.status_code, 200)
+            contents = [message['content'] for message in response.data['results']] + contents
+            if not response.data['has_more']:
+                break
+            params['before'] = response.data['before']
+        expected = list(Message.objects.filter(room=self.room).order_by('timestamp', 'id').values_list('content', flat=True))
+        self.assertEqual(contents, expected)
+        self.assertEqual(len(contents), 25)
+        self.assertNotIn('email', response.data['results'][0]['sender'])
+
+    def test_non_members_and_bad_cursors_are_rejected(self):
+        outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='pass')
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url, {'before': 'nope'}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+    def test_older_pages_use_an_index_range(self):
+        self.client.force_authenticate(self.user)
+        first = self.client.get(self.url, {'limit': 5}).data
+        chat = connections[settings.CHAT_DATABASE]
+        with CaptureQueriesContext(chat) as queries:
+            self.client.get(self.url, {'limit': 5, 'before': first['before']})
+        sql = next(query['sql'] for query in queries.captured_queries if 'FROM "blickers_app_message"' in query['sql'])
+        with chat.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('message_room_timestamp_idx (room_id=? AND timestamp<?)', plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class HotQueryPlanTests(TestCase):
+    """The queries behind the busiest endpoints must never fall back to a full table scan"""
+    # Tables that grow with usage; small lookup tables and the daily snapshots may be scanned
+    LARGE_TABLES = {
+        'blickers_app_user', 'blickers_app_event', 'blickers_app_eventregistration',
+        'blickers_app_post', 'blickers_app_notification', 'blickers_app_report',
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='admin', email='admin@example.com', password='pass', role='ADMIN')
+        now = timezone.now()
+        self.event = Event.objects.create(
+            title='Gala', description='Description', event_type=EventType.objects.create(name='Party'),
+            start_date=now + timedelta(days=3), end_date=now + timedelta(days=3, hours=4),
+            location='Campus', created_by=self.user, capacity=50,
+        )
+        EventRegistration.objects.create(event=self.event, user=self.user)
+        Post.objects.create(title='Welcome', content='Hello', created_by=self.user, is_announcement=True, announcement_type='info')
+        Notification.objects.create(
+            user=self.user, title='Hi', message='Hello', notification_type=NotificationType.objects.create(name='system')
+        )
+        Report.objects.create(reporter=self.user, content_type='POST', content_id=1, reason='Spam')
+
+    def full_scans(self, queries):
+        scans = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [str(row[-1]) for row in cursor.fetchall()]
+            # "SCAN <table>" without "USING ... INDEX" reads every row of the table
+            scans += [
+                f'{detail}: {sql}' for detail in details
+                if detail.startswith('SCAN ') and 'INDEX' not in detail and detail.split()[1] in self.LARGE_TABLES
+            ]
+        return scans
+
+    def test_hot_endpoints_use_indexes(self):
+        requests = [
+            ('post', '/api/auth/login/', {'email': 'admin@example.com', 'password': 'pass'}),
+            ('get', '/api/events/', {'start_date': (timezone.now() + timedelta(days=1)).isoformat()}),
+            ('post', f'/api/events/{self.event.id}/register/', {}),
+            ('get', '/api/announcements/', {}),
+            ('get', '/api/announcements/', {'type': 'info'}),
+            ('get', '/api/notifications/', {}),
+            ('post', '/api/notifications/mark-read/', {'all': True}),
+            ('get', '/api/moderation/pending/', {}),
+            ('get', '/api/dashboard/activity-overview/', {}),
+        ]
+        for method, url, data in requests:
+            with self.subTest(url=url, data=data):
+                self.client.force_authenticate(None if 'auth' in url else self.user)
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(url, data, format='json')
+                self.assertLess(response.status_code, 500)
+                self.assertEqual(self.full_scans(queries), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Tests the SQLite backend')
+class SQLiteConcurrencyTests(TestCase):
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_benchmark_writers_never_hit_locks_with_wal(self):
+        out = StringIO()
+        # The benchmark's scratch databases are only registered while it runs
+        with mock.patch.object(type(self), 'databases', {'default', 'benchmark_wal', 'benchmark_wal+queue'}):
+            call_command('benchmark_sqlite_writes', threads=4, writes=25, profile=['wal', 'wal+queue'], stdout=out)
+        output = out.getvalue()
+        self.assertIn('wal: journal_mode=wal, 100/100 committed', output)
+        self.assertIn('wal+queue: journal_mode=wal, 100/100 committed', output)
+        self.assertNotIn('benchmark_wal', connections)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Uses a second SQLite file as the replica')
+@override_settings(READ_REPLICAS=['replica'], REPLICA_PIN_SECONDS=60)
+class ReadReplicaRoutingTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass')
+        start = timezone.now() + timedelta(days=2)
+        self.event = Event.objects.create(
+            title='Primary copy', description='Description', location='Campus',
+            start_date=start, end_date=start + timedelta(hours=2), created_by=self.user, capacity=10,
+        )
+
+        # The replica stand-in: a snapshot of the test database in a second file, edited so reads show where they went
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        replica = sqlite3.connect(path)
+        connection.connection.backup(replica)
+        replica.execute("UPDATE blickers_app_event SET title = 'Replica copy'")
+        replica.commit()
+        replica.close()
+        connections.settings['replica'] = {**connections['default'].settings_dict, 'NAME': path}
+        self.addCleanup(self.remove_replica)
+        databases = mock.patch.object(type(self), 'databases', {'default', 'replica'})
+        databases.start()
+        self.addCleanup(databases.stop)
+
+        self.router = next(r for r in router.routers if isinstance(r, ReplicaRouter))
+        self.router.skipped_until.clear()
+        self.router.checked_at.clear()
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def event_title(self, client):
+        response = client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        return response.data[0]['title']
+
+    def test_marked_views_read_from_the_replica(self):
+        client = self.client_for(self.user)
+        self.assertEqual(self.event_title(client), 'Replica copy')
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.assertEqual(client.get('/api/users/profile/').status_code, 200)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        client = self.client_for(self.user)
+        self.assertLess(client.post(f'/api/events/{self.event.id}/register/').status_code, 300)
+        self.assertEqual(self.event_title(client), 'Primary copy')
+        self.assertEqual(self.event_title(self.client_for(self.other)), 'Replica copy')
+
+    def test_the_pin_follows_the_user_across_token_refreshes(self):
+        self.assertLess(self.client_for(self.user).post(f'/api/events/{self.event.id}/register/').status_code, 300)
+        # A new access token, as after a refresh
+        self.assertEqual(self.event_title(self.client_for(self.user)), 'Primary copy')
+        # Anonymous clients are never pinned to each other
+        self.assertIsNone(_pin_key(RequestFactory().get('/api/events/')))
+
+    def test_failed_replica_query_is_retried_on_the_primary(self):
+        replica = sqlite3.connect(connections.settings['replica']['NAME'])
+        replica.execute('ALTER TABLE blickers_app_event RENAME TO blickers_app_event_gone')
+        replica.commit()
+        replica.close()
+        self.assertEqual(self.event_title(self.client_for(self.user)), 'Primary copy')
+        self.assertIn('replica', self.router.skipped_until)
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        client = self.client_for(self.user)
+        with mock.patch.object(ReplicaRouter, 'measure_lag', return_value=120):
+            self.assertEqual(self.event_title(client), 'Primary copy')
+        # Skipped until REPLICA_RETRY_SECONDS have passed
+        self.assertEqual(self.event_title(client), 'Primary copy')
+        self.router.skipped_until.clear()
+        self.assertEqual(self.event_title(client), 'Replica copy')
+
+    def test_idle_replica_is_not_behind(self):
+        replica = mock.MagicMock(vendor='postgresql')
+        cursor = replica.cursor.return_value.__enter__.return_value
+        # No write on the primary for two minutes, everything received is replayed
+        cursor.fetchone.return_value = (True, 120.0)
+        self.assertEqual(self.router.measure_lag(replica), 0)
+        self.assertIn('pg_last_wal_replay_lsn()', cursor.execute.call_args.args[0])
+        # WAL waiting to be replayed: the replica is as old as its last replayed transaction
+        cursor.fetchone.return_value = (False, 120.0)
+        self.assertEqual(self.router.measure_lag(replica), 120.0)
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        connections.settings['replica']['NAME'] = os.path.join('/nonexistent', 'replica.sqlite3')
+        self.assertEqual(self.event_title(self.client_for(self.user)), 'Primary copy')
+        self.assertIn('replica', self.router.skipped_until)
+
+
+@skipUnless(settings.CHAT_DATABASE != 'default', 'Set CHAT_DB_PATH to test the separate chat database')
+class ChatDatabaseTests(TransactionTestCase):
+    databases = CHAT_TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+
+    def test_chat_tables_live_in_the_chat_database(self):
+        room = ChatRoom.objects.create()
+        room.participants.add(self.alice, self.bob)
+        message = Message.objects.create(room=room, sender=self.alice, content='Hello')
+        message.read_by.add(self.bob)
+
+        self.assertEqual((room._state.db, message._state.db), (settings.CHAT_DATABASE, settings.CHAT_DATABASE))
+        self.assertFalse(Message.objects.using('default').exists())
+        self.assertFalse(router.allow_migrate(settings.CHAT_DATABASE, 'blickers_app', model_name='event'))
+        self.assertFalse(router.allow_migrate(settings.CHAT_DATABASE, 'blickers_app'))
+        # Users are still read from the primary, one query each side
+        self.assertEqual(Message.objects.get(pk=message.pk).sender, self.alice)
+        self.assertEqual(list(room.get_participants().order_by('id')), [self.alice, self.bob])
+        self.assertTrue(message.read_by.through.objects.filter(message=message, user_id=self.bob.id).exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite has one writer per database file')
+    def test_open_chat_transaction_does_not_block_other_writes(self):
+        room = ChatRoom.objects.create()
+        room.participants.add(self.alice, self.bob)
+        written = []
+
+        def write_announcement():
+            try:
+                Post.objects.create(title='Announcement', content='Content', created_by=self.alice, is_announcement=True)
+                written.append(True)
+            finally:
+                connections['default'].close()
+
+        with transaction.atomic(using=settings.CHAT_DATABASE):
+            Message.objects.create(room=room, sender=self.alice, content='Burst')
+            thread = threading.Thread(target=write_announcement)
+            thread.start()
+            thread.join(timeout=2)
+            # Written while the chat database is still locked by the message above
+            self.assertEqual(written, [True])
+
+    def test_deleting_a_user_removes_their_chat_rows(self):
+        room = ChatRoom.objects.create()
+        room.participants.add(self.alice, self.bob)
+        Message.objects.create(room=room, sender=self.alice, content='Hello').read_by.add(self.bob)
+        Message.objects.create(room=room, sender=self.bob, content='Hi')
+        self.assertTrue(is_room_member(room.id, self.bob.id))
+        self.assertEqual(self.alice.get_unread_messages_count(), 1)
+
+        self.bob.delete()
+
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['Hello'])
+        self.assertEqual(list(room.participants.through.objects.values_list('user_id', flat=True)), [self.alice.id])
+        self.assertFalse(Message.read_by.through.objects.exists())
+        self.assertFalse(is_room_member(room.id, self.bob.id))
+        self.assertEqual(self.alice.get_unread_messages_count(), 0)
+
+    def test_chat_writes_leave_the_primary_alone(self):
+        room = ChatRoom.objects.create()
+        room.participants.add(self.alice, self.bob)
+
+        async def scenario():
+            batcher = get_message_batcher()
+            saved = await asyncio.gather(*[batcher.save(str(room.id), self.alice.id, f'Message {i}') for i in range(3)])
+            return saved, batcher
+
+        with CaptureQueriesContext(connection) as primary:
+            saved, batcher = async_to_sync(scenario)()
+        self.assertEqual([q['sql'] for q in primary.captured_queries if not q['sql'].startswith('SELECT')], [])
+        async_to_sync(batcher.flush_dashboard)()
+        self.assertEqual(DashboardSnapshot.objects.get(date=timezone.localdate()).messages, 3)
+
+        with transaction.atomic(using=settings.CHAT_DATABASE):
+            with CaptureQueriesContext(connection) as primary:
+                saved[0].delete()
+                Message.objects.create(room=room, sender=self.bob, content='Reply')
+                room.participants.remove(self.bob)
+        self.assertEqual([q['sql'] for q in primary.captured_queries if not q['sql'].startswith('SELECT')], [])
+        self.assertEqual(self.alice.get_unread_messages_count(), 1)
+        # The dashboard caught up once the chat transaction committed
+        self.assertEqual(DashboardSnapshot.objects.get(date=timezone.localdate()).messages, 3)
+
+    def test_migration_copies_the_chat_rows_of_the_primary(self):
+        # Chat rows written before CHAT_DB_PATH was set
+        room = ChatRoom.objects.using('default').create(name='Old room', is_group_chat=True)
+        room.participants.through.objects.using('default').create(chatroom=room, user=self.alice)
+        room.participants.through.objects.using('default').create(chatroom=room, user=self.bob)
+        sent = timezone.now() - timedelta(days=3)
+        message = Message.objects.using('default').create(room=room, sender=self.alice, content='Old message')
+        Message.objects.using('default').filter(pk=message.pk).update(timestamp=sent)
+        self.assertFalse(ChatRoom.objects.exists())
+
+        migration = import_module('blickers_app.migrations.0021_chat_database_backfill')
+        with connections[settings.CHAT_DATABASE].schema_editor() as editor:
+            migration.move_chat_rows(django_apps, editor)
+
+        copied = Message.objects.get(pk=message.pk)
+        self.assertEqual((copied.room_id, copied.sender_id, copied.timestamp), (room.id, self.alice.id, sent))
+        self.assertEqual(list(ChatRoom.objects.get(pk=room.pk).get_participants().order_by('id')), [self.alice, self.bob])
+        self.assertEqual(self.bob.get_unread_messages_count(), 1)
+        # Once the chat database has rooms, running it again copies nothing
+        with connections[settings.CHAT_DATABASE].schema_editor() as editor:
+            migration.move_chat_rows(django_apps, editor)
+        self.assertEqual(Message.objects.count(), 1)
+
+
+def make_upload(name, width, height, mode='RGB', image_format='PNG'):
+    # Noise, so that sizes compare like those of photos rather than flat colors
+    image = Image.merge('RGB', [Image.effect_noise((width, height), 64) for _ in range(3)]).convert(mode)
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='pictured', email='pictured@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open_media(self, url):
+        path = urlparse(url).path
+        self.assertTrue(path.startswith(settings.MEDIA_URL), path)
+        return Image.open(os.path.join(self.media_root, *path[len(settings.MEDIA_URL):].split('/')))
+
+    def test_profile_picture_upload_renders_avatars(self):
+        upload = make_upload('me.png', 300, 200, mode='RGBA')
+        response = self.client.post('/api/users/profile/update-picture/', {'profile_picture': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        user = self.client.get('/api/users/').data[0]
+        self.assertTrue(user['avatar'].endswith('/avatar64.webp'))
+        self.assertEqual(self.open_media(user['avatar']).size, (64, 64))
+        with self.open_media(user['avatar_variants']['avatar128']['jpeg']) as avatar:
+            self.assertEqual((avatar.format, avatar.size), ('JPEG', (128, 128)))
+
+        with self.open_media(user['avatar']) as avatar:
+            before = avatar.tobytes()
+        self.client.post('/api/users/profile/update-picture/', {'profile_picture': make_upload('me.png', 90, 90)}, format='multipart')
+        # The new upload reuses the freed name: the copies of the old picture must not be served for it
+        replaced = self.client.get('/api/users/').data[0]['avatar']
+        self.assertEqual(replaced, user['avatar'])
+        with self.open_media(replaced) as avatar:
+            self.assertNotEqual(avatar.tobytes(), before)
+
+    def test_event_lists_link_card_copies(self):
+        start = timezone.now() + timedelta(days=3)
+        response = self.client.post('/api/events/create/', {
+            'title': 'Gala', 'description': 'Description', 'type': 'Party', 'location': 'Campus', 'capacity': 100,
+            'start_date': start.strftime('%Y-%m-%d'), 'end_date': start.strftime('%Y-%m-%d'),
+            'start_time': '18:00', 'end_time': '23:00',
+            'image': make_upload('gala.jpg', 1600, 1200, image_format='JPEG'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        original = Event.objects.get().image
+        # Only the list links the card: the event views return the upload itself
+        self.assertEqual(response.data['image'], f'http://testserver{original.url}')
+        self.assertEqual(response.data['image_variants'], self.client.get('/api/events/').data[0]['image_variants'])
+
+        event = self.client.get('/api/events/').data[0]
+        card = self.open_media(event['image'])
+        self.assertEqual((card.format, card.size), ('WEBP', (480, 360)))
+        self.assertEqual(self.open_media(event['image_variants']['full']['jpeg']).size, (1280, 960))
+        self.assertLess(os.path.getsize(card.filename) * 10, original.size)
+
+    def test_storages_without_local_files_link_the_original(self):
+        Post.objects.create(
+            title='Announcement', content='Content', created_by=self.user, is_announcement=True,
+            image=make_upload('poster.png', 800, 400),
+        )
+        name = Post.objects.get().image.name
+        with mock.patch.object(default_storage, 'path', side_effect=NotImplementedError):
+            self.assertEqual(self.client.get('/api/announcements/').data['results'][0]['image'], default_storage.url(name))
+            self.assertEqual(self.client.get(f'/api/images/card/webp/{name}').status_code, 404)
+
+    def test_older_pictures_are_resized_on_demand(self):
+        Post.objects.create(
+            title='Announcement', content='Content', created_by=self.user, is_announcement=True,
+            image=make_upload('poster.png', 800, 400),
+        )
+        image_url = self.client.get('/api/announcements/').data['results'][0]['image']
+        self.assertTrue(image_url.startswith('/api/images/card/webp/post_images/'))
+
+        response = self.client.get(image_url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (480, 240))
+        response.close()
+        # Rendered once, then linked from the media folder
+        self.assertEqual(self.open_media(self.client.get('/api/announcements/').data['results'][0]['image']).size, (480, 240))
+
+    def test_only_stored_pictures_and_known_presets_are_served(self):
+        Post.objects.create(
+            title='Announcement', content='Content', created_by=self.user, is_announcement=True,
+            image=SimpleUploadedFile('broken.png', b'not an image', content_type='image/png'),
+        )
+        name = Post.objects.get().image.name
+        self.assertEqual(self.client.get(f'/api/images/card/webp/{name}').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/images/huge/webp/{name}').status_code, 404)
+        self.assertEqual(self.client.get('/api/images/card/webp/post_images/../../blickers/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/api/images/card/webp/post_images/missing.png').status_code, 404)
@@ -0,0 +1,204 @@
+import asyncio
+from collections import Counter, defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .db_routers import chat_database
+from .models import ChatRoom, ChatRoomUnread, Message, MessageRead, Notification, UnreadCounter
+
+Participants = ChatRoom.participants.through
+
+
+def get_unread_counts(user_ids, room_ids=None):
+    """Read the maintained counters of several users in two queries.
+
+    Returns ``{user_id: {'messages': int, 'notifications': int, 'rooms': {room_id: int}}}``.
+    ``rooms`` holds every room with unread messages, or only ``room_ids`` when given.
+    The message total is the sum of the room counters, so chat writes never touch
+    UnreadCounter (which stays in the primary database with the notifications).
+    """
+    counts = {user_id: {'messages': 0, 'notifications': 0, 'rooms': {}} for user_id in user_ids}
+    for user_id, notifications in UnreadCounter.objects.filter(user_id__in=counts).values_list('user_id', 'notifications'):
+        counts[user_id]['notifications'] = notifications
+
+    rooms = ChatRoomUnread.objects.filter(user_id__in=counts)
+    if room_ids is not None:
+        room_ids = {str(room_id) for room_id in room_ids}
+        rooms = rooms.filter(Q(count__gt=0) | Q(room_id__in=room_ids))
+    else:
+        rooms = rooms.filter(count__gt=0)
+    for user_id, room_id, count in rooms.values_list('user_id', 'room_id', 'count'):
+        counts[user_id]['messages'] += count
+        if room_ids is None or str(room_id) in room_ids:
+            counts[user_id]['rooms'][str(room_id)] = count
+    return counts
+
+
+def unread_counts_event(counts):
+    """Channel layer event handled by NotificationConsumer.unread_counts"""
+    return {
+        'type': 'unread_counts',
+        'messages': counts['messages'],
+        'notifications': counts['notifications'],
+        'rooms': counts['rooms'],
+    }
+
+
+async def send_unread_counts(channel_layer, counts_by_user):
+    await asyncio.gather(*(
+        channel_layer.group_send(f'notifications_{user_id}', unread_counts_event(counts))
+        for user_id, counts in counts_by_user.items()
+    ), return_exceptions=True)
+
+
+def push_unread_counts(user_ids, room_ids=None, using=None):
+    """Send the new counters of ``user_ids`` to their sockets once the transaction of ``using`` commits"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def push():
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(send_unread_counts)(channel_layer, get_unread_counts(user_ids, room_ids))
+
+    transaction.on_commit(push, using=using)
+
+
+def record_new_messages(messages):
+    """Count freshly stored messages as unread for every other participant of their room"""
+    # Room ids may be UUIDs or the strings of the websocket URL
+    senders_by_room = defaultdict(Counter)
+    for message in messages:
+        senders_by_room[str(message.room_id)][message.sender_id] += 1
+    if not senders_by_room:
+        return
+
+    participants = defaultdict(list)
+    for room_id, user_id in Participants.objects.filter(chatroom_id__in=senders_by_room).values_list('chatroom_id', 'user_id'):
+        participants[str(room_id)].append(user_id)
+
+    totals = Counter()
+    with transaction.atomic(using=chat_database()):
+        for room_id, senders in senders_by_room.items():
+            sent = sum(senders.values())
+            # Nobody has unread copies of their own messages
+            deltas = {user_id: sent - senders[user_id] for user_id in participants[room_id]}
+            ChatRoomUnread.add(room_id, deltas)
+            totals.update(deltas)
+    push_unread_counts([user_id for user_id, delta in totals.items() if delta], list(senders_by_room), using=chat_database())
+
+
+def record_messages_read(room_id, user_id, count):
+    """``user_id`` just read ``count`` messages of the room"""
+    if count <= 0:
+        return
+    ChatRoomUnread.add(room_id, {user_id: -count})
+    push_unread_counts([user_id], [room_id], using=chat_database())
+
+
+def forget_deleted_message(message):
+    """Stop counting a message that is about to be deleted as unread"""
+    unread_users = (
+        Participants.objects.filter(chatroom_id=message.room_id)
+        .exclude(user_id=message.sender_id)
+        .exclude(user_id__in=MessageRead.objects.filter(message_id=message.pk).values('user_id'))
+        .values('user_id')
+    )
+    # Only users whose room counter still holds the message, so deleting a whole
+    # room (which also drops its counters) never lowers a total twice
+    unread_users = list(
+        ChatRoomUnread.objects.filter(room_id=message.room_id, user_id__in=unread_users, count__gt=0)
+        .values_list('user_id', flat=True)
+    )
+    if unread_users:
+        ChatRoomUnread.add(message.room_id, dict.fromkeys(unread_users, -1))
+        push_unread_counts(unread_users, [message.room_id], using=chat_database())
+
+
+def unread_in_room():
+    """Subquery counting the messages of a participant row's room its user has not sent nor read"""
+    return (
+        Message.objects.filter(room_id=OuterRef('chatroom_id'))
+        .exclude(sender_id=OuterRef('user_id'))
+        .filter(~Exists(MessageRead.objects.filter(message_id=OuterRef('pk'), user_id=OuterRef(OuterRef('user_id')))))
+        .order_by()
+        .values('room_id')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+
+
+def record_participants_added(room_id, user_ids):
+    """New participants start with the room history they have not read"""
+    # Called on post_add: the participant rows exist, so one query counts for every new participant
+    deltas = dict(
+        Participants.objects.filter(chatroom_id=room_id, user_id__in=user_ids)
+        .annotate(n=Coalesce(Subquery(unread_in_room()), 0))
+        .values_list('user_id', 'n')
+    )
+    with transaction.atomic(using=chat_database()):
+        ChatRoomUnread.add(room_id, deltas)
+    push_unread_counts([user_id for user_id, delta in deltas.items() if delta], [room_id], using=chat_database())
+
+
+def record_participants_removed(room_ids, user_ids):
+    """Drop the room counters of participants who left, and with them their share of the totals"""
+    rows = ChatRoomUnread.objects.filter(room_id__in=room_ids, user_id__in=user_ids)
+    changed = list(rows.filter(count__gt=0).values_list('user_id', flat=True).distinct())
+    rows.delete()
+    push_unread_counts(changed, using=chat_database())
+
+
+def record_new_notifications(user_ids):
+    """One new unread notification for each user in ``user_ids``"""
+    deltas = Counter(user_ids)
+    UnreadCounter.add('notifications', deltas)
+    push_unread_counts(deltas)
+
+
+def forget_deleted_notification(notification):
+    if not notification.is_read:
+        UnreadCounter.add('notifications', {notification.user_id: -1})
+        push_unread_counts([notification.user_id])
+
+
+def mark_notifications_read(notifications):
+    """Mark a notification queryset as read and lower the counters by what actually changed"""
+    unread = notifications.filter(is_read=False)
+    with transaction.atomic():
+        per_user = dict(unread.order_by().values('user_id').annotate(n=Count('id')).values_list('user_id', 'n'))
+        updated = unread.update(is_read=True)
+        if per_user:
+            UnreadCounter.add('notifications', {user_id: -count for user_id, count in per_user.items()})
+    push_unread_counts(per_user)
+    return updated
+
+
+def rebuild_unread_counters(batch_size=1000):
+    """Recompute every counter from the messages, read receipts and notifications; returns the number of users"""
+    room_counts = Participants.objects.annotate(n=Coalesce(Subquery(unread_in_room()), 0)).filter(n__gt=0)
+
+    rooms = [
+        ChatRoomUnread(room_id=room_id, user_id=user_id, count=count)
+        for room_id, user_id, count in room_counts.values_list('chatroom_id', 'user_id', 'n')
+    ]
+    notifications = dict(
+        Notification.objects.filter(is_read=False).order_by().values('user_id').annotate(n=Count('id')).values_list('user_id', 'n')
+    )
+
+    # One database at a time: the room counters live with the chat
+    with transaction.atomic(using=chat_database()):
+        ChatRoomUnread.objects.all().delete()
+        ChatRoomUnread.objects.bulk_create(rooms, batch_size=batch_size)
+    with transaction.atomic():
+        UnreadCounter.objects.all().delete()
+        UnreadCounter.objects.bulk_create(
+            [UnreadCounter(user_id=user_id, notifications=count) for user_id, count in notifications.items()],
+            batch_size=batch_size
+        )
+    return len({room.user_id for room in rooms} | set(notifications))
@@ -1,6 +1,7 @@
 from django.urls import path
 from . import views
 from . import announcement_views
+from . import chat_views
 
 urlpatterns = [
     path('api/events/', views.EventListView.as_view(), name='event-list'),
@@ -25,6 +26,8 @@ urlpatterns = [
     path('api/forum/categories/<int:category_id>/update/', views.ForumCategoryUpdateView.as_view(), name='forum-category-update'),
     path('api/forum/categories/<int:category_id>/delete/', views.ForumCategoryDeleteView.as_view(), name='forum-category-delete'),
     path('api/forum/stats/', views.ForumStatsView.as_view(), name='forum-stats'),
+    path('api/forum/search/', views.ForumSearchView.as_view(), name='forum-search'),
+    path('api/search/', views.GlobalSearchView.as_view(), name='global-search'),
     path('api/forum/topics/<int:topic_id>/', views.ForumTopicDetailView.as_view(), name='forum-topic-detail'),
     path('api/auth/login/', views.LoginView.as_view(), name='login'),
     path('api/auth/signup/', views.SignupView.as_view(), name='signup'),
@@ -37,9 +40,13 @@ urlpatterns = [
     path('api/dashboard/activity-overview/', views.ActivityOverviewView.as_view(), name='activity-overview'),
     path('api/notifications/', views.NotificationListView.as_view(), name='notification-list'),
     path('api/notifications/mark-read/', views.MarkNotificationsReadView.as_view(), name='mark-notifications-read'),
+    path('api/unread-counts/', views.UnreadCountsView.as_view(), name='unread-counts'),
+    path('api/chat/rooms/', chat_views.ChatInboxView.as_view(), name='chat-inbox'),
+    path('api/chat/rooms/<uuid:room_id>/messages/', chat_views.ChatMessageHistoryView.as_view(), name='chat-message-history'),
     path('api/users/profile/', views.UserProfileView.as_view(), name='user-profile'),
     path('api/users/profile/update/', views.UserProfileUpdateView.as_view(), name='user-profile-update'),
     path('api/users/profile/update-picture/', views.UserProfilePictureUpdateView.as_view(), name='user-profile-picture-update'),
+    path('api/images/<str:preset>/<str:image_format>/<path:name>', views.ImageDerivativeView.as_view(), name='image-derivative'),
     path('api/users/two-factor/', views.TwoFactorAuthView.as_view(), name='two-factor-auth'),
     path('api/users/', views.UserListView.as_view(), name='user-list'),
     path('api/users/create/', views.CreateUserView.as_view(), name='create-user'),
@@ -0,0 +1,124 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+
+class ViewCounterBuffer:
+    """Accumulate page views in memory and write them as batched F() increments.
+
+    Detail views call ``add`` instead of saving the row, so a read no longer
+    opens a write transaction. Pending views are flushed when the buffer holds
+    ``VIEW_COUNT_FLUSH_THRESHOLD`` views, when ``VIEW_COUNT_FLUSH_INTERVAL``
+    seconds have passed since the first pending view, or at interpreter exit.
+
+    The buffer belongs to the process that served the views: every worker
+    flushes its own, and no other process (e.g. a management command) can.
+    """
+
+    def __init__(self, field='views_count'):
+        self.field = field
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)  # (model label, pk) -> views not yet written
+        self._pending_total = 0
+        self._first_pending_at = None
+        self._timer = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+    @property
+    def flush_threshold(self):
+        return getattr(settings, 'VIEW_COUNT_FLUSH_THRESHOLD', 100)
+
+    def add(self, model, pk, count=1):
+        """Record ``count`` views for an object and return its pending views"""
+        key = (model._meta.label, pk)
+        with self._lock:
+            self._pending[key] += count
+            self._pending_total += count
+            pending = self._pending[key]
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+                self._schedule_flush()
+            should_flush = self._pending_total >= self.flush_threshold or (
+                self.flush_interval is not None
+                and time.monotonic() - self._first_pending_at >= self.flush_interval
+            )
+
+        if should_flush:
+            self.flush()
+        return pending
+
+    def pending(self, model, pk):
+        """Return the views recorded for an object that are not written yet"""
+        with self._lock:
+            return self._pending.get((model._meta.label, pk), 0)
+
+    def flush(self):
+        """Write every pending view to the database, returning the number of views written"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._pending_total = 0
+            self._first_pending_at = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return 0
+
+        # Objects with the same model and increment share one UPDATE
+        batches = defaultdict(list)
+        for (label, pk), count in pending.items():
+            batches[(label, count)].append(pk)
+
+        try:
+            with transaction.atomic():
+                for (label, count), pks in batches.items():
+                    model = apps.get_model(label)
+                    model.objects.filter(pk__in=pks).update(**{self.field: F(self.field) + count})
+        except Exception:
+            # Put the views back so they are retried on the next flush
+            with self._lock:
+                for key, count in pending.items():
+                    self._pending[key] += count
+                    self._pending_total += count
+                if self._first_pending_at is None:
+                    self._first_pending_at = time.monotonic()
+                    self._schedule_flush()
+            raise
+        return sum(pending.values())
+
+    def _schedule_flush(self):
+        if not self.flush_interval:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+        finally:
+            # The timer thread owns its own connections; don't leak them
+            connections.close_all()
+
+
+view_counter = ViewCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        pass
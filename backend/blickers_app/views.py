@@ -2,10 +2,16 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Event, EventRegistration, ForumTopic, ForumCategory, Report, Message, Post, PostComment, Reaction, ForumReply, Notification, TwoFactorAuth, RecoveryCode, EventType
+from .models import Event, EventRegistration, ForumTopic, ForumCategory, Report, Message, Post, PostComment, Reaction, ForumReply, Notification, TwoFactorAuth, RecoveryCode, EventType, DashboardSnapshot
 from .serializers import EventSerializer, ForumTopicListSerializer, PostSerializer
+from .view_counter import view_counter
+from .exports import EXPORT_FORMATS, streaming_export_response
+from .images import AVATAR_PRESETS, FORMATS, PICTURE_PRESETS, PRESETS, delete_derivatives, derivative_url, derivative_urls, generate_derivatives, is_resizable, render_derivative
+from .search import GLOBAL_SEARCH_KINDS, search_forum, search_global
+from .unread import get_unread_counts, mark_notifications_read
 from django.utils import timezone
 from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth.signals import user_logged_in
 from django.db import transaction
 from .models import User
 from .serializers import UserRegistrationSerializer, UserSerializer
@@ -19,7 +25,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 import os
 from django.db import models
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.core.paginator import Paginator
 from datetime import timedelta, datetime
 from django.contrib.auth.password_validation import validate_password
@@ -31,12 +38,15 @@ import base64
 import random
 import string
 from django.db.models import Q
+from django.http import FileResponse
+from django.utils.cache import patch_cache_control
 
 User = get_user_model()
 
 class EventListView(APIView):
     """API endpoint to retrieve all events"""
     # Removing permission_classes to allow public access
+    use_read_replica = True
     
     def get(self, request):
         try:
@@ -72,11 +82,11 @@ class EventListView(APIView):
             elif sort_by == '-start_date':
                 events = events.order_by('-start_date')
             
-            # Prefetch related data to avoid N+1 queries
-            events = events.select_related('event_type').prefetch_related('registrations')
+            # Annotate registration counts so the listing is a single query
+            events = events.select_related('event_type').with_registration_counts()
             
-            # Pass request context to serializer for proper image URL generation
-            serializer = EventSerializer(events, many=True, context={'request': request})
+            # Pass request context to serializer for proper image URL generation, with card-sized images
+            serializer = EventSerializer(events, many=True, context={'request': request, 'image_preset': 'card'})
             return Response(serializer.data)
         except Exception as e:
             return Response(
@@ -130,6 +140,7 @@ class EventInterestView(APIView):
 class ForumTopicListView(APIView):
     """API endpoint to retrieve forum topics with filtering and pagination"""
     permission_classes = [AllowAny]
+    use_read_replica = True
     
     def get(self, request):
         try:
@@ -140,13 +151,13 @@ class ForumTopicListView(APIView):
                 # Get the most recent and active topics for preview
                 topics = ForumTopic.objects.filter(
                     is_closed=False
-                ).order_by('-is_pinned', '-updated_at')[:3]  # Limit to 3 topics for the preview
+                ).select_related('category', 'created_by').order_by('-is_pinned', '-updated_at')[:3]  # Limit to 3 topics for the preview
                 
                 serializer = ForumTopicListSerializer(topics, many=True)
                 return Response(serializer.data)
             else:
                 # Full listing with filtering and pagination
-                topics = ForumTopic.objects.all()
+                topics = ForumTopic.objects.select_related('category', 'created_by')
                 
                 # Filter by category
                 category_id = request.query_params.get('category_id')
@@ -180,9 +191,13 @@ class ForumTopicListView(APIView):
                 elif sort_by == '-views':
                     topics = topics.order_by('-views_count')
                 elif sort_by == 'replies':
-                    topics = topics.annotate(replies_count=Count('replies')).order_by('replies_count')
+                    topics = topics.order_by('reply_count', '-id')
                 elif sort_by == '-replies':
-                    topics = topics.annotate(replies_count=Count('replies')).order_by('-replies_count')
+                    topics = topics.order_by('-reply_count', '-id')
+                elif sort_by == 'activity':
+                    topics = topics.order_by('last_activity_at', 'id')
+                elif sort_by == '-activity':
+                    topics = topics.order_by('-last_activity_at', '-id')
                 else:
                     topics = topics.order_by('-is_pinned', '-created_at')
                 
@@ -206,19 +221,84 @@ class ForumTopicListView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class ForumSearchView(APIView):
+    """API endpoint to search forum topics and replies, ranked by relevance"""
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(50, max(1, int(request.query_params.get('page_size', 20))))
+        except ValueError:
+            return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not query:
+            return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            total, hits = search_forum(query, limit=page_size, offset=(page - 1) * page_size)
+            
+            # Load the matched topics and replies with their authors in two queries
+            topics = ForumTopic.objects.select_related('category', 'created_by').in_bulk(
+                {hit['topic_id'] for hit in hits}
+            )
+            replies = ForumReply.objects.select_related('created_by').in_bulk(
+                [hit['object_id'] for hit in hits if hit['kind'] == 'reply']
+            )
+            
+            results = []
+            for hit in hits:
+                topic = topics.get(hit['topic_id'])
+                item = topic if hit['kind'] == 'topic' else replies.get(hit['object_id'])
+                if topic is None or item is None:
+                    continue  # Deleted since the search ran
+                results.append({
+                    'type': hit['kind'],
+                    'id': item.id,
+                    'topic': {
+                        'id': topic.id,
+                        'title': topic.title,
+                        'category': topic.category.name
+                    },
+                    'title_highlight': hit['title'],
+                    'snippet': hit['snippet'],
+                    'score': hit['score'],
+                    'author': {
+                        'id': item.created_by.id,
+                        'name': item.created_by.get_full_name() or item.created_by.username,
+                        'avatar': item.created_by.profile_picture.url if item.created_by.profile_picture else None
+                    },
+                    'created_at': item.created_at
+                })
+            
+            total_pages = (total + page_size - 1) // page_size
+            return Response({
+                'results': results,
+                'total_count': total,
+                'total_pages': total_pages,
+                'current_page': page,
+                'has_next': page < total_pages,
+                'has_previous': page > 1
+            })
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class ForumCategoryListView(APIView):
     """API endpoint to retrieve all forum categories"""
     permission_classes = [AllowAny]
+    use_read_replica = True
     
     def get(self, request):
-        categories = ForumCategory.objects.all().order_by('order')
+        # Topic and post totals come from a single grouped query
+        categories = ForumCategory.objects.with_counts().order_by('order')
         return Response([{
             'id': category.id,
             'name': category.name,
             'description': category.description,
             'icon': category.icon,
-            'topics': category.topics.count(),
-            'posts': sum(topic.replies.count() + 1 for topic in category.topics.all())  # +1 for the topic itself
+            'topics': category.topics_total,
+            'posts': category.posts_total  # topics + replies
         } for category in categories])
 
 class ForumTopicDetailView(APIView):
@@ -228,9 +308,8 @@ class ForumTopicDetailView(APIView):
     def get(self, request, topic_id):
         try:
             topic = ForumTopic.objects.get(id=topic_id)
-            # Increment view count
-            topic.views_count += 1
-            topic.save()
+            # Increment view count through the buffered counter (no write on the read path)
+            topic.views_count += view_counter.add(ForumTopic, topic.id)
             
             # Get topic details
             topic_data = {
@@ -473,6 +552,9 @@ class LoginView(APIView):
                 'error': 'Invalid email or password'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
+        # Record the login (updates last_login and the dashboard activity counters)
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+        
         # Generate JWT tokens
         refresh = RefreshToken.for_user(user)
         
@@ -506,54 +588,45 @@ class LogoutView(APIView):
 class DashboardStatsView(APIView):
     """API endpoint to retrieve dashboard statistics"""
     permission_classes = [IsAuthenticated]
+    use_read_replica = True
     
     def get(self, request):
-        # Get total users count
-        total_users = User.objects.count()
-        
-        # Get upcoming events count
-        upcoming_events = Event.objects.filter(
-            is_published=True,
-            end_date__gte=timezone.now()
-        ).count()
+        now = timezone.now()
+        last_month = now - timedelta(days=30)
         
-        # Get pending reports count
-        pending_reports = Report.objects.filter(
-            status='PENDING'
-        ).count()
+        # User and message totals come from the daily activity snapshot, so the
+        # "last month" figures stop at the start of that day
+        activity = DashboardSnapshot.objects.aggregate(
+            total_users=Coalesce(Sum('new_users'), 0),
+            last_month_users=Coalesce(Sum('new_users', filter=Q(date__lt=last_month.date())), 0),
+            last_month_messages=Coalesce(Sum('messages', filter=Q(date__lt=last_month.date())), 0),
+        )
+        # The last 24 hours do not fit in daily rows: count them (an index range)
+        new_messages = Message.objects.filter(timestamp__gte=now - timedelta(days=1)).count()
+        events = Event.objects.aggregate(
+            upcoming=Count('id', filter=Q(is_published=True, end_date__gte=now)),
+            last_month=Count('id', filter=Q(is_published=True, created_at__lt=last_month)),
+        )
+        reports = Report.objects.aggregate(
+            pending=Count('id', filter=Q(status='PENDING')),
+            last_month=Count('id', filter=Q(status='PENDING', created_at__lt=last_month)),
+        )
         
-        # Get new messages count (messages from last 24 hours)
-        new_messages = Message.objects.filter(
-            timestamp__gte=timezone.now() - timedelta(days=1)
-        ).count()
+        total_users = activity['total_users']
+        upcoming_events = events['upcoming']
+        pending_reports = reports['pending']
         
         # Calculate changes from last month
-        last_month = timezone.now() - timedelta(days=30)
-        
-        # Users change
-        last_month_users = User.objects.filter(
-            date_joined__lt=last_month
-        ).count()
+        last_month_users = activity['last_month_users']
         users_change = f"+{((total_users - last_month_users) / last_month_users * 100):.0f}%" if last_month_users > 0 else "+0%"
         
-        # Events change
-        last_month_events = Event.objects.filter(
-            created_at__lt=last_month,
-            is_published=True
-        ).count()
+        last_month_events = events['last_month']
         events_change = f"+{upcoming_events - last_month_events}" if upcoming_events > last_month_events else f"{upcoming_events - last_month_events}"
         
-        # Reports change
-        last_month_reports = Report.objects.filter(
-            created_at__lt=last_month,
-            status='PENDING'
-        ).count()
+        last_month_reports = reports['last_month']
         reports_change = f"{pending_reports - last_month_reports}"
         
-        # Messages change
-        last_month_messages = Message.objects.filter(
-            timestamp__lt=last_month
-        ).count()
+        last_month_messages = activity['last_month_messages']
         messages_change = f"+{new_messages - last_month_messages}" if new_messages > last_month_messages else f"{new_messages - last_month_messages}"
         
         return Response({
@@ -730,35 +803,39 @@ class PendingModerationView(APIView):
 class ActivityOverviewView(APIView):
     """API endpoint to retrieve activity overview data"""
     permission_classes = [IsAuthenticated]
+    use_read_replica = True
     
     def get(self, request):
         # Get user activity for the past week
         today = timezone.now().date()
         week_ago = today - timedelta(days=6)
         
-        # Daily user activity (logins, posts, comments, etc.)
+        # Daily user activity (logins, posts, comments, etc.) from the activity snapshot
+        snapshots = {
+            snapshot.date: snapshot
+            for snapshot in DashboardSnapshot.objects.filter(date__range=(week_ago, today))
+        }
         daily_activity = []
         for i in range(7):
-            date = week_ago + timedelta(days=i)
-            next_date = date + timedelta(days=1)
-            
-            # Count activities for this day
-            activity_count = (
-                User.objects.filter(last_login__date=date).count() +
-                Post.objects.filter(created_at__date=date).count() +
-                PostComment.objects.filter(created_at__date=date).count() +
-                ForumTopic.objects.filter(created_at__date=date).count() +
-                ForumReply.objects.filter(created_at__date=date).count()
-            )
-            
-            daily_activity.append(activity_count)
+            snapshot = snapshots.get(week_ago + timedelta(days=i))
+            daily_activity.append(snapshot.activity if snapshot else 0)
         
         # Content engagement stats
+        last_month = today - timedelta(days=30)
+        two_months_ago = last_month - timedelta(days=30)
+        content = F('posts') + F('comments') + F('reactions')
+        totals = DashboardSnapshot.objects.aggregate(
+            total_comments=Coalesce(Sum('comments'), 0),
+            total_posts=Coalesce(Sum('posts'), 0),
+            total_reactions=Coalesce(Sum('reactions'), 0),
+            current_month=Coalesce(Sum(content, filter=Q(date__gte=last_month)), 0),
+            previous_month=Coalesce(Sum(content, filter=Q(date__gte=two_months_ago, date__lt=last_month)), 0),
+        )
         content_engagement = {
-            'comments': PostComment.objects.count(),
-            'posts': Post.objects.count(),
-            'reactions': Reaction.objects.count(),
-            'growth': self._calculate_growth()
+            'comments': totals['total_comments'],
+            'posts': totals['total_posts'],
+            'reactions': totals['total_reactions'],
+            'growth': self._calculate_growth(totals['current_month'], totals['previous_month'])
         }
         
         # Event participation stats
@@ -766,13 +843,12 @@ class ActivityOverviewView(APIView):
         events = Event.objects.filter(
             is_published=True,
             end_date__gte=timezone.now()
+        ).annotate(
+            participants=Count('registrations', filter=Q(registrations__status__in=['REGISTERED', 'INTERESTED']))
         ).order_by('start_date')[:4]  # Get 4 upcoming events
         
         for event in events:
-            registrations = EventRegistration.objects.filter(
-                event=event,
-                status__in=['REGISTERED', 'INTERESTED']
-            ).count()
+            registrations = event.participants
             
             event_participation.append({
                 'name': event.title,
@@ -787,25 +863,8 @@ class ActivityOverviewView(APIView):
             'event_participation': event_participation
         })
     
-    def _calculate_growth(self):
+    def _calculate_growth(self, current_month, previous_month):
         """Calculate content growth percentage from last month"""
-        last_month = timezone.now() - timedelta(days=30)
-        
-        # Get current month stats
-        current_month = (
-            Post.objects.filter(created_at__gte=last_month).count() +
-            PostComment.objects.filter(created_at__gte=last_month).count() +
-            Reaction.objects.filter(created_at__gte=last_month).count()
-        )
-        
-        # Get previous month stats
-        two_months_ago = last_month - timedelta(days=30)
-        previous_month = (
-            Post.objects.filter(created_at__gte=two_months_ago, created_at__lt=last_month).count() +
-            PostComment.objects.filter(created_at__gte=two_months_ago, created_at__lt=last_month).count() +
-            Reaction.objects.filter(created_at__gte=two_months_ago, created_at__lt=last_month).count()
-        )
-        
         if previous_month == 0:
             return 0
         
@@ -894,18 +953,16 @@ class MarkNotificationsReadView(APIView):
         try:
             notification_ids = request.data.get('notification_ids', [])
             
+            # The unread counter drops by the number of rows that actually changed
             if not notification_ids:
                 # Mark all notifications as read
-                Notification.objects.filter(
-                    user=request.user,
-                    is_read=False
-                ).update(is_read=True)
+                mark_notifications_read(Notification.objects.filter(user=request.user))
             else:
                 # Mark specific notifications as read
-                Notification.objects.filter(
+                mark_notifications_read(Notification.objects.filter(
                     user=request.user,
                     id__in=notification_ids
-                ).update(is_read=True)
+                ))
             
             return Response({'message': 'Notifications marked as read'})
         except Exception as e:
@@ -915,6 +972,14 @@ class MarkNotificationsReadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class UnreadCountsView(APIView):
+    """API endpoint to retrieve the unread badges (messages, notifications and per chat room)"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        # Maintained counters: two indexed lookups instead of COUNT queries
+        return Response(get_unread_counts([request.user.id])[request.user.id])
+
 class UserProfileView(APIView):
     """API endpoint to retrieve user profile data"""
     permission_classes = [IsAuthenticated]
@@ -1024,6 +1089,7 @@ class UserProfilePictureUpdateView(APIView):
             # Delete old profile picture if it exists
             if user.profile_picture:
                 try:
+                    delete_derivatives(user.profile_picture)
                     user.profile_picture.delete()
                 except:
                     pass
@@ -1032,6 +1098,9 @@ class UserProfilePictureUpdateView(APIView):
             user.profile_picture = profile_picture
             user.save()
             
+            # Resized copies for the avatars shown in lists
+            generate_derivatives(user.profile_picture, AVATAR_PRESETS)
+            
             # Return the full URL of the profile picture
             profile_picture_url = request.build_absolute_uri(user.profile_picture.url)
             
@@ -1283,6 +1352,25 @@ class TwoFactorAuthView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class ImageDerivativeView(APIView):
+    """API endpoint serving a resized copy of an uploaded picture
+
+    Rendered on the first request and kept on disk; list endpoints link to the
+    file under MEDIA_URL directly once it exists.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []  # Same audience as MEDIA_URL
+    
+    def get(self, request, preset, image_format, name):
+        if preset not in PRESETS or image_format not in FORMATS or not is_resizable(name):
+            return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+        path = render_derivative(name, preset, image_format)
+        if path is None:
+            return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+        response = FileResponse(open(path, 'rb'), content_type=f'image/{image_format}')
+        patch_cache_control(response, public=True, max_age=86400)
+        return response
+
 class UserListView(APIView):
     """API endpoint to retrieve all users"""
     permission_classes = [IsAuthenticated]
@@ -1343,10 +1431,8 @@ class UserListView(APIView):
                         minutes = diff.seconds // 60
                         last_active = f"{minutes} {'minute' if minutes == 1 else 'minutes'} ago"
                 
-                # Get profile picture URL
-                avatar_url = None
-                if user.profile_picture:
-                    avatar_url = request.build_absolute_uri(user.profile_picture.url)
+                # Get profile picture URL (a small copy, not the original upload)
+                avatar_url = derivative_url(user.profile_picture, 'avatar64', request=request)
                 
                 formatted_user = {
                     'id': str(user.id),
@@ -1356,7 +1442,8 @@ class UserListView(APIView):
                     'status': 'Active' if user.is_active else 'Inactive',
                     'lastActive': last_active,
                     'joinDate': user.date_joined.strftime("%b %d, %Y"),
-                    'avatar': avatar_url or "/placeholder.svg?height=40&width=40"
+                    'avatar': avatar_url or "/placeholder.svg?height=40&width=40",
+                    'avatar_variants': derivative_urls(user.profile_picture, AVATAR_PRESETS, request)
                 }
                 formatted_users.append(formatted_user)
             
@@ -1472,32 +1559,35 @@ class DeleteUserView(APIView):
             )
 
 class ExportUsersView(APIView):
-    """API endpoint to export users data"""
+    """API endpoint to export users data
+
+    Pass ``export_format=csv`` or ``export_format=ndjson`` to stream the export
+    instead of returning a JSON list.
+    """
     permission_classes = [IsAuthenticated]
     
+    FIELDNAMES = ['ID', 'Name', 'Email', 'Role', 'Join Date', 'Year of Study', 'Major', 'Phone', 'Location']
+    
     def get(self, request):
         try:
+            export_format = request.query_params.get('export_format')
+            if export_format and export_format not in EXPORT_FORMATS:
+                return Response(
+                    {'error': f"Unsupported export format '{export_format}'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             # Get all users
-            users = User.objects.all().order_by('-date_joined')
+            users = User.objects.only(
+                'id', 'username', 'first_name', 'last_name', 'email', 'role', 'date_joined',
+                'year_of_study', 'major', 'phone', 'location'
+            ).order_by('-date_joined')
+            
+            if export_format:
+                return streaming_export_response(request, users, self._format_user, self.FIELDNAMES, export_format, 'users')
             
             # Format users data for export
-            export_data = []
-            for user in users:
-                # Get the full name or username
-                name = f"{user.first_name} {user.last_name}".strip() or user.username
-                
-                user_data = {
-                    'ID': str(user.id),
-                    'Name': name,
-                    'Email': user.email,
-                    'Role': user.get_role_display(),
-                    'Join Date': user.date_joined.strftime("%b %d, %Y"),
-                    'Year of Study': user.year_of_study or 'N/A',
-                    'Major': user.major or 'N/A',
-                    'Phone': user.phone or 'N/A',
-                    'Location': user.location or 'N/A'
-                }
-                export_data.append(user_data)
+            export_data = [self._format_user(user) for user in users]
             
             return Response(export_data)
             
@@ -1506,6 +1596,22 @@ class ExportUsersView(APIView):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    def _format_user(self, user):
+        # Get the full name or username
+        name = f"{user.first_name} {user.last_name}".strip() or user.username
+        
+        return {
+            'ID': str(user.id),
+            'Name': name,
+            'Email': user.email,
+            'Role': user.get_role_display(),
+            'Join Date': user.date_joined.strftime("%b %d, %Y"),
+            'Year of Study': user.year_of_study or 'N/A',
+            'Major': user.major or 'N/A',
+            'Phone': user.phone or 'N/A',
+            'Location': user.location or 'N/A'
+        }
 
 class EventRegistrationView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1645,6 +1751,7 @@ class CreateEventView(APIView):
             
             # Create the event
             event = Event.objects.create(**event_data)
+            generate_derivatives(event.image, PICTURE_PRESETS)
             
             # Serialize and return the created event with request context
             serializer = EventSerializer(event, context={'request': request})
@@ -1804,6 +1911,8 @@ class UpdateEventView(APIView):
             
             # Save the updated event
             event.save()
+            if 'image' in request.FILES:
+                generate_derivatives(event.image, PICTURE_PRESETS)
             
             # Serialize and return the updated event with request context
             serializer = EventSerializer(event, context={'request': request})
@@ -1816,59 +1925,49 @@ class UpdateEventView(APIView):
             )
 
 class ExportEventsView(APIView):
-    """API endpoint to export events data"""
+    """API endpoint to export events data
+
+    Pass ``export_format=csv`` or ``export_format=ndjson`` to stream the export
+    instead of returning a JSON list.
+    """
     permission_classes = [IsAuthenticated]
     
+    FIELDNAMES = [
+        'ID', 'Title', 'Type', 'Description', 'Start Date', 'Start Time', 'End Date', 'End Time',
+        'Location', 'Capacity', 'Status', 'Registered', 'Interested', 'Attended', 'Created Date', 'Published'
+    ]
+    
     def get(self, request):
         try:
             # Log request details for debugging
             print(f"Export request from user: {request.user.username}")
             print(f"Request headers: {request.headers}")
             
-            # Get all events with related data
-            events = Event.objects.all().select_related('event_type').prefetch_related('registrations')
-            
-            if not events.exists():
+            export_format = request.query_params.get('export_format')
+            if export_format and export_format not in EXPORT_FORMATS:
                 return Response(
-                    {'message': 'No events found'},
-                    status=status.HTTP_200_OK
+                    {'error': f"Unsupported export format '{export_format}'"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # Get all events with related data and registration counts
+            events = Event.objects.all().select_related('event_type').with_registration_counts().order_by('id')
+            
+            if export_format:
+                return streaming_export_response(request, events, self._format_event, self.FIELDNAMES, export_format, 'events')
+            
             # Format events data for export
             export_data = []
             for event in events:
                 try:
-                    # Get registration statistics
-                    registered_count = event.registrations.filter(status='REGISTERED').count()
-                    interested_count = event.registrations.filter(status='INTERESTED').count()
-                    attended_count = event.registrations.filter(status='ATTENDED').count()
-                    
-                    event_data = {
-                        'ID': str(event.id),
-                        'Title': event.title,
-                        'Type': event.event_type.name if event.event_type else 'N/A',
-                        'Description': event.description,
-                        'Start Date': event.start_date.strftime("%Y-%m-%d"),
-                        'Start Time': event.start_time.strftime("%H:%M") if event.start_time else 'N/A',
-                        'End Date': event.end_date.strftime("%Y-%m-%d"),
-                        'End Time': event.end_time.strftime("%H:%M") if event.end_time else 'N/A',
-                        'Location': event.location,
-                        'Capacity': str(event.capacity) if event.capacity else 'N/A',
-                        'Status': event.status,
-                        'Registered': str(registered_count),
-                        'Interested': str(interested_count),
-                        'Attended': str(attended_count),
-                        'Created Date': event.created_at.strftime("%Y-%m-%d"),
-                        'Published': 'Yes' if event.is_published else 'No'
-                    }
-                    export_data.append(event_data)
+                    export_data.append(self._format_event(event))
                 except Exception as e:
                     print(f"Error processing event {event.id}: {str(e)}")
                     continue
             
             if not export_data:
                 return Response(
-                    {'message': 'No valid event data to export'},
+                    {'message': 'No events found'},
                     status=status.HTTP_200_OK
                 )
             
@@ -1880,6 +1979,26 @@ class ExportEventsView(APIView):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    def _format_event(self, event):
+        return {
+            'ID': str(event.id),
+            'Title': event.title,
+            'Type': event.event_type.name if event.event_type else 'N/A',
+            'Description': event.description,
+            'Start Date': event.start_date.strftime("%Y-%m-%d"),
+            'Start Time': event.start_time.strftime("%H:%M") if event.start_time else 'N/A',
+            'End Date': event.end_date.strftime("%Y-%m-%d"),
+            'End Time': event.end_time.strftime("%H:%M") if event.end_time else 'N/A',
+            'Location': event.location,
+            'Capacity': str(event.capacity) if event.capacity else 'N/A',
+            'Status': event.status,
+            'Registered': str(event.registered_count),
+            'Interested': str(event.interested_count),
+            'Attended': str(event.attended_count),
+            'Created Date': event.created_at.strftime("%Y-%m-%d"),
+            'Published': 'Yes' if event.is_published else 'No'
+        }
 
 class EventParticipantsView(APIView):
     """API endpoint to get event participants"""
@@ -2835,6 +2954,7 @@ class ForumCategoryUpdateView(APIView):
                 category.order = data['order']
             
             category.save()
+            counts = ForumCategory.objects.with_counts().get(pk=category.pk)
             
             return Response({
                 'id': category.id,
@@ -2842,8 +2962,8 @@ class ForumCategoryUpdateView(APIView):
                 'description': category.description,
                 'icon': category.icon,
                 'order': category.order,
-                'topics': category.topics.count(),
-                'posts': sum(topic.replies.count() + 1 for topic in category.topics.all())
+                'topics': counts.topics_total,
+                'posts': counts.posts_total
             })
         except ForumCategory.DoesNotExist:
             return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -2875,6 +2995,7 @@ class ForumCategoryDeleteView(APIView):
 class ForumStatsView(APIView):
     """API endpoint to get forum statistics"""
     permission_classes = [AllowAny]
+    use_read_replica = True
     
     def get(self, request):
         try:
@@ -2887,10 +3008,7 @@ class ForumStatsView(APIView):
             recent_replies = ForumReply.objects.order_by('-created_at')[:5]
             
             # Most active categories
-            active_categories = ForumCategory.objects.annotate(
-                topic_count=Count('topics'),
-                reply_count=Count('topics__replies')
-            ).order_by('-topic_count')[:5]
+            active_categories = ForumCategory.objects.with_counts().order_by('-topics_total')[:5]
             
             # Most viewed topics
             popular_topics = ForumTopic.objects.order_by('-views_count')[:5]
@@ -2918,10 +3036,106 @@ class ForumStatsView(APIView):
                 'active_categories': [{
                     'id': cat.id,
                     'name': cat.name,
-                    'topic_count': cat.topic_count,
-                    'reply_count': cat.reply_count
+                    'topic_count': cat.topics_total,
+                    'reply_count': cat.replies_total
                 } for cat in active_categories],
                 'popular_topics': ForumTopicListSerializer(popular_topics, many=True).data
             })
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class GlobalSearchView(APIView):
+    """API endpoint to search events, announcements, forum topics and users in one request"""
+    permission_classes = [IsAuthenticated]
+    
+    GROUPS = {
+        'event': 'events',
+        'announcement': 'announcements',
+        'topic': 'topics',
+        'user': 'users',
+    }
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        types = request.query_params.get('types')
+        kinds = [kind.strip() for kind in types.split(',')] if types else list(GLOBAL_SEARCH_KINDS)
+        unknown = [kind for kind in kinds if kind not in GLOBAL_SEARCH_KINDS]
+        if unknown:
+            return Response({'error': f"Unknown search types: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(20, max(1, int(request.query_params.get('limit', 5))))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            groups = search_global(query, kinds, limit)
+            
+            # One query per type that has hits
+            loaders = {
+                'event': lambda ids: Event.objects.select_related('event_type').in_bulk(ids),
+                'announcement': lambda ids: Post.objects.select_related('created_by').in_bulk(ids),
+                'topic': lambda ids: ForumTopic.objects.select_related('category').in_bulk(ids),
+                'user': lambda ids: User.objects.in_bulk(ids),
+            }
+            
+            results = {}
+            for kind in kinds:
+                hits = groups[kind]['hits']
+                objects = loaders[kind]([hit['object_id'] for hit in hits]) if hits else {}
+                items = []
+                for hit in hits:
+                    obj = objects.get(hit['object_id'])
+                    if obj is None:
+                        continue  # Deleted since the search ran
+                    item = {
+                        'type': kind,
+                        'id': obj.id,
+                        'title_highlight': hit['title'],
+                        'snippet': hit['snippet'],
+                        'score': hit['score'],
+                    }
+                    item.update(self._format(kind, obj))
+                    items.append(item)
+                results[self.GROUPS[kind]] = {
+                    'total': groups[kind]['total'],
+                    'results': items
+                }
+            
+            return Response({'query': query, 'results': results})
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _format(self, kind, obj):
+        if kind == 'event':
+            return {
+                'title': obj.title,
+                'event_type': obj.event_type.name if obj.event_type else None,
+                'start_date': obj.start_date,
+                'location': obj.location,
+                'image': obj.image.url if obj.image else None
+            }
+        if kind == 'announcement':
+            return {
+                'title': obj.title,
+                'announcement_type': obj.announcement_type,
+                'author': obj.created_by.get_full_name() or obj.created_by.username,
+                'created_at': obj.created_at
+            }
+        if kind == 'topic':
+            return {
+                'title': obj.title,
+                'category': obj.category.name,
+                'replies_count': obj.reply_count,
+                'last_activity': obj.last_activity_at
+            }
+        return {
+            'title': obj.get_full_name() or obj.username,
+            'username': obj.username,
+            'major': obj.major,
+            'role': obj.role,
+            'avatar': obj.profile_picture.url if obj.profile_picture else None
+        }